@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+"""
+Per-execution overhead of Activity in each ActivityMode
+(FULL publishes two envelopes, COMPACT one and AGGREGATE none)
+and the cost of the activity id: uuid4 used previously
+versus the span id of the activity's operation.
+"""
+
+import uuid
+
+import pyperf
+
+from easytelemetry import ActivityMode
+from easytelemetry.appinsights import ConnectionString, MockPublisher, Options, build
+from easytelemetry.context import new_span_id
+
+
+def main():
+    cs = ConnectionString(instrumentation_key="00000000-0000-0000-0000-000000000000")
+    options = Options(connection=cs, queue_maxsize=0)
+    telemetry = build("bench", options=options, publisher=MockPublisher())
+
+    def execute(mode: ActivityMode) -> None:
+        with telemetry.activity("work", mode):
+            pass
+        if telemetry._buffer.queue.qsize() > 10_000:
+            telemetry.flush()
+            telemetry._publisher.clear()
+
+    runner = pyperf.Runner()
+    runner.bench_func("activity id: uuid4", lambda: str(uuid.uuid4()))
+    runner.bench_func("activity id: span id", new_span_id)
+    for mode in ActivityMode:
+        runner.bench_func(f"activity {mode.name.lower()}", execute, mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+"""
+Cost of a logger call for a disabled level compared with an empty
+function call, and of the enabled call (MessageData envelope put into
+the AppInsightsTelemetry buffer).
+"""
+
+import pyperf
+
+from easytelemetry import Level
+from easytelemetry.appinsights import ConnectionString, MockPublisher, Options, build
+
+
+def empty(msg, *args, **kwargs):
+    pass
+
+
+def main():
+    cs = ConnectionString(instrumentation_key="00000000-0000-0000-0000-000000000000")
+    options = Options(connection=cs, queue_maxsize=0)
+    telemetry = build("bench", options=options, publisher=MockPublisher())
+    lgr = telemetry.logger("bench", Level.INFO)
+
+    def enabled() -> None:
+        lgr.info("order %s created", 42, customer="ACME")
+        if telemetry._buffer.queue.qsize() > 10_000:
+            telemetry.flush()
+            telemetry._publisher.clear()
+
+    runner = pyperf.Runner()
+    runner.timeit("empty function", "empty('order %s created', 42, customer='ACME')", globals={"empty": empty})
+    runner.timeit("disabled debug", "lgr.debug('order %s created', 42, customer='ACME')", globals={"lgr": lgr})
+    runner.timeit("is_enabled_for", "lgr.is_enabled_for(DEBUG)", globals={"lgr": lgr, "DEBUG": Level.DEBUG})
+    runner.bench_func("enabled info", enabled)
+
+
+if __name__ == "__main__":
+    main()
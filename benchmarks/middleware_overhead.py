@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""
+Per-request overhead of WsgiMiddleware: the bare application,
+a request not passing sampling and a tracked request
+(RequestData envelope put into the AppInsightsTelemetry buffer).
+"""
+
+from wsgiref.util import setup_testing_defaults
+
+import pyperf
+
+from easytelemetry.appinsights import ConnectionString, MockPublisher, Options, build
+from easytelemetry.middleware import WsgiMiddleware
+
+
+def app(_environ, start_response):
+    start_response("200 OK", [])
+    return [b"ok"]
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def request(wsgi, environ) -> None:
+    result = wsgi(environ, start_response)
+    for _ in result:
+        pass
+    if hasattr(result, "close"):
+        result.close()
+
+
+def main():
+    cs = ConnectionString(instrumentation_key="00000000-0000-0000-0000-000000000000")
+    options = Options(connection=cs, queue_maxsize=0)
+    telemetry = build("bench", options=options, publisher=MockPublisher())
+    environ = {"PATH_INFO": "/items/1"}
+    setup_testing_defaults(environ)
+
+    def flushing_request(wsgi, env):
+        request(wsgi, env)
+        if telemetry._buffer.queue.qsize() > 10_000:
+            telemetry.flush()
+            telemetry._publisher.clear()
+
+    runner = pyperf.Runner()
+    runner.bench_func("bare app", request, app, environ)
+    runner.bench_func("sampled out", request, WsgiMiddleware(app, telemetry, sample_rate=0), environ)
+    runner.bench_func("tracked", flushing_request, WsgiMiddleware(app, telemetry), environ)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+"""
+Per-interval cost of the runtime metrics collector (Options.runtime_metrics),
+which must stay within 100 microseconds, and of a garbage collection
+with and without its GC hooks.
+"""
+
+import gc
+
+import pyperf
+
+from easytelemetry.appinsights.runtime import RuntimeMetrics
+
+
+BUDGET_US = 100
+
+
+def main():
+    runner = pyperf.Runner()
+    runner.bench_func("gc.collect(0) without hooks", gc.collect, 0)
+    collector = RuntimeMetrics({"app": "bench", "env": "prod"})
+    runner.bench_func("gc.collect(0) with hooks", gc.collect, 0)
+    bench = runner.bench_func("collect", collector.collect)
+    if bench is not None and not runner.args.worker and bench.mean() * 1_000_000 > BUDGET_US:
+        raise SystemExit(f"collect takes {bench.mean() * 1_000_000:.1f} us, over the budget of {BUDGET_US} us")
+
+
+if __name__ == "__main__":
+    main()
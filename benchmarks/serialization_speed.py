@@ -1,36 +1,62 @@
 #!/usr/bin/env python
 
+"""
+Serialization of batches with and without compression. The streaming
+encoder (encode_batch) compresses envelope by envelope instead of
+serializing the whole batch and compressing the copy; besides the timings,
+the main process prints throughput and peak memory of both ways.
+"""
+
 import gzip
+import tracemalloc
 
 import pyperf
 from shared import sample_envelope
 
-from easytelemetry.appinsights.protocol import serialize
+from easytelemetry.appinsights.protocol import encode_batch, serialize
 
 
 def compress(payload: bytes) -> bytes:
     return gzip.compress(payload, compresslevel=6)
 
 
+def serialize_gzip(envelopes: list) -> bytes:
+    return compress(serialize(envelopes))
+
+
+def peak_memory(func, *args) -> int:
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
 def main():
-    envelopes = [sample_envelope() for i in range(1, 10)]
     runner = pyperf.Runner()
-
-    runner.timeit(
-        name="serialize",
-        stmt="serialize(envelopes)",
-        globals={"envelopes": envelopes, "serialize": serialize},
-    )
-
-    runner.timeit(
-        name="serialize_gzip",
-        stmt="compress(serialize(envelopes))",
-        globals={
-            "envelopes": envelopes,
-            "serialize": serialize,
-            "compress": compress,
-        },
-    )
+    batches = {
+        "": [sample_envelope() for i in range(1, 10)],
+        "_100": [sample_envelope() for i in range(100)],
+    }
+
+    for suffix, envelopes in batches.items():
+        runner.bench_func(f"serialize{suffix}", serialize, envelopes)
+        gzipped = runner.bench_func(f"serialize_gzip{suffix}", serialize_gzip, envelopes)
+        streaming = runner.bench_func(f"encode_batch{suffix}", encode_batch, envelopes)
+
+        if runner.args.worker or gzipped is None or streaming is None:
+            continue
+        json_mb = len(serialize(envelopes)) / 1_000_000
+        for name, bench, peak in (
+            ("serialize_gzip", gzipped, peak_memory(serialize_gzip, envelopes)),
+            ("encode_batch", streaming, peak_memory(encode_batch, envelopes)),
+        ):
+            mean = bench.mean()
+            print(  # noqa: T201
+                f"{name}{suffix}: {len(envelopes) / mean:,.0f} envelopes/s, "
+                f"{json_mb / mean:,.1f} MB/s of JSON, peak memory {peak:,} B"
+            )
 
 
 if __name__ == "__main__":
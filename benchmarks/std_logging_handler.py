@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""
+Cost of handling a standard logging record by StdLoggingHandler:
+the previous conversion (props parsed from the record, then the full
+AppInsightsLogger path with stack inspection), the direct record to envelope
+conversion, and the caller side of the queued hand-off.
+"""
+
+import logging
+from queue import Queue
+
+import pyperf
+
+from easytelemetry import StdLoggingHandler, _parse_record
+from easytelemetry.appinsights import ConnectionString, MockPublisher, Options, build
+
+
+class PreviousHandler(StdLoggingHandler):
+    def emit(self, record: logging.LogRecord) -> None:
+        (props, _) = _parse_record(record)
+        logger = self._telemetry.logger(record.name)
+        logger.warn(record.msg, **props)
+
+
+def main():
+    cs = ConnectionString(instrumentation_key="00000000-0000-0000-0000-000000000000")
+    options = Options(connection=cs, queue_maxsize=0)
+    telemetry = build("bench", options=options, publisher=MockPublisher())
+    record = logging.LogRecord("bench", logging.WARNING, __file__, 20, "order %s created", ("NY9584",), None, "main")
+    # the previous handler drops record.args, so it gets a message without them
+    plain = logging.LogRecord("bench", logging.WARNING, __file__, 20, "order NY9584 created", (), None, "main")
+
+    def handle(handler: logging.Handler, record: logging.LogRecord) -> None:
+        handler.handle(record)
+        if telemetry._buffer.queue.qsize() > 10_000:
+            telemetry.flush()
+            telemetry._publisher.clear()
+
+    queued = StdLoggingHandler(telemetry)
+    queued.configure_std_logging(queue_maxsize=1_000_000)
+    hand_off = queued._hand_off
+    queued.close()
+    hand_off.queue = Queue()  # nobody consumes it, measure the caller only
+
+    runner = pyperf.Runner()
+    runner.bench_func("previous handler", handle, PreviousHandler(telemetry), plain)
+    runner.bench_func("direct conversion", handle, StdLoggingHandler(telemetry), record)
+    runner.bench_func("queued hand-off (caller)", lambda: hand_off.handle(record))
+
+
+if __name__ == "__main__":
+    main()
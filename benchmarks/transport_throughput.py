@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+Throughput of handing serialized envelopes over from a producer
+to a consumer (publisher) using queue.Queue, Unix domain socket
+(the agent transport) and shared-memory ring buffer.
+Every loop moves MESSAGES envelopes. The consumer runs in a thread
+for queue.Queue (in-process baseline) and in a forked process otherwise.
+"""
+
+import os
+from queue import Queue
+import socket
+import threading
+import time
+
+import pyperf
+from shared import sample_envelope
+
+from easytelemetry.agent import FrameReader, frame
+from easytelemetry.agent.ring import SharedRings
+import easytelemetry.appinsights.protocol as p
+
+
+MESSAGES = 10_000
+
+
+def bench_queue(loops: int, payload: bytes) -> float:
+    total = 0.0
+    for _ in range(loops):
+        q: Queue[bytes | None] = Queue()
+
+        def consume(q: Queue[bytes | None] = q) -> None:
+            while q.get() is not None:
+                pass
+
+        t = threading.Thread(target=consume)
+        start = time.perf_counter()
+        t.start()
+        for _ in range(MESSAGES):
+            q.put(payload)
+        q.put(None)
+        t.join()
+        total += time.perf_counter() - start
+    return total
+
+
+def _in_child(consume) -> tuple[int, int]:
+    """Fork a consumer process; return its pid and the fd signalling it is done."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        try:
+            consume()
+            os.write(wfd, b"1")
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    return pid, rfd
+
+
+def _wait_child(pid: int, rfd: int) -> None:
+    os.read(rfd, 1)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+
+
+def bench_socket(loops: int, payload: bytes) -> float:
+    total = 0.0
+    framed = frame(payload)
+    for _ in range(loops):
+        producer, consumer = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        def consume(consumer: socket.socket = consumer) -> None:
+            reader = FrameReader()
+            received = 0
+            while received < MESSAGES:
+                received += len(reader.feed(consumer.recv(65536)))
+
+        pid, done = _in_child(consume)
+        start = time.perf_counter()
+        for _ in range(MESSAGES):
+            producer.sendall(framed)
+        _wait_child(pid, done)
+        total += time.perf_counter() - start
+        producer.close()
+        consumer.close()
+    return total
+
+
+def bench_ring(loops: int, payload: bytes) -> float:
+    total = 0.0
+    rings = SharedRings.create(producers=1, capacity=1024 * 1024)
+    try:
+        for _ in range(loops):
+
+            def consume() -> None:
+                attached = SharedRings.attach(rings.name)
+                ring = attached.ring(0)
+                received = 0
+                while received < MESSAGES:
+                    n = len(ring.read())
+                    if n == 0:
+                        time.sleep(0)
+                    received += n
+                attached.close()
+
+            pid, done = _in_child(consume)
+            ring = rings.ring(0)
+            start = time.perf_counter()
+            for _ in range(MESSAGES):
+                while not ring.write(payload):
+                    time.sleep(0)  # ring is full; let the consumer catch up
+            _wait_child(pid, done)
+            total += time.perf_counter() - start
+    finally:
+        rings.close()
+    return total
+
+
+def main():
+    payload = p.serialize(sample_envelope())
+    runner = pyperf.Runner()
+    runner.metadata["messages_per_loop"] = str(MESSAGES)
+    runner.metadata["payload_bytes"] = str(len(payload))
+    runner.bench_time_func("queue.Queue", bench_queue, payload)
+    runner.bench_time_func("unix socket", bench_socket, payload)
+    runner.bench_time_func("shared memory ring", bench_ring, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,25 +6,32 @@ for all further concrete implementations.
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from collections.abc import Callable, Iterable
-from enum import IntEnum
+from collections.abc import Callable, Iterable, Mapping
+import contextlib
+from datetime import UTC, datetime, timedelta
+from enum import Enum, IntEnum
 import inspect
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import os
 import platform
+from queue import Full, Queue
 import re
 import socket
 import time
 from types import TracebackType
 from typing import Any, TypeVar
-import uuid
 
+from easytelemetry.context import Operation, current_operation, end_operation, start_operation
 
-PropsT = dict[str, str | int | float | bool]
+
+LazyPropT = Callable[[], Any]
+PropsT = dict[str, "str | int | float | bool | LazyProp"]
 MetricFuncT = Callable[[int | float], None]
 MetricFuncWithPropsT = Callable[[int | float, PropsT], None]
 MetricCtrFuncT = Callable[[], None]
 MetricCtrFuncWithPropsT = Callable[[PropsT], None]
+GaugeCallbackT = Callable[[], int | float | None]
 
 
 class Level(IntEnum):
@@ -73,6 +80,31 @@ class Telemetry(ABC):
     ) -> Logger:
         """Get or create a logger of given name."""
 
+    @property
+    def log_levels(self) -> dict[str, Level]:
+        """Current level overrides (see :meth:`set_log_levels`)."""
+        return dict(getattr(self, "_log_levels", {}))
+
+    def set_log_levels(self, levels: Mapping[str, Level] | None) -> None:
+        """
+        Replace level overrides with glob patterns of logger names mapped
+        to levels, e.g. ``{"db.*": Level.DEBUG}``. The most specific
+        (longest) matching pattern wins, and loggers matching none get back
+        the level they were created with. The change applies to existing
+        loggers, loggers created later and the standard logging handler.
+        By default, the overrides are only recorded and applied to the root
+        logger; implementations apply them to all their loggers.
+        """
+        from easytelemetry.levels import LevelOverrides  # the module imports this one
+
+        overrides = LevelOverrides(levels)
+        root = self.root
+        base: Level | None = getattr(self, "_root_base_level", None)
+        if base is None:
+            base = self._root_base_level = root.level
+        self._log_levels = overrides.as_dict()
+        root.level = overrides.level_for(root.name) or base
+
     @abstractmethod
     def metric(
         self,
@@ -92,10 +124,31 @@ class Telemetry(ABC):
         which also allows for passing extra properties local to the execution.
         """
 
+    def gauge(  # noqa: B027
+        self,
+        name: str,
+        callback: GaugeCallbackT,
+        props: PropsT | None = None,
+    ) -> None:
+        """
+        Register a gauge of given name, whose value is read by calling
+        the callback once per publishing interval (e.g. queue depth or cache
+        size), instead of tracking it from application code. The callback
+        returning None skips the interval. Registering the name again
+        replaces the callback.
+        Ignored unless the implementation supports gauges.
+        """
+
     @abstractmethod
     def describe(self) -> str:
         """Return short description for this telemetry."""
 
+    def track_operation(self, scope: OperationScope) -> None:  # noqa: B027
+        """
+        Publish finished request or dependency call.
+        Ignored unless the implementation supports operations.
+        """
+
     def metric_incr(
         self,
         name: str,
@@ -192,9 +245,73 @@ class Telemetry(ABC):
         metric_fn = self.metric_extra(name, props)
         return ReusableTimer(metric_fn)
 
-    def activity(self, name: str) -> Activity:
+    def metric_aggregate(
+        self,
+        name: str,
+        props: PropsT | None = None,
+    ) -> MetricFuncT:
+        """
+        Get or create a metric track function of given name, whose values
+        are aggregated locally (count, sum, min, max) and published once
+        per publishing interval. Implementations without local aggregation
+        track every value.
+        """
+        return self.metric(name, props)
+
+    def activity(self, name: str, mode: ActivityMode | None = None) -> Activity:
         """Create an activity context manager."""
-        return Activity(self, name)
+        return Activity(self, name, mode or ActivityMode.FULL)
+
+    def request(
+        self,
+        name: str,
+        url: str | None = None,
+        source: str | None = None,
+        props: PropsT | None = None,
+        operation_id: str | None = None,
+        parent_id: str | None = None,
+    ) -> OperationScope:
+        """
+        Create a context manager tracking a request handled by the application.
+        Logs and metrics within the scope are correlated with the request.
+
+        :param name: low cardinality name, e.g. 'GET /items/{id}'
+        :param url: request URL
+        :param source: caller of the request
+        :param props: custom properties of the request
+        :param operation_id: operation identifier received from the caller
+        :param parent_id: caller's dependency call identifier
+        """
+        scope = OperationScope(self, OperationKind.REQUEST, name, props)
+        scope.url = url
+        scope.source = source
+        scope.operation_id = operation_id
+        scope.parent_id = parent_id
+        return scope
+
+    def dependency(
+        self,
+        name: str,
+        type: str | None = None,  # noqa: A002
+        target: str | None = None,
+        data: str | None = None,
+        props: PropsT | None = None,
+    ) -> OperationScope:
+        """
+        Create a context manager tracking a call to a remote component
+        (HTTP service, database, queue, ...) as a child of the current operation.
+
+        :param name: low cardinality name, e.g. 'GET /items/{id}' or stored procedure
+        :param type: dependency type, e.g. 'HTTP' or 'SQL'
+        :param target: target host or server
+        :param data: command, e.g. full URL or SQL statement
+        :param props: custom properties of the dependency call
+        """
+        scope = OperationScope(self, OperationKind.DEPENDENCY, name, props)
+        scope.type = type
+        scope.target = target
+        scope.data = data
+        return scope
 
 
 class Logger(ABC):
@@ -210,6 +327,16 @@ class Logger(ABC):
     def level(self) -> Level:
         """Get current minimal logging level for this logger."""
 
+    @level.setter
+    def level(self, value: Level) -> None:
+        """
+        Change minimal logging level for this logger. By default, the value
+        is stored as ``_level`` and the level methods are rebound; a getter
+        returning ``_level`` keeps this setter when defined with ``@Logger.level.getter``.
+        """
+        self._level = value
+        self._bind_level_methods()
+
     @abstractmethod
     def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
         """Log message with DEBUG logging level."""
@@ -239,32 +366,189 @@ class Logger(ABC):
     ) -> None:
         """Log exception. ERROR is default logging level."""
 
+    def bind(self, **kwargs: Any) -> Logger:
+        """
+        Create a child logger of the same name and level adding given
+        properties to every entry. The properties are merged (and converted)
+        once, so each call only pays for its own keyword arguments.
+        The child follows level changes of its parent.
+        By default, the child merges the properties on every call and
+        delegates to this logger; implementations should override it.
+        """
+        return _BoundLogger(self, kwargs)
+
+    def log_record(self, record: logging.LogRecord) -> None:
+        """
+        Log a record of standard :mod:`logging` (see :class:`StdLoggingHandler`).
+        Implementations should override it and convert the record directly.
+        """
+        if record.levelno < self.level and record.levelno < logging.CRITICAL:
+            return
+        (props, ex) = _parse_record(record)
+        if ex is not None:
+            self.exception(ex, level=std_logging_to_level(record.levelno), **props)
+            return
+        msg = record.getMessage().replace("%", "%%")
+        match record.levelno:
+            case logging.DEBUG:
+                self.debug(msg, **props)
+            case logging.WARNING:
+                self.warn(msg, **props)
+            case logging.ERROR:
+                self.error(msg, **props)
+            case logging.CRITICAL:
+                self.critical(msg, **props)
+            case _:
+                self.info(msg, **props)
+
+    def is_enabled_for(self, level: Level) -> bool:
+        """
+        Tell whether an entry of given level would be logged. Use it to guard
+        expensive construction of the message or its properties.
+        """
+        return level >= self.level or level >= Level.CRITICAL
+
+    def _bind_level_methods(self) -> None:
+        """
+        Rebind level methods below the logger's level to a shared no-op,
+        so a disabled call costs no more than an empty function call.
+        Call it whenever the level changes.
+        """
+        level = self.level
+        for name, method_level in _LEVEL_METHODS:
+            if method_level < level:
+                self.__dict__[name] = _disabled
+            else:
+                self.__dict__.pop(name, None)
+
+
+class _BoundLogger(Logger):
+    """
+    Child logger returned by the default :meth:`Logger.bind`. It adds its
+    properties to every entry and delegates to the parent, so it follows
+    level changes of the parent unless its own level is set (an entry
+    is logged only when enabled by both).
+    """
+
+    def __init__(self, parent: Logger, props: dict[str, Any]):
+        self._parent = parent
+        self._props = props
+        self._own_level: Level | None = None
+
+    @property
+    def name(self) -> str:
+        return self._parent.name
+
+    @property
+    def level(self) -> Level:
+        return self._parent.level if self._own_level is None else self._own_level
+
+    @level.setter
+    def level(self, value: Level) -> None:
+        self._own_level = value
+
+    def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self.is_enabled_for(Level.DEBUG):
+            self._parent.debug(msg, *args, **(self._props | kwargs))
+
+    def info(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self.is_enabled_for(Level.INFO):
+            self._parent.info(msg, *args, **(self._props | kwargs))
+
+    def warn(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self.is_enabled_for(Level.WARN):
+            self._parent.warn(msg, *args, **(self._props | kwargs))
+
+    def error(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self.is_enabled_for(Level.ERROR):
+            self._parent.error(msg, *args, **(self._props | kwargs))
+
+    def critical(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self._parent.critical(msg, *args, **(self._props | kwargs))
+
+    def exception(
+        self,
+        ex: BaseException,
+        level: Level = Level.ERROR,
+        **kwargs: Any,
+    ) -> None:
+        if self.is_enabled_for(level):
+            self._parent.exception(ex, level, **(self._props | kwargs))
+
+    def bind(self, **kwargs: Any) -> Logger:
+        child = _BoundLogger(self._parent, self._props | kwargs)
+        child._own_level = self._own_level
+        return child
+
+
+def _disabled(msg: str, *args: Any, **kwargs: Any) -> None:
+    """Level method of a logger for a disabled level."""
+
+
+_LEVEL_METHODS = (
+    ("debug", Level.DEBUG),
+    ("info", Level.INFO),
+    ("warn", Level.WARN),
+    ("error", Level.ERROR),
+)
+
+
+class ActivityMode(Enum):
+    """What an :class:`Activity` publishes when it stops."""
+
+    # Success or error counter, elapsed time metric and the exception
+    # (when failed); two or three entries per execution.
+    FULL = 0
+
+    # Single request entry (in-process dependency when nested in another
+    # operation) with success, duration and the activity id.
+    COMPACT = 1
+
+    # Elapsed time fed to local aggregates '{name}_ok_ms' and '{name}_err_ms'
+    # (see :meth:`Telemetry.metric_aggregate`); nothing per execution.
+    AGGREGATE = 2
+
 
 class Activity:
     """
     Utility context manager class which simplifies common task
     of measuring a code block execution time and tracking number of failed
     and successful executions.
+    While the activity runs its operation is current, so everything logged
+    within it (even from pool workers, see :mod:`easytelemetry.context`)
+    is correlated with it.
     """
 
-    def __init__(self, telemetry: Telemetry, name: str):
+    def __init__(self, telemetry: Telemetry, name: str, mode: ActivityMode = ActivityMode.FULL):
+        self._telemetry = telemetry
         self._name = name
-        self._activity_id: uuid.UUID | None = None
+        self._mode = mode
+        self._activity_id: str | None = None
         self._start: int = 0
-        self._props: PropsT = {}
+        self._props: PropsT | None = None
+        self._op: Operation | None = None
+        self._token: Any = None
         self._logger = telemetry.logger(name)
-        self._elapsed = telemetry.metric_extra(f"{name}_ms")
-        self._success = telemetry.metric_incr_extra(f"{name}_ok", None)
-        self._error = telemetry.metric_incr_extra(f"{name}_err", None)
+        if mode == ActivityMode.FULL:
+            self._elapsed = telemetry.metric_extra(f"{name}_ms")
+            self._success = telemetry.metric_incr_extra(f"{name}_ok", None)
+            self._error = telemetry.metric_incr_extra(f"{name}_err", None)
+        elif mode == ActivityMode.AGGREGATE:
+            self._ok_ms = telemetry.metric_aggregate(f"{name}_ok_ms")
+            self._err_ms = telemetry.metric_aggregate(f"{name}_err_ms")
 
     @property
-    def activity_id(self) -> uuid.UUID | None:
+    def activity_id(self) -> str | None:
         """
-        Get activity ID. The ID is present after the start method call
-        until the stop method call.
+        Get activity ID, which is the ID of its operation. The ID is present
+        after the start method call until the stop method call.
         """
         return self._activity_id
 
+    @property
+    def mode(self) -> ActivityMode:
+        return self._mode
+
     @property
     def name(self) -> str:
         """Get activity name."""
@@ -277,14 +561,19 @@ class Activity:
 
     def start(self, props: PropsT | None = None) -> None:
         """Start the activity."""
+        if self._token is None:
+            self._op, self._token = start_operation(self._name)
+        self._activity_id = self._op.id if self._op is not None else None
+        if self._mode == ActivityMode.FULL:
+            self._props = {
+                "activity_id": str(self._activity_id),
+                "activity": self._name,
+            }
+            if props is not None:
+                self._props.update(**props)
+        else:
+            self._props = props
         self._start = time.perf_counter_ns()
-        self._activity_id = uuid.uuid4()
-        self._props = {
-            "activity_id": str(self._activity_id),
-            "activity": self.name,
-        }
-        if props is not None:
-            self._props.update(**props)
 
     def stop(self, ex: BaseException | None = None) -> None:
         """
@@ -294,16 +583,46 @@ class Activity:
         if self._start <= 0:
             return
         try:
-            elapsed_ms = (time.perf_counter_ns() - self._start) / 1000000
-            if ex is None:
-                self._success(self._props)
-            else:
-                self._error(self._props)
-                self._logger.exception(ex, **self._props)  # type: ignore[arg-type]
-            self._elapsed(elapsed_ms, self._props)
+            elapsed_ns = time.perf_counter_ns() - self._start
+            if self._mode == ActivityMode.FULL:
+                props = self._props or {}
+                if ex is None:
+                    self._success(props)
+                else:
+                    self._error(props)
+                    self._logger.exception(ex, **props)  # type: ignore[arg-type]
+                self._elapsed(elapsed_ns / 1000000, props)
+            elif self._mode == ActivityMode.AGGREGATE:
+                (self._ok_ms if ex is None else self._err_ms)(elapsed_ns / 1000000)
+            elif self._op is not None:
+                self._track_compact(self._op, elapsed_ns, ex)
         finally:
             self._start = 0
             self._activity_id = None
+            self._op = None
+            if self._token is not None:
+                # stopped in a different context than started
+                with contextlib.suppress(ValueError):
+                    end_operation(self._token)
+                self._token = None
+
+    def _track_compact(self, op: Operation, elapsed_ns: int, ex: BaseException | None) -> None:
+        nested = op.parent_id is not None
+        scope = OperationScope(
+            self._telemetry,
+            OperationKind.DEPENDENCY if nested else OperationKind.REQUEST,
+            self._name,
+            self._props,
+        )
+        if nested:
+            scope.type = "InProc"
+        scope.operation = op
+        scope.duration = timedelta(microseconds=elapsed_ns / 1000)
+        scope.start_time = datetime.now(UTC) - scope.duration
+        scope.success = ex is None
+        if ex is not None:
+            scope.result_code = type(ex).__name__
+        self._telemetry.track_operation(scope)
 
     def __enter__(self) -> Activity:
         self.start()
@@ -318,6 +637,77 @@ class Activity:
         self.stop(exc_val)
 
 
+class OperationKind(Enum):
+    REQUEST = 0
+    DEPENDENCY = 1
+
+
+class OperationScope:
+    """
+    Context manager tracking a request or dependency call. The operation
+    is current (see :func:`easytelemetry.context.current_operation`)
+    within the scope, and when the scope ends the telemetry publishes it.
+    Result code and success could be set within the scope; by default
+    the scope is successful unless it ends with an exception.
+    """
+
+    def __init__(
+        self,
+        telemetry: Telemetry,
+        kind: OperationKind,
+        name: str,
+        props: PropsT | None = None,
+    ):
+        self._telemetry = telemetry
+        self.kind = kind
+        self.name = name
+        self.props = props
+        self.url: str | None = None
+        self.source: str | None = None
+        self.type: str | None = None
+        self.target: str | None = None
+        self.data: str | None = None
+        self.operation_id: str | None = None
+        self.parent_id: str | None = None
+        self.result_code: str | None = None
+        self.success: bool | None = None
+        self.operation: Operation | None = None
+        self.start_time: datetime | None = None
+        self.duration = timedelta()
+        self._start = 0
+        self._token: Any = None
+
+    def start(self) -> Operation:
+        """Start the scope and make its operation current."""
+        self.operation, self._token = start_operation(self.name, self.operation_id, self.parent_id)
+        self.start_time = datetime.now(UTC)
+        self._start = time.perf_counter_ns()
+        return self.operation
+
+    def stop(self, ex: BaseException | None = None) -> None:
+        """Stop the scope, restore previous operation and publish this one."""
+        if self._token is None:
+            return
+        self.duration = timedelta(microseconds=(time.perf_counter_ns() - self._start) / 1000)
+        if self.success is None:
+            self.success = ex is None
+        end_operation(self._token)
+        self._token = None
+        self._telemetry.track_operation(self)
+
+    def __enter__(self) -> OperationScope:
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: BaseException | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.stop(exc_val)
+
+
 class ReusableTimer:
     """
     A timer which you can repeatedly start and stop and the elapsed time
@@ -505,45 +895,109 @@ def std_logging_to_level(levelno: int) -> Level:
 
 
 class StdLoggingHandler(logging.Handler):
-    """Adapter for standard Python logging."""
+    """
+    Adapter for standard Python logging. Records are converted
+    by the logger of the same name (see :meth:`Logger.log_record`).
+    """
 
     def __init__(self, telemetry: Telemetry):
         std_level = level_to_std_logging(telemetry.min_level)
         super().__init__(level=std_level)
         self._telemetry = telemetry
+        self._hand_off: _HandOffHandler | None = None
+        self._listener: _HandOffListener | None = None
+
+    @property
+    def dropped(self) -> int:
+        """Number of records dropped, because the hand-off queue was full."""
+        return 0 if self._hand_off is None else self._hand_off.dropped
 
     def emit(self, record: logging.LogRecord) -> None:
         """Emit the logging record."""
-        (props, ex) = _parse_record(record)
-        logger = self._telemetry.root if record.name == "root" else self._telemetry.logger(record.name)
-        if ex is not None:
-            level = std_logging_to_level(record.levelno)
-            logger.exception(ex, level=level, **props)
-        else:
-            match record.levelno:
-                case logging.DEBUG:
-                    logger.debug(record.msg, **props)
-                case logging.INFO:
-                    logger.info(record.msg, **props)
-                case logging.WARNING:
-                    logger.warn(record.msg, **props)
-                case logging.ERROR:
-                    logger.error(record.msg, **props)
-                case logging.CRITICAL:
-                    logger.critical(record.msg, **props)
-                case _:
-                    logger.info(record.msg, **props)
-
-    def configure_std_logging(self, clear_handlers: bool = False) -> None:
-        """Configure standard logging handler."""
+        try:
+            name = record.name
+            logger = self._telemetry.root if name == "root" else self._telemetry.logger(name)
+            logger.log_record(record)
+        except Exception:
+            self.handleError(record)
+
+    def set_level(self, level: Level) -> None:
+        """
+        Change level of the handler and, when the handler has configured
+        standard logging, of the root logger as well.
+        """
+        std_level = level_to_std_logging(level)
+        self.setLevel(std_level)
+        if self in logging.root.handlers or (self._hand_off is not None and self._hand_off in logging.root.handlers):
+            logging.root.setLevel(std_level)
+
+    def configure_std_logging(self, clear_handlers: bool = False, queue_maxsize: int | None = None) -> None:
+        """
+        Configure standard logging handler.
+
+        :param clear_handlers: remove other handlers of the root logger
+        :param queue_maxsize: when given, records are only put into a queue
+            of this size and converted by a background thread, so logging
+            never blocks; records not fitting into the queue are dropped
+        """
+        handler: logging.Handler = self
+        if queue_maxsize is not None:
+            self._hand_off = _HandOffHandler(Queue(maxsize=queue_maxsize))
+            self._start_listener(self._hand_off)
+            handler = self._hand_off
         logging.basicConfig(
             level=self.level,
             force=clear_handlers,
             datefmt="%Y-%m-%d %H:%M:%S",
             format="%(message)s",
-            handlers=[self],
+            handlers=[handler],
         )
 
+    def after_fork(self) -> None:
+        """Restart the hand-off thread in a forked child; records queued by the parent are discarded."""
+        if self._hand_off is not None and self._listener is not None:
+            self._hand_off.queue = Queue(maxsize=self._hand_off.queue.maxsize)
+            self._start_listener(self._hand_off)
+
+    def close(self) -> None:
+        """Convert records still waiting in the hand-off queue and close the handler."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+            logging.root.removeHandler(self._hand_off)  # type: ignore[arg-type]
+        super().close()
+
+    def _start_listener(self, hand_off: _HandOffHandler) -> None:
+        self._listener = _HandOffListener(hand_off.queue, self, respect_handler_level=True)
+        self._listener.start()
+
+
+class _HandOffHandler(QueueHandler):
+    """Hands records over to a background thread without ever blocking."""
+
+    queue: Queue[Any]
+
+    def __init__(self, queue: Queue[Any]):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The record is converted in another thread, so only the operation
+        # is captured; the message is formatted there and only if needed.
+        record.easytelemetry_operation = current_operation()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class _HandOffListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)  # type: ignore[attr-defined]
+
 
 def _parse_record(r: logging.LogRecord) -> tuple[PropsT, BaseException | None]:
     props: PropsT = {
@@ -617,5 +1071,43 @@ def merge_props(*args: PropsT | None) -> PropsT:
 
 
 def str_dict(props: PropsT) -> dict[str, str]:
-    """Convert dictionary values, which might be numbers and booleans into strings."""
-    return {k: str(v) for k, v in props.items()}
+    """
+    Convert dictionary values, which might be numbers and booleans into strings.
+    Values of :class:`LazyProp` are kept and converted only when serialized.
+    """
+    return {k: v if isinstance(v, LazyProp) else str(v) for k, v in props.items()}  # type: ignore[misc]
+
+
+def lazy(func: LazyPropT) -> LazyProp:
+    """Mark a zero-argument callable as a property value computed only when serialized."""
+    return LazyProp(func)
+
+
+class LazyProp:
+    """
+    Property value given as a zero-argument callable (see :func:`lazy`);
+    other callables are converted to strings as any other value. It is called at most once
+    and only when the entry is serialized for sending (in the publishing thread),
+    so entries dropped by level, sampling or rate limits never pay for it.
+    An exception raised by the callable becomes the value instead of failing the entry.
+    """
+
+    __slots__ = ("_func", "_value")
+
+    def __init__(self, func: LazyPropT):
+        self._func = func
+        self._value: str | None = None
+
+    def resolve(self) -> str:
+        if self._value is None:
+            try:
+                self._value = str(self._func())
+            except Exception as e:
+                self._value = f"<{type(e).__name__}: {e}>"
+        return self._value
+
+    def __str__(self) -> str:
+        return self.resolve()
+
+    def __repr__(self) -> str:
+        return f"LazyProp({self._func!r})"
@@ -0,0 +1,490 @@
+"""
+This module contains a local collector agent for multi-process deployments.
+
+Worker processes use :class:`AgentPublisher` instead of the default publisher.
+It does not talk to the ingestion endpoint at all; it only serializes envelopes
+and writes them as length-prefixed frames into a Unix domain socket.
+A single :class:`Agent` per host (``python -m easytelemetry.agent``) receives
+the frames, batches them and publishes them to Application Insights
+using :func:`easytelemetry.appinsights.protocol.send_batch`.
+"""
+
+from __future__ import annotations
+
+import bisect
+from collections import deque
+from collections.abc import Sequence
+import concurrent.futures as cf
+import contextlib
+import os
+from pathlib import Path
+from queue import Empty, Queue
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+import orjson
+
+from easytelemetry.appinsights import (
+    DrainResult,
+    Options,
+    ShutdownReport,
+    spill_to_local_storage,
+)
+import easytelemetry.appinsights.protocol as p
+
+
+def _runtime_dir() -> Path:
+    """Directory of the current user for the socket: $XDG_RUNTIME_DIR or a per-user one in the temp directory."""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return Path(runtime)
+    uid = os.getuid() if hasattr(os, "getuid") else os.getpid()
+    return Path(tempfile.gettempdir()) / f"easytelemetry-{uid}"
+
+
+def _check_private_dir(path: Path) -> None:
+    """
+    Raise OSError unless the path is a directory (not a link to one) owned by
+    the current user with mode 0700, so no other user can replace the socket in it.
+    """
+    st = path.lstat()
+    uid = os.getuid() if hasattr(os, "getuid") else st.st_uid
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != uid or stat.S_IMODE(st.st_mode) != 0o700:
+        raise OSError(f"{path} must be a directory owned by the current user with mode 0700")
+
+
+DEFAULT_SOCKET_PATH = str(_runtime_dir() / "easytelemetry.sock")
+MAX_FRAME_BYTES = 4 * 1024 * 1024
+RECV_BUFFER_BYTES = 64 * 1024
+
+_HEADER = struct.Struct(">I")
+
+
+def frame(payload: bytes) -> bytes:
+    """Prefix the payload with its length (4 bytes, big-endian)."""
+    return _HEADER.pack(len(payload)) + payload
+
+
+class FrameReader:
+    """Incrementally splits a byte stream into length-prefixed frames."""
+
+    def __init__(self, max_frame_bytes: int = MAX_FRAME_BYTES):
+        self._buffer = bytearray()
+        self._max_frame_bytes = max_frame_bytes
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """
+        Append received data and return all frames completed by it.
+        Raise ValueError if the stream contains a frame larger than allowed.
+        """
+        buf = self._buffer
+        buf += data
+        frames: list[bytes] = []
+        pos = 0
+        length = len(buf)
+        while length - pos >= _HEADER.size:
+            (size,) = _HEADER.unpack_from(buf, pos)
+            if size > self._max_frame_bytes:
+                raise ValueError(f"frame of {size} bytes exceeds the limit")
+            end = pos + _HEADER.size + size
+            if end > length:
+                break
+            frames.append(bytes(buf[pos + _HEADER.size : end]))
+            pos = end
+        if pos:
+            del buf[:pos]
+        return frames
+
+
+class AgentPublisher:
+    """
+    Publisher for worker processes which hands envelopes over to the local
+    :class:`Agent` instead of publishing them to ingestion endpoint.
+    Sending is fire-and-forget. When the agent is not reachable, envelopes
+    are kept in a bounded fallback buffer (the oldest are dropped first)
+    and sent again with the next publish.
+    """
+
+    def __init__(
+        self,
+        options: Options,
+        socket_path: str = DEFAULT_SOCKET_PATH,
+        fallback_maxsize: int = 1000,
+        send_timeout_secs: float = 0.5,
+        reconnect_interval_secs: float = 1,
+    ):
+        self._options = options
+        self._socket_path = socket_path
+        self._fallback: deque[p.Envelope] = deque(maxlen=fallback_maxsize)
+        self._send_timeout_secs = send_timeout_secs
+        self._reconnect_interval_secs = reconnect_interval_secs
+        self._sock: socket.socket | None = None
+        self._next_connect = 0.0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def dropped(self) -> int:
+        """Number of envelopes dropped because the fallback buffer was full."""
+        return self._dropped
+
+    @property
+    def pending(self) -> int:
+        """Number of envelopes waiting in the fallback buffer."""
+        return len(self._fallback)
+
+    def publish(self, source: Queue[p.Envelope]) -> list[p.PublishResult]:
+        """Consume the source (queue) and send everything to the agent."""
+        with self._lock:
+            envelopes = self._take(source)
+            if not envelopes:
+                return []
+            result, delivered = self._send(envelopes, self._send_timeout_secs)
+            if not result.success:
+                self._keep(envelopes[delivered:])
+            return [result]
+
+    def drain(self, source: Queue[p.Envelope], deadline: float) -> DrainResult:
+        """
+        Consume the source (queue) and send everything to the agent
+        before the deadline (:func:`time.monotonic` based).
+        """
+        with self._lock:
+            envelopes = self._take(source)
+            if not envelopes:
+                return DrainResult(0, [], 0)
+            timeout = max(0.01, deadline - time.monotonic())
+            self._next_connect = 0.0
+            _, delivered = self._send(envelopes, timeout)
+            return DrainResult(delivered, envelopes[delivered:], 0)
+
+    def after_fork(self) -> None:
+        """
+        Forget the connection and envelopes inherited from the parent process;
+        the parent is still responsible for them.
+        """
+        if self._sock is not None:
+            with contextlib.suppress(OSError):
+                self._sock.close()
+        self._sock = None
+        self._fallback.clear()
+        self._next_connect = 0.0
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def _take(self, source: Queue[p.Envelope]) -> list[p.Envelope]:
+        envelopes = list(self._fallback)
+        self._fallback.clear()
+        while True:
+            try:
+                envelopes.append(source.get_nowait())
+            except Empty:
+                return envelopes
+
+    def _keep(self, envelopes: Sequence[p.Envelope]) -> None:
+        maxlen = self._fallback.maxlen or 0
+        overflow = len(self._fallback) + len(envelopes) - maxlen
+        if overflow > 0:
+            self._dropped += overflow
+        self._fallback.extend(envelopes)
+
+    def _send(self, envelopes: Sequence[p.Envelope], timeout: float) -> tuple[p.PublishResult, int]:
+        """Return the result and the number of envelopes delivered completely."""
+        ikey = self._options.connection.instrumentation_key
+        ends = []
+        frames = []
+        size = 0
+        for envelope in envelopes:
+            envelope.iKey = ikey
+            if envelope.seq is None:
+                envelope.seq = str(time.time_ns() // 1_000_000)
+            frames.append(frame(p.serialize(envelope)))
+            size += len(frames[-1])
+            ends.append(size)
+        data = memoryview(b"".join(frames))
+        sent = 0
+        try:
+            sock = self._connect()
+            sock.settimeout(timeout)
+            while sent < size:
+                sent += sock.send(data[sent:])
+            return p.PublishResult(True, 200, count=len(envelopes)), len(envelopes)
+        except OSError as e:
+            # the agent drops the frame cut off by the disconnect; it is sent again
+            self._disconnect()
+            return p.PublishResult(False, p.CONNECTION_ERROR, exception=e), bisect.bisect_right(ends, sent)
+
+    def _connect(self) -> socket.socket:
+        if self._sock is not None:
+            return self._sock
+        now = time.monotonic()
+        if now < self._next_connect:
+            raise ConnectionError("agent is not available")
+        try:
+            _check_private_dir(Path(self._socket_path).parent)
+        except OSError:
+            self._next_connect = now + self._reconnect_interval_secs
+            raise
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self._send_timeout_secs)
+            sock.connect(self._socket_path)
+        except OSError:
+            sock.close()
+            self._next_connect = now + self._reconnect_interval_secs
+            raise
+        self._sock = sock
+        return sock
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            with contextlib.suppress(OSError):
+                self._sock.close()
+            self._sock = None
+
+
+class Agent:
+    """
+    Collector receiving framed envelopes from worker processes over a Unix
+    domain socket, which only the user running the agent can connect to.
+    Envelopes are parsed only to replace their instrumentation key with the one
+    of the agent; they are batched as serialized and published with
+    :func:`p.send_batch` (which also compresses them)
+    every :attr:`Options.publish_interval_secs` or as soon as a full batch
+    (:attr:`Options.batch_maxsize`) is collected.
+    Without the socket path the agent only publishes what is passed
+    to :meth:`accept` (e.g. by :class:`easytelemetry.agent.ring.RingDrainer`).
+    """
+
+    def __init__(
+        self,
+        options: Options,
+        socket_path: str | None = DEFAULT_SOCKET_PATH,
+        executor: cf.ThreadPoolExecutor | None = None,
+    ):
+        self._options = options
+        self._socket_path = socket_path
+        self._pending: list[orjson.Fragment] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._server: _Server | None = None
+        self._threads: list[threading.Thread] = []
+        self._futures: set[cf.Future[p.PublishResult]] = set()
+        if executor:
+            self._executor = executor
+            self._owns_executor = False
+        else:
+            workers = options.max_publishing_workers or min(8, (os.cpu_count() or 1) + 1)
+            self._executor = cf.ThreadPoolExecutor(max_workers=workers)
+            self._owns_executor = True
+        self.received = 0
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def socket_path(self) -> str | None:
+        return self._socket_path
+
+    def start(self) -> None:
+        """Start listening on the socket and publishing in background threads."""
+        if self._threads:
+            return
+        self._threads = [
+            threading.Thread(target=self._run_publishing, name="easytelemetry-agent-publishing", daemon=True),
+        ]
+        if self._socket_path is not None:
+            path = Path(self._socket_path)
+            path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            try:
+                _check_private_dir(path.parent)
+            except OSError:
+                self._threads = []
+                raise
+            if path.exists() and stat.S_ISSOCK(path.stat().st_mode):
+                if _is_listening(self._socket_path):
+                    self._threads = []
+                    raise OSError(f"another agent is listening on {self._socket_path}")
+                path.unlink()  # stale socket left by a previous agent
+            umask = os.umask(0o177)  # the socket is created by bind, already private
+            try:
+                self._server = _Server(self._socket_path, self)
+            finally:
+                os.umask(umask)
+            self._threads.append(
+                threading.Thread(target=self._server.serve_forever, name="easytelemetry-agent", daemon=True),
+            )
+        for t in self._threads:
+            t.start()
+
+    def accept(self, frames: list[bytes]) -> None:
+        """Add serialized envelopes received from a worker."""
+        frames, invalid = _with_ikey(frames, self._options.connection.instrumentation_key)
+        maxsize = self._options.queue_maxsize
+        with self._lock:
+            self.dropped += invalid
+            free = maxsize - len(self._pending)
+            if len(frames) > free:
+                self.dropped += len(frames) - max(0, free)
+                frames = frames[: max(0, free)]
+            self._pending.extend(orjson.Fragment(x) for x in frames)
+            self.received += len(frames)
+            n = len(self._pending)
+        if n >= self._options.batch_maxsize:
+            self._wakeup.set()
+
+    def flush(self) -> list[cf.Future[p.PublishResult]]:
+        """Publish everything received so far."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        futures = []
+        size = self._options.batch_maxsize
+        for i in range(0, len(pending), size):
+            f = self._executor.submit(self._send_batch, pending[i : i + size], None)
+            self._futures.add(f)
+            f.add_done_callback(self._futures.discard)
+            futures.append(f)
+        return futures
+
+    def stop(self, timeout_secs: float | None = None) -> ShutdownReport:
+        """
+        Stop receiving and publish everything received so far
+        before the deadline. Frames which could not be published are spilled
+        to local storage (if configured) or dropped.
+        """
+        start = time.monotonic()
+        timeout = self._options.shutdown_timeout_secs if timeout_secs is None else timeout_secs
+        deadline = start + max(0.0, timeout)
+        self._stopped.set()
+        self._wakeup.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            with contextlib.suppress(OSError):
+                Path(str(self._socket_path)).unlink()
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+        batches: dict[cf.Future[p.PublishResult], list[orjson.Fragment]] = {}
+        size = self._options.batch_maxsize
+        for i in range(0, len(pending), size):
+            batch = pending[i : i + size]
+            batches[self._executor.submit(self._send_batch, batch, deadline)] = batch
+        done, _ = cf.wait([*batches, *self._futures], timeout=max(0.0, deadline - time.monotonic()))
+        sent = 0
+        unsent: list[orjson.Fragment] = []
+        in_flight = 0
+        for f, batch in batches.items():
+            if f in done:
+                rejected = batch if f.exception() else f.result().unsent
+                sent += len(batch) - len(rejected)
+                unsent.extend(rejected)  # type: ignore[arg-type]
+            elif f.cancel():
+                unsent.extend(batch)
+            else:
+                in_flight += len(batch)
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+        spilled = 0
+        if unsent and self._options.use_local_storage and self._options.local_storage_path:
+            spilled = spill_to_local_storage(unsent, self._options.local_storage_path)
+        return ShutdownReport(
+            sent=sent,
+            spilled=spilled,
+            dropped=len(unsent) - spilled + in_flight,
+            elapsed_secs=time.monotonic() - start,
+        )
+
+    def _run_publishing(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self._options.publish_interval_secs)
+            if self._stopped.is_set():
+                return
+            self._wakeup.clear()
+            self.flush()
+
+    def _send_batch(self, batch: list[orjson.Fragment], deadline: float | None) -> p.PublishResult:
+        url = self._options.connection.ingestion_endpoint
+        if deadline is None:
+            result = p.send_batch(batch, url, ndjson=self._options.ndjson)
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return p.PublishResult(False, p.UNSPECIFIED_ERROR, count=len(batch), unsent=list(batch))
+            result = p.send_batch(batch, url, max_attempts=1, timeout_secs=remaining, ndjson=self._options.ndjson)
+        with self._lock:  # updated by executor threads
+            self.published += result.accepted
+            self.failed += result.count - result.accepted
+        return result
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Reads frames from one worker connection until it is closed."""
+
+    server: _Server
+
+    def handle(self) -> None:
+        reader = FrameReader()
+        while True:
+            data = self.request.recv(RECV_BUFFER_BYTES)
+            if not data:
+                return
+            try:
+                frames = reader.feed(data)
+            except ValueError:
+                return  # corrupted stream; the worker reconnects
+            if frames:
+                self.server.agent.accept(frames)
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, agent: Agent):
+        super().__init__(socket_path, _Handler)
+        self.agent = agent
+
+
+def _with_ikey(frames: list[bytes], ikey: str) -> tuple[list[bytes], int]:
+    """
+    Return frames with the instrumentation key replaced by the given one
+    (a worker cannot publish to another resource through the agent)
+    and the number of frames dropped as not being JSON objects.
+    """
+    result = []
+    invalid = 0
+    for data in frames:
+        try:
+            envelope = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            invalid += 1
+            continue
+        if not isinstance(envelope, dict):
+            invalid += 1
+            continue
+        if envelope.get("iKey") != ikey:
+            envelope["iKey"] = ikey
+            data = orjson.dumps(envelope)
+        result.append(data)
+    return result, invalid
+
+
+def _is_listening(socket_path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+        return True
@@ -0,0 +1,42 @@
+"""
+Run the local collector agent.
+
+    python -m easytelemetry.agent --app myapp [--socket $XDG_RUNTIME_DIR/easytelemetry.sock]
+
+Connection string and other options are taken from the same environment
+variables as :func:`easytelemetry.appinsights.build` uses.
+"""
+
+import argparse
+import signal
+import threading
+
+from easytelemetry.agent import DEFAULT_SOCKET_PATH, Agent
+from easytelemetry.appinsights import Options
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m easytelemetry.agent",
+        description="Collect telemetry from local worker processes and publish it to Application Insights.",
+    )
+    parser.add_argument("--app", required=True, help="application name used to look up environment variables")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="path of the Unix domain socket to listen on")
+    args = parser.parse_args()
+
+    options = Options.from_env(args.app)
+    agent = Agent(options, args.socket)
+    stop = threading.Event()
+
+    def on_signal(signum: int, frame: object) -> None:  # noqa: ARG001
+        stop.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    agent.start()
+    stop.wait()
+    agent.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+This module contains shared-memory transport between worker processes
+and a single publishing process.
+
+Every producer (worker process) owns one single-producer single-consumer
+ring buffer of serialized envelopes in a :mod:`multiprocessing.shared_memory`
+segment, so no cross-process locks are needed. The publishing process runs
+:class:`RingDrainer`, which moves everything from all rings into an
+:class:`easytelemetry.agent.Agent` for batching and publishing.
+
+The rings rely on aligned 8-byte stores being atomic and on stores becoming
+visible in program order (record data before the head position), which holds
+on x86-64 (total store order). Elsewhere they refuse to be created, and
+:func:`create_publisher` falls back to the agent's Unix domain socket.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import platform
+from queue import Empty, Queue
+import struct
+import threading
+import time
+
+from easytelemetry.agent import DEFAULT_SOCKET_PATH, Agent, AgentPublisher
+from easytelemetry.appinsights import DrainResult, Options
+import easytelemetry.appinsights.protocol as p
+
+
+DEFAULT_RING_CAPACITY = 1024 * 1024
+
+_CACHE_LINE = 64
+_TOTAL_STORE_ORDER_MACHINES = frozenset({"x86_64", "amd64"})
+_SEGMENT_HEADER = struct.Struct("<QQ")  # number of rings, capacity of each ring
+_U64 = struct.Struct("<Q")
+_HEAD_WRITTEN = struct.Struct("<QQ")
+_U32 = struct.Struct("<I")
+
+# Offsets within the ring header. Producer-owned and consumer-owned fields
+# are on separate cache lines to avoid false sharing.
+_HEAD = 0
+_WRITTEN = 8
+_DROPPED = 16
+_OVERSIZED = 24
+_TAIL = _CACHE_LINE
+_RING_HEADER_SIZE = 2 * _CACHE_LINE
+
+
+def is_supported() -> bool:
+    """Tell whether the memory ordering of this machine is safe for the rings (x86-64 only)."""
+    return platform.machine().lower() in _TOTAL_STORE_ORDER_MACHINES
+
+
+@dataclass(frozen=True)
+class RingStats:
+    """Counters of a single ring as seen in shared memory."""
+
+    # Records written by the producer.
+    written: int
+
+    # Records dropped by the producer because the ring was full.
+    dropped: int
+
+    # Records dropped by the producer because they are larger than the ring.
+    oversized: int
+
+    # Bytes written by the producer but not read by the consumer yet.
+    pending_bytes: int
+
+
+class RingBuffer:
+    """
+    Single-producer single-consumer ring buffer of length-prefixed records
+    in shared memory. Positions (head, tail) grow monotonically and
+    are wrapped by the ring capacity. A record which does not fit before
+    the end of the ring continues at the beginning, so any record up to
+    the capacity fits into an empty ring.
+    """
+
+    def __init__(self, buf: memoryview, capacity: int):
+        self._header = buf[:_RING_HEADER_SIZE]
+        self._data = buf[_RING_HEADER_SIZE : _RING_HEADER_SIZE + capacity]
+        self._capacity = capacity
+        # each side caches the position it owns; the producer also keeps
+        # the last tail it has seen and re-reads it only when the ring looks full
+        self._head, self._written = _HEAD_WRITTEN.unpack_from(self._header, _HEAD)
+        self._tail = _U64.unpack_from(self._header, _TAIL)[0]
+        self._seen_tail = self._tail
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def write(self, payload: bytes) -> bool:
+        """Write the record (producer side). Return False if it was dropped."""
+        header = self._header
+        need = _U32.size + len(payload)
+        if need > self._capacity:
+            _incr(header, _OVERSIZED)
+            return False
+        head = self._head
+        if head + need - self._seen_tail > self._capacity:
+            self._seen_tail = _U64.unpack_from(header, _TAIL)[0]
+            if head + need - self._seen_tail > self._capacity:
+                _incr(header, _DROPPED)
+                return False
+        idx = head % self._capacity
+        if self._capacity - idx >= need:
+            _U32.pack_into(self._data, idx, len(payload))
+            self._data[idx + _U32.size : idx + need] = payload
+        else:
+            self._put(idx, _U32.pack(len(payload)) + payload)
+        head += need
+        self._head = head
+        self._written += 1
+        _HEAD_WRITTEN.pack_into(header, _HEAD, head, self._written)  # publish the record
+        return True
+
+    def read(self, max_records: int = -1) -> list[bytes]:
+        """Read available records (consumer side)."""
+        header = self._header
+        data = self._data
+        capacity = self._capacity
+        head = _U64.unpack_from(header, _HEAD)[0]
+        tail = self._tail
+        records: list[bytes] = []
+        while tail < head and max_records != 0:
+            idx = tail % capacity
+            if capacity - idx >= _U32.size:
+                size = _U32.unpack_from(data, idx)[0]
+            else:
+                size = _U32.unpack(self._get(idx, _U32.size))[0]
+            start = (idx + _U32.size) % capacity
+            if capacity - start >= size:
+                records.append(data[start : start + size].tobytes())
+            else:
+                records.append(self._get(start, size))
+            tail += _U32.size + size
+            max_records -= 1
+        if tail != self._tail:
+            self._tail = tail
+            _U64.pack_into(header, _TAIL, tail)  # release the space
+        return records
+
+    def _put(self, idx: int, chunk: bytes) -> None:
+        """Copy the chunk to the ring from the index, continuing at the beginning."""
+        first = self._capacity - idx
+        self._data[idx:] = chunk[:first]
+        self._data[: len(chunk) - first] = chunk[first:]
+
+    def _get(self, idx: int, size: int) -> bytes:
+        """Copy a chunk of the size from the index, continuing at the beginning."""
+        first = self._capacity - idx
+        return self._data[idx:].tobytes() + self._data[: size - first].tobytes()
+
+    def stats(self) -> RingStats:
+        header = self._header
+        head = _U64.unpack_from(header, _HEAD)[0]
+        tail = _U64.unpack_from(header, _TAIL)[0]
+        return RingStats(
+            written=_U64.unpack_from(header, _WRITTEN)[0],
+            dropped=_U64.unpack_from(header, _DROPPED)[0],
+            oversized=_U64.unpack_from(header, _OVERSIZED)[0],
+            pending_bytes=head - tail,
+        )
+
+    def release(self) -> None:
+        self._header.release()
+        self._data.release()
+
+
+def _incr(header: memoryview, offset: int) -> None:
+    _U64.pack_into(header, offset, _U64.unpack_from(header, offset)[0] + 1)
+
+
+def _check_supported() -> None:
+    if not is_supported():
+        raise OSError(f"shared memory rings require x86-64 memory ordering, not {platform.machine()}")
+
+
+def _buffer(shm: shared_memory.SharedMemory) -> memoryview:
+    buf = shm.buf
+    if buf is None:
+        raise OSError(f"shared memory {shm.name} is not mapped")
+    return buf
+
+
+class SharedRings:
+    """
+    Shared memory segment with one ring buffer per producer.
+    The publishing process creates it with :meth:`create` and workers
+    attach to it by name with :meth:`attach`.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        buf = _buffer(shm)
+        (self._count, self._capacity) = _SEGMENT_HEADER.unpack_from(buf, 0)
+        stride = _RING_HEADER_SIZE + self._capacity
+        self._rings = [
+            RingBuffer(buf[_CACHE_LINE + i * stride : _CACHE_LINE + (i + 1) * stride], self._capacity)
+            for i in range(self._count)
+        ]
+
+    @staticmethod
+    def create(
+        producers: int,
+        capacity: int = DEFAULT_RING_CAPACITY,
+        name: str | None = None,
+    ) -> SharedRings:
+        """
+        Create new segment with a ring of given capacity for every producer.
+
+        :raises ValueError: when the capacity is not a positive multiple of 8,
+            which keeps the positions in the headers of all rings aligned
+        :raises OSError: when the rings are not supported on this machine
+        """
+        if capacity <= 0 or capacity % 8:
+            raise ValueError(f"capacity must be a positive multiple of 8, got {capacity}")
+        _check_supported()
+        size = _CACHE_LINE + producers * (_RING_HEADER_SIZE + capacity)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        buf = _buffer(shm)
+        buf[:size] = bytes(size)
+        _SEGMENT_HEADER.pack_into(buf, 0, producers, capacity)
+        return SharedRings(shm, owner=True)
+
+    @staticmethod
+    def attach(name: str) -> SharedRings:
+        """Attach to an existing segment."""
+        _check_supported()
+        return SharedRings(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def rings(self) -> list[RingBuffer]:
+        return self._rings
+
+    def ring(self, index: int) -> RingBuffer:
+        return self._rings[index]
+
+    def stats(self) -> list[RingStats]:
+        return [r.stats() for r in self._rings]
+
+    def close(self) -> None:
+        """Detach from the segment; the creator also removes it."""
+        for r in self._rings:
+            r.release()
+        self._rings = []
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class RingPublisher:
+    """
+    Publisher for worker processes which writes serialized envelopes
+    into the worker's own ring. It never blocks; envelopes which do not fit
+    are dropped and counted in shared memory (see :meth:`SharedRings.stats`).
+
+    With :class:`multiprocessing.pool.Pool` assign ring indexes
+    in the pool initializer, e.g. from a :class:`multiprocessing.Queue`
+    pre-filled with numbers 0 .. processes - 1.
+    """
+
+    def __init__(self, options: Options, rings_name: str, index: int):
+        self._options = options
+        self._rings = SharedRings.attach(rings_name)
+        self._ring: RingBuffer | None = self._rings.ring(index)
+
+    def publish(self, source: Queue[p.Envelope]) -> list[p.PublishResult]:
+        written, rejected = self._write(source)
+        if rejected:
+            return [p.PublishResult(False, p.UNSPECIFIED_ERROR)]
+        return [p.PublishResult(True, 200)] if written else []
+
+    def drain(self, source: Queue[p.Envelope], deadline: float) -> DrainResult:  # noqa: ARG002
+        written, rejected = self._write(source)
+        return DrainResult(written, rejected, 0)
+
+    def after_fork(self) -> None:
+        # A ring has exactly one producer. A forked child must not write
+        # into the parent's ring; it has to build telemetry with a new
+        # publisher attached to its own ring.
+        self._ring = None
+
+    def close(self) -> None:
+        self._ring = None
+        self._rings.close()
+
+    def _write(self, source: Queue[p.Envelope]) -> tuple[int, list[p.Envelope]]:
+        ikey = self._options.connection.instrumentation_key
+        ring = self._ring
+        written = 0
+        rejected: list[p.Envelope] = []
+        while True:
+            try:
+                envelope = source.get_nowait()
+            except Empty:
+                return written, rejected
+            envelope.iKey = ikey
+            envelope.seq = str(time.time_ns() // 1_000_000)
+            if ring is not None and ring.write(p.serialize(envelope)):
+                written += 1
+            else:
+                rejected.append(envelope)
+
+
+def create_publisher(
+    options: Options,
+    rings_name: str | None,
+    index: int,
+    socket_path: str = DEFAULT_SOCKET_PATH,
+) -> RingPublisher | AgentPublisher:
+    """
+    Create a publisher writing into the ring of given index, or one sending
+    to the agent socket when the rings are not supported on this machine
+    (or were not created, i.e. the name is None).
+    """
+    if rings_name is not None and is_supported():
+        return RingPublisher(options, rings_name, index)
+    return AgentPublisher(options, socket_path=socket_path)
+
+
+class RingDrainer:
+    """
+    Background thread of the publishing process which moves serialized
+    envelopes from all rings into the agent, which batches and publishes them.
+    """
+
+    def __init__(
+        self,
+        rings: SharedRings,
+        agent: Agent,
+        poll_interval_secs: float = 0.005,
+        max_records_per_ring: int = 1024,
+    ):
+        self._rings = rings
+        self._agent = agent
+        self._poll_interval_secs = poll_interval_secs
+        self._max_records_per_ring = max_records_per_ring
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="easytelemetry-ring-drainer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and move whatever is left in the rings to the agent."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.drain_once()
+
+    def drain_once(self) -> int:
+        """Move available records from all rings to the agent (round-robin)."""
+        n = 0
+        for ring in self._rings.rings:
+            records = ring.read(self._max_records_per_ring)
+            if records:
+                self._agent.accept(records)
+                n += len(records)
+        return n
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            if self.drain_once() == 0:
+                self._stopped.wait(self._poll_interval_secs)
@@ -2,27 +2,41 @@
 
 from __future__ import annotations
 
+import _thread
 import atexit
-from collections.abc import Callable, Generator, Sequence
+from collections import deque
+from collections.abc import Callable, Generator, Mapping, Sequence
 import concurrent.futures as cf
+import contextlib
 from dataclasses import dataclass
+from datetime import UTC, datetime
+import logging
+import math
 import os
 from pathlib import Path
 import platform
 import posixpath
-from queue import Empty, Queue
+from queue import Empty, Full, Queue
 import re
+import signal
 import tempfile
 import threading
 import time
-from types import TracebackType
-from typing import Any, Protocol
+from types import FrameType, TracebackType
+from typing import TYPE_CHECKING, Any, Generic, Protocol, TypeVar
+import weakref
+
+import orjson
 
 from easytelemetry import (
+    GaugeCallbackT,
     Level,
     Logger,
+    MetricCtrFuncT,
     MetricFuncT,
     MetricFuncWithPropsT,
+    OperationKind,
+    OperationScope,
     PropsT,
     StdLoggingHandler,
     Telemetry,
@@ -34,11 +48,34 @@ from easytelemetry import (
     merge_props,
     str_dict,
 )
+from easytelemetry.appinsights.cardinality import OTHER, CardinalityGuard
+from easytelemetry.appinsights.governor import OverheadGovernor, Stage, describe_stage
+from easytelemetry.appinsights.memory import CgroupMemory
 import easytelemetry.appinsights.protocol as p
+from easytelemetry.appinsights.stats import Counter, Histogram, PipelineStats, StatsSnapshot
+from easytelemetry.context import Operation, current_operation
+from easytelemetry.levels import LevelFileWatcher, LevelOverrides, apply_levels
+
+
+if TYPE_CHECKING:
+    from easytelemetry.appinsights.counters import SharedCounters
+    from easytelemetry.appinsights.runtime import RuntimeMetrics
 
 
+T = TypeVar("T")
+
 DEFAULT_INGESTION = "https://dc.services.visualstudio.com/v2/track"
 
+# Name of the logger reporting problems of the telemetry itself.
+DIAGNOSTICS_LOGGER = "easytelemetry"
+# Namespace of metrics about the telemetry itself (see Options.debug).
+STATS_NAMESPACE = "easytelemetry"
+# Buffer budget under memory pressure without Options.queue_max_bytes,
+# as a fraction of the container memory limit.
+MEMORY_PRESSURE_BUDGET_RATIO = 0.01
+# Memory usage is also checked when the buffer grows by this many bytes (or by a quarter of its budget).
+MEMORY_PRESSURE_CHECK_BYTES = 1024 * 1024
+
 
 def build(
     app_name: str,
@@ -78,7 +115,7 @@ def build(
     ait = AppInsightsTelemetry(app_name, global_props, tags, opts, pub)
     if opts.setup_std_logging:
         handler = StdLoggingHandler(ait)
-        handler.configure_std_logging()
+        handler.configure_std_logging(queue_maxsize=opts.std_logging_queue_maxsize)
         ait.register_std_logging_handler(handler)
     return ait
 
@@ -167,6 +204,26 @@ class Options:
     setup_std_logging: bool = False
     clear_std_logging_handlers: bool = False
     use_atexit: bool = False
+    handle_sigterm: bool = False
+    shutdown_timeout_secs: float = 5
+    priority_level: Level | None = Level.ERROR
+    priority_delay_secs: float = 0.2
+    priority_batch_maxsize: int = 20
+    priority_max_sends_per_sec: float = 2
+    shared_counters_path: str | None = None
+    log_levels_path: str | None = None
+    log_levels_signal: int | None = None
+    std_logging_queue_maxsize: int | None = None
+    max_loggers: int = 1000
+    max_metrics: int = 1000
+    metric_max_cardinality: int = 0
+    gauge_timeout_secs: float = 1
+    runtime_metrics: bool = False
+    overhead_budget: float | None = None
+    overhead_window_secs: float = 60
+    queue_max_bytes: int | None = None
+    memory_pressure_threshold: float | None = None
+    ndjson: bool = False
 
     CONNECTION_STRING_ENV_VAR = "APPLICATION_INSIGHTS_CONNECTION_STRING"
     LOCAL_STORAGE_ENV_VAR = "APPLICATION_INSIGHTS_LOCAL_STORAGE"
@@ -223,6 +280,35 @@ class Options:
 FlushT = tuple[bool | None, list[Exception] | None]
 
 
+@dataclass(frozen=True)
+class ShutdownReport:
+    """Describes what happened with pending envelopes during shutdown."""
+
+    # Envelopes accepted by ingestion endpoint before the deadline.
+    sent: int = 0
+
+    # Envelopes written to local storage, because they could not be sent
+    # before the deadline or their batch has failed.
+    spilled: int = 0
+
+    # Envelopes lost; either the local storage is not configured,
+    # writing to it has failed or the batch was still in-flight
+    # when the deadline has passed.
+    dropped: int = 0
+
+    # Time spent on shutdown in seconds.
+    elapsed_secs: float = 0
+
+
+@dataclass(frozen=True)
+class DrainResult:
+    """Describes the result of publisher drain before the deadline."""
+
+    sent: int
+    unsent: list[p.Envelope]
+    in_flight: int
+
+
 class AppInsightsTelemetry(Telemetry):
     def __init__(
         self,
@@ -236,18 +322,75 @@ class AppInsightsTelemetry(Telemetry):
         self._global_props = global_props
         self._tags = tags
         self._options = options
-        self._publishing: threading.Timer | None = None
-        self._queue: Queue[p.Envelope] = Queue(maxsize=options.queue_maxsize)
-        self._rootlgr = AppInsightsLogger(
+        self._publishing: _Scheduler | None = None
+        self._stats = PipelineStats()
+        self._stats_reported: StatsSnapshot | None = None
+        self._buffer = _Buffer(options, tags, self._stats)
+        self._cgroup_memory = CgroupMemory() if options.memory_pressure_threshold else None
+        self._memory_pressure = False
+        self._memory_check_lock = threading.Lock()
+        if self._cgroup_memory is not None:
+            self._buffer.on_memory_check = self._check_memory_pressure
+        self._logger_type = AppInsightsLogger
+        if options.overhead_budget:
+            self._buffer.governor = OverheadGovernor(
+                options.overhead_budget,
+                options.overhead_window_secs,
+                on_transition=self._on_overhead_transition,
+            )
+            self._logger_type = _GovernedLogger
+        self._role_instance = tags.get(p.TagKey.CLOUD_ROLE_INSTANCE)
+        self._priority_sends = _TokenBucket(options.priority_max_sends_per_sec)
+        self._level_overrides = LevelOverrides()
+        self._level_watcher = LevelFileWatcher(options.log_levels_path) if options.log_levels_path else None
+        self._level_signal_installed = False
+        self._prev_level_signal: Any = None
+        self._level_signal_event: threading.Event | None = None
+        self._level_toggles = 0
+        self._debug_toggled_from: LevelOverrides | None = None
+        self._rootlgr = self._logger_type(
             "_root",
             options.min_level,
             global_props,
-            self._queue,
+            self._buffer,
         )
-        self._loggers: dict[str, Logger] = {self._rootlgr.name: self._rootlgr}
-        self._metrics: dict[str, _Metric] = {}
+        self._diagnostics = AppInsightsLogger(DIAGNOSTICS_LOGGER, Level.INFO, global_props, self._buffer)
+        self._base_levels: dict[str, Level] = {self._rootlgr.name: options.min_level, DIAGNOSTICS_LOGGER: Level.INFO}
+        self._loggers: _Registry[Logger] = _Registry(options.max_loggers, self._on_logger_forgotten)
+        self._loggers.pin(self._rootlgr.name, self._rootlgr)
+        # the telemetry's own logger does not take a place of an application logger
+        self._loggers.pin(DIAGNOSTICS_LOGGER, self._diagnostics, counted=False)
+        self._metrics: _Registry[_Metric] = _Registry(options.max_metrics)
+        self._aggregates: dict[str, _Aggregate] = {}
+        self._gauges: dict[str, _Gauge] = {}
+        self._gauge_executor: cf.ThreadPoolExecutor | None = None
         self._publisher = publisher
         self._std_logging_handler: StdLoggingHandler | None = None
+        self._sigterm_installed = False
+        self._prev_sigterm: Any = None
+        self._sigterm_received = False
+        self._sigterm_event = threading.Event()
+        self._shutdown_lock = threading.Lock()
+        self._shutdown_report: ShutdownReport | None = None
+        self._publishing_count = 0
+        self._publishing_count_lock = threading.Lock()
+        self._collectors: list[Callable[[], list[p.Envelope]]] = [self._collect_aggregates]
+        self._shared_counters: SharedCounters | None = None
+        if options.shared_counters_path:
+            from easytelemetry.appinsights.counters import SharedCounters  # POSIX only
+
+            self._shared_counters = SharedCounters(options.shared_counters_path)
+            self._collectors.append(self._shared_counters.collect)
+        self._runtime_metrics: RuntimeMetrics | None = None
+        if options.runtime_metrics:
+            from easytelemetry.appinsights.runtime import RuntimeMetrics
+
+            self._runtime_metrics = RuntimeMetrics(str_dict(global_props))
+            self._collectors.append(self._runtime_metrics.collect)
+        if options.debug:
+            self._collectors.append(self._collect_stats)
+        _live_instances.add(self)
+        self._poll_levels()
 
     @property
     def root(self) -> Logger:
@@ -262,6 +405,11 @@ class AppInsightsTelemetry(Telemetry):
     def min_level(self) -> Level:
         return self._options.min_level
 
+    @property
+    def runtime_metrics(self) -> RuntimeMetrics | None:
+        """Collector of process runtime metrics, if :attr:`Options.runtime_metrics` is on."""
+        return self._runtime_metrics
+
     def logger(
         self,
         name: str,
@@ -270,12 +418,35 @@ class AppInsightsTelemetry(Telemetry):
     ) -> Logger:
         lgr = self._loggers.get(name)
         if lgr is None:
-            min_level = level if level else self._options.min_level
-            properties = merge_props(self._global_props, props)
-            lgr = AppInsightsLogger(name, min_level, properties, self._queue)
-            self._loggers[name] = lgr
+
+            def create() -> Logger:
+                min_level = level if level else self._options.min_level
+                properties = merge_props(self._global_props, props)
+                effective = self._level_overrides.level_for(name) or min_level
+                self._base_levels[name] = min_level
+                return self._logger_type(name, effective, properties, self._buffer)
+
+            lgr = self._loggers.get_or_create(name, create)
         return lgr
 
+    def _on_logger_forgotten(self, name: str) -> None:
+        """Called when an evicted logger is garbage collected; a new one may be created by then."""
+        if name not in self._loggers:
+            self._base_levels.pop(name, None)
+
+    @property
+    def log_levels(self) -> dict[str, Level]:
+        return self._level_overrides.as_dict()
+
+    def set_log_levels(self, levels: Mapping[str, Level] | None) -> None:
+        overrides = LevelOverrides(levels)
+        self._level_overrides = overrides
+        self._debug_toggled_from = None
+        apply_levels(overrides, self._loggers.items(), self._base_levels)
+        if self._std_logging_handler is not None:
+            min_level = overrides.min_level() or Level.CRITICAL
+            self._std_logging_handler.set_level(min(self._options.min_level, min_level))
+
     def metric(
         self,
         name: str,
@@ -283,9 +454,7 @@ class AppInsightsTelemetry(Telemetry):
     ) -> MetricFuncT:
         metric = self._metrics.get(name)
         if metric is None:
-            properties = merge_props(self._global_props, props)
-            metric = _Metric(name, properties, self._queue)
-            self._metrics[name] = metric
+            metric = self._metrics.get_or_create(name, lambda: self._create_metric(name, props))
         return metric.track
 
     def metric_extra(
@@ -295,60 +464,654 @@ class AppInsightsTelemetry(Telemetry):
     ) -> MetricFuncWithPropsT:
         metric = self._metrics.get(name)
         if metric is None:
-            properties = merge_props(self._global_props, props)
-            metric = _Metric(name, properties, self._queue)
-            self._metrics[name] = metric
+            metric = self._metrics.get_or_create(name, lambda: self._create_metric(name, props))
         return metric.track_extra
 
+    def _create_metric(self, name: str, props: PropsT | None) -> _Metric:
+        return _Metric(
+            name,
+            merge_props(self._global_props, props),
+            self._buffer,
+            self._options.metric_max_cardinality,
+            self._on_cardinality_exceeded,
+        )
+
+    def metric_aggregate(
+        self,
+        name: str,
+        props: PropsT | None = None,
+    ) -> MetricFuncT:
+        agg = self._aggregates.get(name)
+        if agg is None:
+            properties = str_dict(merge_props(self._global_props, props))
+            agg = _Aggregate(name, properties)
+            self._aggregates[name] = agg
+        return agg.track
+
+    def gauge(
+        self,
+        name: str,
+        callback: GaugeCallbackT,
+        props: PropsT | None = None,
+    ) -> None:
+        """
+        Register a gauge of given name. Callbacks are called by the publishing
+        scheduler on worker threads of the telemetry, and their values go out
+        with the same batch as other envelopes. A callback raising an exception
+        or not returning within :attr:`Options.gauge_timeout_secs` is skipped
+        (and reported by the diagnostics logger) without affecting others.
+        """
+        properties = str_dict(merge_props(self._global_props, props))
+        self._gauges[name] = _Gauge(name, callback, properties)
+
+    def metric_incr(
+        self,
+        name: str,
+        props: PropsT | None = None,
+    ) -> MetricCtrFuncT:
+        """
+        Get or create a counter of given name. With
+        :attr:`Options.shared_counters_path` the increments are aggregated
+        across processes and published as one metric per interval.
+        """
+        if self._shared_counters is not None:
+            incr = self._shared_counters.counter(name, merge_props(self._global_props, props))
+            if incr is not None:
+                return incr
+        return super().metric_incr(name, props)
+
+    def track_operation(self, scope: OperationScope) -> None:
+        op = scope.operation
+        if op is None:
+            return
+        properties = str_dict(merge_props(self._global_props, scope.props))
+        data: p.RequestData | p.RemoteDependencyData
+        if scope.kind == OperationKind.REQUEST:
+            data = p.RequestData(
+                id=op.id,
+                duration=scope.duration,
+                responseCode=scope.result_code or ("200" if scope.success else "500"),
+                success=bool(scope.success),
+                source=scope.source,
+                name=scope.name,
+                url=scope.url,
+                properties=properties,
+            )
+        else:
+            data = p.RemoteDependencyData(
+                name=scope.name,
+                duration=scope.duration,
+                success=bool(scope.success),
+                id=op.id,
+                resultCode=scope.result_code,
+                data=scope.data,
+                type=scope.type,
+                target=scope.target,
+                properties=properties,
+            )
+        # the scope's own envelope belongs to its parent
+        tags = self._buffer.tags | {p.TagKey.OPERATION_ID: op.operation_id}
+        if op.name:
+            tags[p.TagKey.OPERATION_NAME] = op.name
+        if op.parent_id:
+            tags[p.TagKey.OPERATION_PARENT_ID] = op.parent_id
+        envelope = data.to_envelope(tags)
+        if scope.start_time is not None:
+            envelope.time = scope.start_time
+        self._buffer.put(envelope)
+
     def describe(self) -> str:
-        logger_names = [str(x) for x in self._loggers]
-        metric_names = [str(x) for x in self._metrics]
+        logger_names = [str(x) for x in self._loggers.names()]
+        metric_names = [str(x) for x in self._metrics.names()]
         pub = "no" if self._publishing is None else f"yes ({self._publishing.name})"
         s = [
             f"name: {self._name}",
             f'loggers: {", ".join(logger_names)}',
+            f"loggers count: {self._loggers.describe()}",
             f'metrics: {", ".join(metric_names)}',
+            f"metrics count: {self._metrics.describe()}",
             f"local_dir: {self._options.local_storage_path}",
             f"auto-publishing: {pub}",
         ]
+        if self._aggregates:
+            s.append(f'aggregates: {", ".join(self._aggregates)}')
+        if self._gauges:
+            s.append(f'gauges: {", ".join(self._gauges)}')
+        if self._shared_counters is not None:
+            s.append(f"shared counters: {self._shared_counters.describe()}")
+        if self._runtime_metrics is not None:
+            s.append(f"runtime metrics: {self._runtime_metrics.describe()}")
+        if self._buffer.governor is not None:
+            s.append(f"overhead: {self._buffer.governor.describe()}")
+        if self._buffer.max_bytes:
+            s.append(f"buffer: {self._buffer.used_bytes()} of {self._buffer.max_bytes} bytes")
+        if self._options.ndjson:
+            s.append(f"wire format: {p.NDJSON_CONTENT_TYPE}")
+        s.append(f"stats: {self.stats().describe()}")
         return "\n".join(s)
 
+    def stats(self) -> StatsSnapshot:
+        """
+        Return statistics of the telemetry pipeline since its creation:
+        envelopes enqueued, dropped (queue full) and sent, batches, bytes
+        serialized and sent, retries, failures, current queue depth and
+        histograms of batch sizes, serialization and HTTP latencies.
+        """
+        depth = self._buffer.queue.qsize() + self._buffer.priority.qsize()
+        return self._stats.snapshot(depth)
+
     def register_std_logging_handler(self, h: StdLoggingHandler) -> None:
         self._std_logging_handler = h
+        if self._level_overrides:
+            self.set_log_levels(self._level_overrides.as_dict())
 
     def start_publishing(self) -> None:
         if self._publishing is not None:
             return
-        self._publishing = threading.Timer(interval=self._options.publish_interval_secs, function=self.flush)
+        self._start_scheduler()
         if self._options.use_atexit:
-            atexit.register(self.stop_publishing)
+            atexit.register(self.shutdown)
+        if self._options.handle_sigterm:
+            self._install_sigterm_handler()
+        if self._options.log_levels_signal is not None:
+            self._install_level_signal_handler(self._options.log_levels_signal)
+
+    def _start_scheduler(self) -> None:
+        self._publishing = _Scheduler(
+            interval_secs=self._options.publish_interval_secs,
+            delay_secs=self._options.priority_delay_secs,
+            on_interval=self._on_interval,
+            on_priority=self._flush_priority,
+        )
+        self._buffer.on_priority = self._publishing.notify
+        self._buffer.on_pressure = self._publishing.flush_soon
         self._publishing.start()
 
     def stop_publishing(self) -> None:
         if self._publishing is None:
             return
+        self._buffer.on_priority = None
+        self._buffer.on_pressure = None
         self._publishing.cancel()
         self._publishing = None
         if self._options.use_atexit:
-            atexit.unregister(self.stop_publishing)
+            atexit.unregister(self.shutdown)
+        self._uninstall_sigterm_handler()
+        self._uninstall_level_signal_handler()
         self.flush()
         if self._std_logging_handler is not None:
             self._std_logging_handler.close()
             self._std_logging_handler = None
 
+    def shutdown(self, timeout_secs: float | None = None) -> ShutdownReport:
+        """
+        Stop publishing and drain everything collected so far with a hard
+        deadline. ERROR and CRITICAL envelopes are sent first. Whatever cannot
+        be sent before the deadline is spilled to local storage (if configured)
+        or dropped. Calling it more than once returns the first report.
+
+        :param timeout_secs: drain deadline in seconds;
+            :attr:`Options.shutdown_timeout_secs` is used when not given
+        """
+        with self._shutdown_lock:
+            if self._shutdown_report is None:
+                self._shutdown_report = self._shutdown(timeout_secs)
+            return self._shutdown_report
+
+    def _shutdown(self, timeout_secs: float | None) -> ShutdownReport:
+        start = time.monotonic()
+        timeout = self._options.shutdown_timeout_secs if timeout_secs is None else timeout_secs
+        deadline = start + max(0.0, timeout)
+
+        scheduler = self._publishing
+        if scheduler is not None:
+            self._buffer.on_priority = None
+            self._buffer.on_pressure = None
+            scheduler.cancel()
+            self._publishing = None
+            if scheduler is not threading.current_thread():
+                # a flush in progress would race the drain below for the buffer
+                scheduler.join(max(0.0, deadline - time.monotonic()))
+        if self._options.use_atexit:
+            atexit.unregister(self.shutdown)
+        self._uninstall_sigterm_handler()
+        self._uninstall_level_signal_handler()
+        if self._std_logging_handler is not None:
+            self._std_logging_handler.flush()
+            self._std_logging_handler.close()
+            self._std_logging_handler = None
+
+        self._collect(gauge_timeout_secs=min(self._options.gauge_timeout_secs, max(0.0, deadline - time.monotonic())))
+        if self._gauge_executor is not None:
+            self._gauge_executor.shutdown(wait=False, cancel_futures=True)
+            self._gauge_executor = None
+        pending = self._buffer.take_all()
+        try:
+            drained = self._publisher.drain(pending, deadline)
+        except RuntimeError:
+            drained = DrainResult(0, _drain_queue(pending), 0)
+        finally:
+            self._publisher.close()
+            if self._shared_counters is not None:
+                self._shared_counters.close()
+            if self._runtime_metrics is not None:
+                self._runtime_metrics.close()
+
+        spilled = 0
+        if drained.unsent and self._options.use_local_storage and self._options.local_storage_path:
+            spilled = spill_to_local_storage(drained.unsent, self._options.local_storage_path)
+        with self._publishing_count_lock:
+            in_flight = drained.in_flight + self._publishing_count
+        dropped = len(drained.unsent) - spilled + in_flight
+        return ShutdownReport(
+            sent=drained.sent,
+            spilled=spilled,
+            dropped=dropped,
+            elapsed_secs=time.monotonic() - start,
+        )
+
+    def _install_sigterm_handler(self) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            return  # signal handlers can be installed only from the main thread
+        self._prev_sigterm = signal.signal(signal.SIGTERM, self._on_sigterm)
+        self._sigterm_installed = True
+        self._start_sigterm_watcher()
+
+    def _start_sigterm_watcher(self) -> None:
+        self._sigterm_received = False
+        self._sigterm_event = threading.Event()
+        threading.Thread(target=self._watch_sigterm, name="easytelemetry-sigterm", daemon=True).start()
+
+    def _uninstall_sigterm_handler(self) -> None:
+        if not self._sigterm_installed:
+            return
+        self._sigterm_event.set()  # let the watcher thread finish
+        if threading.current_thread() is threading.main_thread():
+            if signal.getsignal(signal.SIGTERM) == self._on_sigterm:
+                signal.signal(signal.SIGTERM, self._prev_sigterm or signal.SIG_DFL)
+            self._sigterm_installed = False
+
+    def _on_sigterm(self, signum: int, frame: FrameType | None) -> None:
+        """
+        The handler runs in the main thread between any two bytecodes,
+        possibly while the thread holds a lock of the buffer, so it only
+        wakes the watcher thread draining the buffer. Once drained, the watcher
+        raises the signal in the main thread again, which passes it on.
+        """
+        if self._shutdown_report is None:
+            self._sigterm_received = True
+            self._sigterm_event.set()
+            return
+        prev = self._prev_sigterm
+        self._uninstall_sigterm_handler()
+        if callable(prev):
+            prev(signum, frame)
+        elif prev == signal.SIG_DFL:
+            # let the default action (termination) take place
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    def _watch_sigterm(self) -> None:
+        self._sigterm_event.wait()
+        if self._sigterm_received:
+            self.shutdown()
+            _thread.interrupt_main(signal.SIGTERM)
+
     def flush(self) -> FlushT:
         try:
             if self._std_logging_handler is not None:
                 self._std_logging_handler.flush()
-            if self._queue.qsize() <= 0:
+            self._collect()
+            if self._buffer.is_empty():
                 return None, None
-            results = self._publisher.publish(self._queue)
+            results = self._publish(_queue_of(_drain_queue(self._buffer.priority)))
+            results += self._publish(_queue_of(_drain_queue(self._buffer.queue)))
+            self._record_results(results)
             success = all(x.success for x in results)
             errors = None if success else [x.exception for x in results if x.exception is not None]
             return success, errors
         except RuntimeError as e:
             return False, [e]
 
+    def _install_level_signal_handler(self, signum: int) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            return  # signal handlers can be installed only from the main thread
+        self._prev_level_signal = signal.signal(signum, self._on_level_signal)
+        self._level_signal_installed = True
+        self._start_level_signal_watcher()
+
+    def _start_level_signal_watcher(self) -> None:
+        self._level_toggles = 0
+        self._level_signal_event = event = threading.Event()
+        threading.Thread(
+            target=self._watch_level_signal, args=(event,), name="easytelemetry-levels", daemon=True
+        ).start()
+
+    def _uninstall_level_signal_handler(self) -> None:
+        signum = self._options.log_levels_signal
+        if not self._level_signal_installed or signum is None:
+            return
+        event, self._level_signal_event = self._level_signal_event, None
+        if event is not None:
+            event.set()  # let the watcher thread finish
+        if threading.current_thread() is threading.main_thread():
+            if signal.getsignal(signum) == self._on_level_signal:
+                signal.signal(signum, self._prev_level_signal or signal.SIG_DFL)
+            self._level_signal_installed = False
+
+    def _on_level_signal(self, signum: int, frame: FrameType | None) -> None:  # noqa: ARG002
+        """
+        The handler may interrupt the main thread while it holds a lock of
+        the loggers, so it only counts the signal and wakes the watcher thread,
+        which toggles the levels.
+        """
+        event = self._level_signal_event
+        if event is not None:
+            self._level_toggles += 1
+            event.set()
+
+    def _watch_level_signal(self, event: threading.Event) -> None:
+        applied = 0
+        while True:
+            event.wait()
+            event.clear()
+            if self._level_signal_event is not event:
+                return
+            toggles = self._level_toggles
+            if (toggles - applied) % 2:
+                self._toggle_debug_levels()
+            applied = toggles
+
+    def _toggle_debug_levels(self) -> None:
+        """Toggle DEBUG level of all loggers; toggling back restores previous overrides."""
+        prev = self._debug_toggled_from
+        if prev is None:
+            current = self._level_overrides
+            self.set_log_levels({"*": Level.DEBUG})
+            self._debug_toggled_from = current
+        else:
+            self.set_log_levels(prev.as_dict())
+
+    def _on_interval(self) -> None:
+        self._poll_levels()
+        self._check_memory_pressure()
+        if self._buffer.governor is not None:
+            self._buffer.governor.evaluate()
+        self.flush()
+
+    def _poll_levels(self) -> None:
+        """Apply level overrides from :attr:`Options.log_levels_path` if the file has changed."""
+        if self._level_watcher is None:
+            return
+        try:
+            levels = self._level_watcher.poll()
+        except (OSError, ValueError) as e:
+            self._diagnostic(f"cannot read log levels from {self._level_watcher.path}: {e}")
+            return
+        if levels is not None:
+            self.set_log_levels(levels)
+
+    def _diagnostic(self, msg: str, **kwargs: Any) -> None:
+        """
+        Report a problem of the telemetry itself as a warning of the logger
+        named :data:`DIAGNOSTICS_LOGGER`.
+        """
+        with contextlib.suppress(Exception):
+            self._diagnostics.warn(msg.replace("%", "%%"), **kwargs)
+
+    def _on_cardinality_exceeded(self, name: str, estimate: int) -> None:
+        limit = self._options.metric_max_cardinality
+        self._diagnostic(
+            f"metric {name} has more than {limit} combinations of properties (about {estimate}); "
+            + f"values of further combinations are replaced by {OTHER}",
+            metric=name,
+        )
+
+    def _check_memory_pressure(self) -> None:
+        """
+        Shrink the byte budget of the buffer proportionally to the memory left
+        in the container once its usage reaches :attr:`Options.memory_pressure_threshold`
+        and publish early. Without :attr:`Options.queue_max_bytes`, the budget
+        under pressure is derived from the memory limit of the container.
+        Called every interval and by the buffer whenever it grows by
+        :data:`MEMORY_PRESSURE_CHECK_BYTES` (or a quarter of its budget) since the last check.
+        """
+        memory = self._cgroup_memory
+        if memory is None or self._options.memory_pressure_threshold is None:
+            return
+        if not self._memory_check_lock.acquire(blocking=False):
+            return  # another thread is checking
+        try:
+            self._update_memory_pressure(memory, self._options.memory_pressure_threshold)
+        finally:
+            buffer = self._buffer
+            buffer.memory_check_at = buffer.used_bytes() + min(
+                MEMORY_PRESSURE_CHECK_BYTES, buffer.max_bytes // 4 or MEMORY_PRESSURE_CHECK_BYTES
+            )
+            self._memory_check_lock.release()
+
+    def _update_memory_pressure(self, memory: CgroupMemory, threshold: float) -> None:
+        ratio = memory.usage_ratio()
+        if ratio is None:
+            return
+        pressure = ratio >= threshold
+        budget = self._options.queue_max_bytes or 0
+        if pressure:
+            if not budget:
+                budget = int((memory.limit_bytes() or 0) * MEMORY_PRESSURE_BUDGET_RATIO)
+            headroom = min(1.0, max(0.1, (1 - ratio) / (1 - threshold)))
+            self._buffer.max_bytes = int(budget * headroom)
+        else:
+            self._buffer.max_bytes = budget
+        if pressure != self._memory_pressure:
+            self._memory_pressure = pressure
+            if pressure and self._publishing is not None:
+                self._publishing.flush_soon()
+            state = "is near its limit" if pressure else "is no longer near its limit"
+            max_bytes = self._buffer.max_bytes
+            self._diagnostic(
+                f"container memory {state} ({ratio:.0%} used); "
+                + (f"buffer budget {max_bytes} bytes" if max_bytes else "buffer is not limited by size"),
+                memory_usage=round(ratio, 3),
+            )
+
+    def _on_overhead_transition(self, prev: Stage, stage: Stage, ratio: float) -> None:
+        budget = self._options.overhead_budget or 0
+        if stage > prev:
+            reason = f"telemetry overhead {ratio:.2%} of wall time is over the budget {budget:.2%}"
+        else:
+            reason = f"telemetry overhead {ratio:.2%} of wall time is well under the budget {budget:.2%}"
+        self._diagnostic(f"{reason}; {describe_stage(stage)}", overhead_stage=stage.name)
+
+    def _collect(self, gauge_timeout_secs: float | None = None) -> None:
+        """Put envelopes produced by collectors (e.g. shared counters) and gauges into the buffer."""
+        for collect in self._collectors:
+            with contextlib.suppress(Exception):
+                for envelope in collect():
+                    self._buffer.put(envelope)
+        with contextlib.suppress(Exception):
+            for envelope in self._collect_gauges(gauge_timeout_secs):
+                self._buffer.put(envelope)
+
+    def _collect_aggregates(self) -> list[p.Envelope]:
+        envelopes = []
+        for agg in list(self._aggregates.values()):
+            envelope = agg.take()
+            if envelope is not None:
+                envelopes.append(envelope)
+        return envelopes
+
+    def _collect_gauges(self, timeout_secs: float | None = None) -> list[p.Envelope]:
+        """
+        Call gauge callbacks concurrently and wait for them at most
+        :attr:`Options.gauge_timeout_secs` (or the given timeout). A callback
+        still running from a previous interval is not called again until
+        it returns. When such callbacks occupy every worker, the workers
+        are left to them and others are called on new ones.
+        """
+        if not self._gauges:
+            return []
+        timeout = self._options.gauge_timeout_secs if timeout_secs is None else timeout_secs
+        gauges = list(self._gauges.values())
+        executor = self._gauge_workers(gauges)
+        started = [x for x in gauges if x.start(executor)]
+        if not started:
+            return []
+        cf.wait([x.pending for x in started if x.pending], timeout=timeout)
+        envelopes = []
+        for gauge in started:
+            try:
+                envelope = gauge.take()
+            except cf.TimeoutError:
+                self._diagnostic(
+                    f"gauge {gauge.name} did not return within {timeout:.3g} s",
+                    gauge=gauge.name,
+                )
+            except Exception as e:
+                if gauge.failures == 1:
+                    self._diagnostic(f"gauge {gauge.name} failed: {e!r}", gauge=gauge.name)
+            else:
+                if envelope is not None:
+                    envelopes.append(envelope)
+        return envelopes
+
+    def _gauge_workers(self, gauges: list[_Gauge]) -> cf.ThreadPoolExecutor:
+        """Return the gauge executor, replacing it when callbacks which did not return occupy all its workers."""
+        executor = self._gauge_executor
+        if executor is not None:
+            hung = [x.name for x in gauges if x.is_running_on(executor)]
+            if len(hung) >= _GAUGE_WORKERS:
+                self._diagnostic(
+                    f"gauge workers are saturated by callbacks which did not return: {', '.join(hung)}",
+                    gauges=",".join(hung),
+                )
+                executor.shutdown(wait=False, cancel_futures=True)  # queued callbacks are called on new workers
+                executor = None
+        if executor is None:
+            executor = cf.ThreadPoolExecutor(max_workers=_GAUGE_WORKERS, thread_name_prefix="easytelemetry-gauge")
+            self._gauge_executor = executor
+        return executor
+
+    def _flush_priority(self) -> None:
+        """
+        Publish a small batch of high-priority envelopes ahead of the next
+        regular flush, unless the rate of such expedited sends is exhausted.
+        """
+        if self._buffer.priority.qsize() <= 0 or not self._priority_sends.take():
+            return
+        batch: Queue[p.Envelope] = Queue()
+        for _ in range(self._options.priority_batch_maxsize):
+            try:
+                batch.put_nowait(self._buffer.priority.get_nowait())
+            except Empty:
+                break
+        with contextlib.suppress(RuntimeError):
+            self._record_results(self._publish(batch))
+
+    def _publish(self, batch: Queue[p.Envelope]) -> list[p.PublishResult]:
+        """
+        Publish envelopes already taken out of the buffer. Until the publisher
+        returns they are counted as in flight, so a shutdown that cannot wait
+        for them reports them as dropped.
+        """
+        count = batch.qsize()
+        if count == 0:
+            return []
+        with self._publishing_count_lock:
+            self._publishing_count += count
+        try:
+            return self._publisher.publish(batch)
+        finally:
+            with self._publishing_count_lock:
+                self._publishing_count -= count
+
+    def _record_results(self, results: list[p.PublishResult]) -> None:
+        stats = self._stats
+        for r in results:
+            stats.incr(Counter.BATCHES)
+            stats.incr(Counter.SENT, r.accepted)
+            stats.incr(Counter.FAILED, r.count - r.accepted)
+            if r.attempt > 1:
+                stats.incr(Counter.RETRIES, r.attempt - 1)
+            if r.body_bytes:
+                stats.incr(Counter.BYTES_SERIALIZED, r.body_bytes)
+                stats.incr(Counter.BYTES_SENT, r.wire_bytes)
+                stats.observe(Histogram.SERIALIZE_MS, r.serialize_ms)
+                stats.observe(Histogram.HTTP_MS, r.http_ms)
+            if r.count:
+                stats.observe(Histogram.BATCH_SIZE, r.count)
+
+    def _collect_stats(self) -> list[p.Envelope]:
+        """Return metric envelopes with pipeline statistics since the previous collection."""
+        current = self.stats()
+        prev = self._stats_reported
+        self._stats_reported = current
+        properties = str_dict(self._global_props)
+        points = [p.DataPoint(name="queue_depth", value=current.queue_depth, ns=STATS_NAMESPACE)]
+        for name, value in current.counters.items():
+            delta = value - (prev.counters[name] if prev else 0)
+            points.append(p.DataPoint(name=name, value=delta, ns=STATS_NAMESPACE))
+        for name, h in current.histograms.items():
+            count = h.count - (prev.histograms[name].count if prev else 0)
+            if count > 0:
+                total = h.sum - (prev.histograms[name].sum if prev else 0.0)
+                points.append(
+                    p.DataPoint(
+                        name=name,
+                        value=total,
+                        ns=STATS_NAMESPACE,
+                        kind=p.DataPointKind.AGGREGATION,
+                        count=count,
+                    )
+                )
+        return [p.MetricData([x], properties=properties).to_envelope() for x in points]
+
+    def _after_fork_in_child(self) -> None:
+        """
+        Make the instance usable in a forked child process. Parent's pending
+        envelopes are discarded (the parent publishes them), and the buffer,
+        the publisher and the scheduler are recreated, because their locks
+        and threads are not valid in the child.
+        """
+        self._buffer.reset()
+        self._stats.after_fork()
+        self._stats_reported = None
+        self._loggers.after_fork()
+        self._metrics.after_fork()
+        for _, metric in self._metrics.items():
+            metric.after_fork()
+        for agg in self._aggregates.values():
+            agg.reset()
+        self._gauge_executor = None
+        for gauge in self._gauges.values():
+            gauge.pending = None
+        self._priority_sends = _TokenBucket(self._options.priority_max_sends_per_sec)
+        if self._role_instance is not None:
+            self._buffer.tags[p.TagKey.CLOUD_ROLE_INSTANCE] = f"{self._role_instance}:{os.getpid()}"
+        self._publisher.after_fork()
+        if self._std_logging_handler is not None:
+            self._std_logging_handler.after_fork()
+        if self._shared_counters is not None and self._shutdown_report is None:
+            self._shared_counters.after_fork()
+        if self._runtime_metrics is not None:
+            self._runtime_metrics.after_fork()
+        self._shutdown_lock = threading.Lock()
+        self._memory_check_lock = threading.Lock()
+        self._publishing_count = 0  # the parent publishes what its flush has taken
+        self._publishing_count_lock = threading.Lock()
+        self._restart_threads_after_fork()
+
+    def _restart_threads_after_fork(self) -> None:
+        """Threads of the parent do not exist in the child; start those the parent had."""
+        if self._publishing is not None and self._shutdown_report is None:
+            self._start_scheduler()
+        else:
+            self._publishing = None
+        if self._sigterm_installed and self._shutdown_report is None:
+            self._start_sigterm_watcher()
+        if self._level_signal_event is not None:
+            self._start_level_signal_watcher()
+
     def __enter__(self) -> AppInsightsTelemetry:
         self.start_publishing()
         return self
@@ -359,8 +1122,7 @@ class AppInsightsTelemetry(Telemetry):
         exc_val: BaseException | None,
         exc_tb: TracebackType | None,
     ) -> None:
-        self.stop_publishing()
-        self._publisher.close()
+        self.shutdown()
 
     def __str__(self) -> str:
         return f"AppInsightsTelemetry: name={self._name})"
@@ -372,12 +1134,16 @@ class AppInsightsLogger(Logger):
         name: str,
         min_level: Level,
         props: PropsT,
-        queue: Queue,
+        buffer: _Buffer,
     ):
         self._name = name
         self._level = min_level
         self._props = props if name == "_root" else {"logger": name, **props}
-        self._queue = queue
+        self._str_props = str_dict(self._props)
+        self._buffer = buffer
+        self._children: weakref.WeakSet[AppInsightsLogger] | None = None
+        self._children_lock = threading.Lock()  # shared by bind() and the level setter
+        self._bind_level_methods()
 
     @property
     def name(self) -> str:
@@ -387,6 +1153,23 @@ class AppInsightsLogger(Logger):
     def level(self) -> Level:
         return self._level
 
+    @level.setter
+    def level(self, value: Level) -> None:
+        with self._children_lock:  # a child bound meanwhile gets the new level
+            self._level = value
+            self._bind_level_methods()
+            children = list(self._children) if self._children else []
+        for child in children:
+            child.level = value
+
+    def bind(self, **kwargs: Any) -> Logger:
+        with self._children_lock:
+            child = type(self)(self._name, self._level, self._props | kwargs, self._buffer)
+            if self._children is None:
+                self._children = weakref.WeakSet()
+            self._children.add(child)
+        return child
+
     def _enqueue(
         self,
         severity: p.SeverityLevel,
@@ -395,14 +1178,13 @@ class AppInsightsLogger(Logger):
         props: PropsT | None,
     ) -> None:
         message = msg % args
-        properties = merge_props(self._props, props)
         data = p.MessageData(
             message=message,
             severityLevel=severity,
-            properties=str_dict(properties),
+            properties=self._str_props | str_dict(props) if props else self._str_props,
         )
         envelope = data.to_envelope()
-        self._queue.put_nowait(envelope)
+        self._buffer.put(envelope, severity)
 
     def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
         if self._level <= Level.DEBUG:
@@ -436,32 +1218,146 @@ class AppInsightsLogger(Logger):
     ) -> None:
         if self._level > level:
             return
-        props = merge_props(self._props, kwargs)
         data = p.ExceptionData.create(
             ex=ex,
             level=_level_to_severity(level),
-            properties=str_dict(props),
+            properties=self._str_props | str_dict(kwargs),
         )
         envelope = data.to_envelope()
-        self._queue.put_nowait(envelope)
+        self._buffer.put(envelope, data.severityLevel)
+
+    def log_record(self, record: logging.LogRecord) -> None:
+        """
+        Convert the record straight into an envelope. The logger's properties
+        are stringified once, caller info is taken from the record and the
+        message is formatted only when the record passes the level.
+        """
+        levelno = record.levelno
+        if levelno < self._level and levelno < logging.CRITICAL:
+            return
+        severity = _std_level_to_severity(levelno)
+        props = self._str_props | {
+            "path": record.pathname,
+            "line": str(record.lineno),
+            "module": record.module,
+        }
+        if record.funcName and record.funcName != "<module>":
+            props["func"] = record.funcName
+        data: p.MessageData | p.ExceptionData
+        ex = record.exc_info[1] if record.exc_info else None
+        if ex is not None:
+            if record.stack_info:
+                props["stack"] = record.stack_info
+            data = p.ExceptionData.create(ex=ex, level=severity, properties=props)
+        else:
+            data = p.MessageData(message=record.getMessage(), severityLevel=severity, properties=props)
+        op = getattr(record, "easytelemetry_operation", None)
+        envelope = data.to_envelope(None if op is None else self._buffer.operation_tags(op))
+        envelope.time = datetime.fromtimestamp(record.created, UTC)
+        self._buffer.put(envelope, severity)
 
     def __str__(self) -> str:
         return f"{self._name}:{self._level}"
 
 
+class _GovernedLogger(AppInsightsLogger):
+    """
+    Logger measuring time spent in its calls and degrading them
+    as the :class:`OverheadGovernor` of the buffer says.
+    """
+
+    def _log(self, severity: p.SeverityLevel, msg: str, args: Any, kwargs: PropsT) -> None:
+        start = time.perf_counter_ns()
+        governor: OverheadGovernor = self._buffer.governor  # type: ignore[assignment]
+        if governor.admit(severity):
+            props = create_props(kwargs, 4) if governor.capture_caller else kwargs
+            self._enqueue(severity, msg, args, props)
+        governor.spent(time.perf_counter_ns() - start)
+
+    def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self._level <= Level.DEBUG:
+            self._log(p.SeverityLevel.VERBOSE, msg, args, kwargs)
+
+    def info(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self._level <= Level.INFO:
+            self._log(p.SeverityLevel.INFORMATION, msg, args, kwargs)
+
+    def warn(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self._level <= Level.WARN:
+            self._log(p.SeverityLevel.WARNING, msg, args, kwargs)
+
+    def error(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self._level <= Level.ERROR:
+            self._log(p.SeverityLevel.ERROR, msg, args, kwargs)
+
+    def critical(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self._log(p.SeverityLevel.CRITICAL, msg, args, kwargs)
+
+    def exception(
+        self,
+        ex: BaseException,
+        level: Level = Level.ERROR,
+        **kwargs: Any,
+    ) -> None:
+        start = time.perf_counter_ns()
+        super().exception(ex, level, **kwargs)
+        self._buffer.governor.spent(time.perf_counter_ns() - start)  # type: ignore[union-attr]
+
+    def log_record(self, record: logging.LogRecord) -> None:
+        start = time.perf_counter_ns()
+        governor: OverheadGovernor = self._buffer.governor  # type: ignore[assignment]
+        if governor.admit(_std_level_to_severity(record.levelno)):
+            super().log_record(record)
+        governor.spent(time.perf_counter_ns() - start)
+
+
 class _Metric:
-    def __init__(self, name: str, props: PropsT, queue: Queue):
+    def __init__(
+        self,
+        name: str,
+        props: PropsT,
+        buffer: _Buffer,
+        max_cardinality: int = 0,
+        on_cardinality_exceeded: Callable[[str, int], None] | None = None,
+    ):
         self._name = name
         self._props = props
-        self._queue = queue
+        self._buffer = buffer
+        self._max_cardinality = max_cardinality
+        self._on_cardinality_exceeded = on_cardinality_exceeded
+        self._guard: CardinalityGuard | None = None
+        # taken only when the guard is created and when the limit is hit first
+        self._guard_lock = threading.Lock()
+        self._exceeded = False
 
     @property
     def name(self) -> str:
         return self._name
 
+    def after_fork(self) -> None:
+        self._guard_lock = threading.Lock()
+
     def track_extra(self, value: int | float, extra: PropsT) -> None:
+        if extra and self._max_cardinality > 0:
+            extra = self._admit(extra)
         self._track(value, self._props | extra)
 
+    def _admit(self, extra: PropsT) -> PropsT:
+        guard = self._guard
+        if guard is None:
+            with self._guard_lock:
+                if self._guard is None:
+                    self._guard = CardinalityGuard(self._max_cardinality)
+                guard = self._guard
+        admitted = guard.admit(extra)
+        if admitted is not extra and not self._exceeded:
+            with self._guard_lock:
+                first = not self._exceeded
+                self._exceeded = True
+            if first and self._on_cardinality_exceeded is not None:
+                self._on_cardinality_exceeded(self._name, guard.estimate())
+        return admitted
+
     def track(self, value: int | float) -> None:
         self._track(value, self._props)
 
@@ -471,12 +1367,149 @@ class _Metric:
             value=value,
             properties=str_dict(props),
         ).to_envelope()
-        self._queue.put_nowait(envelope)
+        self._buffer.put(envelope)
 
     def __str__(self) -> str:
         return self._name
 
 
+_GAUGE_WORKERS = 4
+
+
+class _Gauge:
+    """Metric whose value is read by calling a callback when it is collected."""
+
+    __slots__ = ("_callback", "_executor", "_name", "_props", "failures", "pending")
+
+    def __init__(self, name: str, callback: GaugeCallbackT, props: dict[str, str]):
+        self._name = name
+        self._callback = callback
+        self._props = props
+        self.failures = 0
+        self.pending: cf.Future[int | float | None] | None = None
+        self._executor: cf.Executor | None = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def start(self, executor: cf.Executor) -> bool:
+        """Submit the callback unless the previous call is still running."""
+        if self.pending is not None and not self.pending.done():
+            return False
+        self.pending = executor.submit(self._callback)
+        self._executor = executor
+        return True
+
+    def is_running_on(self, executor: cf.Executor) -> bool:
+        """Tell whether the callback occupies a worker of the executor."""
+        return self._executor is executor and self.pending is not None and self.pending.running()
+
+    def take(self) -> p.Envelope | None:
+        """
+        Return the value of the finished callback as a metric envelope,
+        None if the callback returned None.
+
+        :raises concurrent.futures.TimeoutError: when the callback is still running
+        :raises Exception: the exception raised by the callback
+        """
+        future = self.pending
+        if future is None or not future.done():
+            raise cf.TimeoutError
+        self.pending = None
+        try:
+            value = future.result()
+        except Exception:
+            self.failures += 1
+            raise
+        self.failures = 0
+        if value is None:
+            return None
+        point = p.DataPoint(
+            name=self._name,
+            value=value,
+            kind=p.DataPointKind.AGGREGATION,
+            count=1,
+            min=value,
+            max=value,
+            stdDev=0.0,
+        )
+        return p.MetricData([point], properties=self._props).to_envelope()
+
+    def __str__(self) -> str:
+        return self._name
+
+
+class _Aggregate:
+    """
+    Metric whose values are only accumulated (count, sum, min, max and sum
+    of squares) until they are taken as a single aggregated data point.
+    """
+
+    __slots__ = ("_count", "_lock", "_max", "_min", "_name", "_props", "_sum", "_sum_sq")
+
+    def __init__(self, name: str, props: dict[str, str]):
+        self._name = name
+        self._props = props
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard accumulated values (and recreate the lock, e.g. in a forked child)."""
+        self._lock = threading.Lock()
+        self._count = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+
+    def track(self, value: int | float) -> None:
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            self._sum_sq += value * value
+            if value < self._min:
+                self._min = value
+            if value > self._max:
+                self._max = value
+
+    def take(self) -> p.Envelope | None:
+        """Return accumulated values as a metric envelope and start over; None if nothing was tracked."""
+        with self._lock:
+            count, total, total_sq = self._count, self._sum, self._sum_sq
+            low, high = self._min, self._max
+            self._count = 0
+            self._sum = self._sum_sq = 0.0
+            self._min, self._max = math.inf, -math.inf
+        if count == 0:
+            return None
+        mean = total / count
+        point = p.DataPoint(
+            name=self._name,
+            value=total,
+            kind=p.DataPointKind.AGGREGATION,
+            count=count,
+            min=low,
+            max=high,
+            stdDev=math.sqrt(max(total_sq / count - mean * mean, 0.0)),
+        )
+        return p.MetricData([point], properties=self._props).to_envelope()
+
+    def __str__(self) -> str:
+        return self._name
+
+
+def _std_level_to_severity(levelno: int) -> p.SeverityLevel:
+    if levelno >= logging.CRITICAL:
+        return p.SeverityLevel.CRITICAL
+    if levelno >= logging.ERROR:
+        return p.SeverityLevel.ERROR
+    if levelno >= logging.WARNING:
+        return p.SeverityLevel.WARNING
+    if levelno >= logging.INFO:
+        return p.SeverityLevel.INFORMATION
+    return p.SeverityLevel.VERBOSE
+
+
 def _level_to_severity(level: Level) -> p.SeverityLevel:
     if level == level.DEBUG:
         return p.SeverityLevel.VERBOSE
@@ -491,10 +1524,313 @@ def _level_to_severity(level: Level) -> p.SeverityLevel:
     return p.SeverityLevel.INFORMATION
 
 
+class _SizedQueue(Queue[p.Envelope]):
+    """Queue keeping the estimated size of its envelopes in bytes."""
+
+    def _init(self, maxsize: int) -> None:
+        super()._init(maxsize)
+        self.bytes = 0
+        self._sizes: deque[int] = deque()
+
+    def _put(self, item: p.Envelope) -> None:
+        size = p.estimate_size(item)
+        self._sizes.append(size)
+        self.bytes += size
+        super()._put(item)
+
+    def _get(self) -> p.Envelope:
+        self.bytes -= self._sizes.popleft()
+        return super()._get()
+
+
+class _Buffer:
+    """
+    Envelopes waiting for publishing. High-priority envelopes (severity
+    at or above :attr:`Options.priority_level`) go to a separate lane,
+    which is published first and can be expedited ahead of regular flush.
+    Envelopes over the count or byte limit are dropped and counted; putting never raises.
+    """
+
+    def __init__(self, options: Options, tags: dict[str, str], stats: PipelineStats):
+        self.tags = tags
+        self.stats = stats
+        self.max_bytes = options.queue_max_bytes or 0
+        sized = self.max_bytes or options.memory_pressure_threshold
+        self._queue_type: type[Queue[p.Envelope]] = _SizedQueue if sized else Queue
+        self.queue: Queue[p.Envelope] = self._queue_type(maxsize=options.queue_maxsize)
+        self.priority: Queue[p.Envelope] = self._queue_type(maxsize=options.queue_maxsize)
+        self.on_priority: Callable[[], None] | None = None
+        self.on_pressure: Callable[[], None] | None = None
+        self.on_memory_check: Callable[[], None] | None = None
+        self.memory_check_at = 0  # estimated size at which on_memory_check is called next
+        self.governor: OverheadGovernor | None = None
+        self._sized = bool(sized)
+        self._maxsize = options.queue_maxsize
+        level = options.priority_level
+        self._threshold = _level_to_severity(level).value if level is not None else 1 << 30
+
+    def put(self, envelope: p.Envelope, severity: p.SeverityLevel | None = None) -> None:
+        if envelope.tags is None:
+            op = current_operation()
+            envelope.tags = self.tags if op is None else self.operation_tags(op)
+        priority = severity is not None and severity.value >= self._threshold
+        if self._sized and not self._check_bytes():
+            return
+        try:
+            (self.priority if priority else self.queue).put_nowait(envelope)
+        except Full:
+            self.stats.incr(Counter.DROPPED)
+            return
+        self.stats.incr(Counter.ENQUEUED)
+        if priority:
+            notify = self.on_priority
+            if notify is not None:
+                notify()
+
+    def _check_bytes(self) -> bool:
+        """
+        Drop the envelope (return False) when the estimated size of the buffered
+        envelopes reached the budget; ask for an early flush past half of it.
+        Memory pressure is checked once the size reaches :attr:`memory_check_at`.
+        """
+        used = self.used_bytes()
+        if used >= self.memory_check_at:
+            on_memory_check = self.on_memory_check
+            if on_memory_check is not None:
+                on_memory_check()
+        if not self.max_bytes:
+            return True
+        if used >= self.max_bytes:
+            self.stats.incr(Counter.DROPPED)
+            return False
+        if used >= self.max_bytes // 2:
+            on_pressure = self.on_pressure
+            if on_pressure is not None:
+                on_pressure()
+        return True
+
+    def used_bytes(self) -> int:
+        """
+        Estimated size of buffered envelopes (0 without :attr:`Options.queue_max_bytes`
+        and :attr:`Options.memory_pressure_threshold`).
+        """
+        if not isinstance(self.queue, _SizedQueue) or not isinstance(self.priority, _SizedQueue):
+            return 0
+        return self.queue.bytes + self.priority.bytes
+
+    def operation_tags(self, op: Operation) -> dict[str, str]:
+        """
+        Get tags for envelopes within the operation. They are built once
+        per operation and shared by all its envelopes.
+        """
+        cached = op.cache
+        if cached is not None and cached[0] is self.tags:
+            return cached[1]
+        tags = self.tags | {
+            p.TagKey.OPERATION_ID: op.operation_id,
+            p.TagKey.OPERATION_PARENT_ID: op.id,
+        }
+        if op.name:
+            tags[p.TagKey.OPERATION_NAME] = op.name
+        op.cache = (self.tags, tags)
+        return tags
+
+    def is_empty(self) -> bool:
+        return self.queue.qsize() <= 0 and self.priority.qsize() <= 0
+
+    def reset(self) -> None:
+        """Replace both lanes with new empty queues (their locks included)."""
+        self.queue = self._queue_type(maxsize=self._maxsize)
+        self.priority = self._queue_type(maxsize=self._maxsize)
+        self.on_priority = None
+        self.on_pressure = None
+        self.memory_check_at = 0
+
+    def take_all(self) -> Queue[p.Envelope]:
+        """Consume both lanes into a new queue keeping chronological order."""
+        pending = _drain_queue(self.priority) + _drain_queue(self.queue)
+        pending.sort(key=lambda x: x.time)
+        return _queue_of(pending)
+
+
+class _RegistryEntry(Generic[T]):  # noqa: UP046
+    __slots__ = ("pinned", "used", "value")
+
+    def __init__(self, value: T, pinned: bool):
+        self.value = value
+        self.pinned = pinned
+        self.used = False
+
+
+class _Registry(Generic[T]):  # noqa: UP046
+    """
+    Loggers or metrics by name. Reads are plain dictionary lookups without
+    a lock; only creation takes one. When the registry is full, idle entries
+    are evicted (second-chance approximation of LRU: an entry read since
+    the last eviction pass is moved to the end instead). Evicted loggers and
+    metrics keep working for whoever holds them; until they are garbage
+    collected, they are still reachable by name (weakly), so level changes
+    reach them and asking for the name again returns the same instance.
+    """
+
+    def __init__(self, maxsize: int, on_forget: Callable[[str], None] | None = None):
+        self._maxsize = maxsize
+        self._on_forget = on_forget
+        self._entries: dict[str, _RegistryEntry[T]] = {}
+        self._evicted: weakref.WeakValueDictionary[str, T] = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._uncounted = 0
+        self.evicted = 0
+
+    def get(self, name: str) -> T | None:
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        entry.used = True
+        return entry.value
+
+    def get_or_create(self, name: str, create: Callable[[], T]) -> T:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                if self._maxsize > 0 and len(self._entries) - self._uncounted >= self._maxsize:
+                    self._evict()
+                value = self._evicted.pop(name, None)
+                entry = _RegistryEntry(create() if value is None else value, pinned=False)
+                self._entries[name] = entry
+            return entry.value
+
+    def pin(self, name: str, value: T, counted: bool = True) -> None:
+        """Add an entry which is never evicted; unless counted, it does not take a place within the maximal size."""
+        with self._lock:
+            self._entries[name] = _RegistryEntry(value, pinned=True)
+            if not counted:
+                self._uncounted += 1
+
+    def names(self) -> list[str]:
+        return list(self._entries)
+
+    def items(self) -> list[tuple[str, T]]:
+        """Entries and the evicted values which are still referenced."""
+        with self._lock:
+            evicted = list(self._evicted.items())
+        return [(name, entry.value) for name, entry in list(self._entries.items())] + evicted
+
+    def describe(self) -> str:
+        return f"{len(self._entries) - self._uncounted} live (max {self._maxsize}), {self.evicted} evicted"
+
+    def after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def _evict(self) -> None:
+        entries = self._entries
+        for _ in range(2 * len(entries)):
+            if len(entries) - self._uncounted < self._maxsize:
+                return
+            name = next(iter(entries))
+            entry = entries.pop(name)
+            if entry.pinned or entry.used:
+                entry.used = False
+                entries[name] = entry
+            else:
+                self.evicted += 1
+                self._evicted[name] = entry.value
+                if self._on_forget is not None:
+                    weakref.finalize(entry.value, self._on_forget, name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _TokenBucket:
+    """Simple rate limiter allowing on average `rate` takes per second."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self._rate = rate
+        self._burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self._burst
+        self._last = time.monotonic()
+
+    def take(self) -> bool:
+        if self._rate <= 0:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class _Scheduler(threading.Thread):
+    """
+    Background (daemon) thread publishing telemetry in regular intervals.
+    It can be woken up by :meth:`notify` to expedite high-priority envelopes;
+    the wake-up is delayed a little, so a burst of errors goes out together.
+    """
+
+    def __init__(
+        self,
+        interval_secs: float,
+        delay_secs: float,
+        on_interval: Callable[[], Any],
+        on_priority: Callable[[], Any],
+    ):
+        super().__init__(name="easytelemetry-publishing", daemon=True)
+        self._interval = interval_secs
+        self._delay = delay_secs
+        self._on_interval = on_interval
+        self._on_priority = on_priority
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flush_requested = False
+
+    def notify(self) -> None:
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def flush_soon(self) -> None:
+        """Publish everything at the next wake-up instead of waiting for the interval."""
+        self._flush_requested = True
+        self.notify()
+
+    def cancel(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+    def run(self) -> None:
+        next_flush = time.monotonic() + self._interval
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=max(0.0, next_flush - time.monotonic()))
+            if self._stopped.is_set():
+                return
+            if self._wakeup.is_set():
+                if self._stopped.wait(self._delay):
+                    return
+                self._wakeup.clear()
+                with contextlib.suppress(Exception):
+                    self._on_priority()
+            if self._flush_requested or time.monotonic() >= next_flush:
+                self._flush_requested = False
+                with contextlib.suppress(Exception):
+                    self._on_interval()
+                next_flush = time.monotonic() + self._interval
+
+
 class Publisher(Protocol):
     def publish(self, source: Queue[p.Envelope]) -> list[p.PublishResult]:
         pass
 
+    def drain(self, source: Queue[p.Envelope], deadline: float) -> DrainResult:
+        pass
+
+    def after_fork(self) -> None:
+        pass
+
     def close(self) -> None:
         pass
 
@@ -517,11 +1853,24 @@ class DefaultPublisher:
             self._executor = executor
             self._owns_executor = False
         else:
-            workers = (
-                options.max_publishing_workers if options.max_publishing_workers else min(8, (os.cpu_count() or 1) + 1)
-            )
-            self._executor = cf.ThreadPoolExecutor(max_workers=workers)
+            self._executor = self._create_executor()
             self._owns_executor = True
+        self._drained = False
+
+    def _create_executor(self) -> cf.ThreadPoolExecutor:
+        opts = self._options
+        workers = opts.max_publishing_workers if opts.max_publishing_workers else min(8, (os.cpu_count() or 1) + 1)
+        return cf.ThreadPoolExecutor(max_workers=workers)
+
+    def after_fork(self) -> None:
+        """
+        Replace the executor in a forked child process; worker threads
+        of the parent's executor (even the one passed from outside)
+        do not exist in the child.
+        """
+        self._executor = self._create_executor()
+        self._owns_executor = True
+        self._drained = False
 
     def publish(self, source: Queue[p.Envelope]) -> list[p.PublishResult]:
         """
@@ -539,13 +1888,75 @@ class DefaultPublisher:
 
     def _send_batch(self, batch: Sequence[p.Envelope]) -> p.PublishResult:
         url = self._options.connection.ingestion_endpoint
-        result = p.send_batch(batch, url)
+        result = p.send_batch(batch, url, ndjson=self._options.ndjson)
         if not result.success:
             self._on_failure(batch, result)
         return result
 
-    def close(self) -> None:
+    def drain(self, source: Queue[p.Envelope], deadline: float) -> DrainResult:
+        """
+        Consume the source (queue) and publish as much as possible
+        until the deadline (:func:`time.monotonic` based).
+        ERROR and CRITICAL envelopes are published first.
+        Batches are attempted only once and the publisher is not usable
+        for publishing afterward.
+        """
+        pending = _drain_queue(source)
+        pending.sort(key=_envelope_priority)
+        ikey = self._options.connection.instrumentation_key
+        for envelope in pending:
+            envelope.iKey = ikey
+            envelope.seq = str(time.time_ns() // 1_000_000)
+        futures: dict[cf.Future[p.PublishResult], list[p.Envelope]] = {}
+        size = self._options.batch_maxsize
+        not_submitted: list[p.Envelope] = []
+        for i in range(0, len(pending), size):
+            batch = pending[i : i + size]
+            try:
+                f = self._executor.submit(self._send_batch_until, batch, deadline)
+            except RuntimeError:  # the executor has been shut down, e.g. at interpreter exit
+                not_submitted = pending[i:]
+                break
+            futures[f] = batch
+
+        sent = 0
+        unsent_inline: list[p.Envelope] = []
+        # batches the executor did not take are sent one by one on this thread
+        for i in range(0, len(not_submitted), size):
+            batch = not_submitted[i : i + size]
+            r = self._send_batch_until(batch, deadline)
+            sent += len(batch) - len(r.unsent)
+            unsent_inline.extend(r.unsent)  # type: ignore[arg-type]
+
+        timeout = max(0.0, deadline - time.monotonic())
+        done, _ = cf.wait(futures, timeout=timeout)
+        unsent: list[p.Envelope] = []
+        in_flight = 0
+        for f, batch in futures.items():  # submission order keeps priority order
+            if f in done:
+                rejected = batch if f.exception() else f.result().unsent
+                sent += len(batch) - len(rejected)
+                unsent.extend(rejected)  # type: ignore[arg-type]
+            elif f.cancel():
+                unsent.extend(batch)
+            else:
+                in_flight += len(batch)
+        unsent.extend(unsent_inline)
+
+        self._drained = True
         if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        return DrainResult(sent, unsent, in_flight)
+
+    def _send_batch_until(self, batch: Sequence[p.Envelope], deadline: float) -> p.PublishResult:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return p.PublishResult(False, p.UNSPECIFIED_ERROR, count=len(batch), unsent=list(batch))
+        url = self._options.connection.ingestion_endpoint
+        return p.send_batch(batch, url, max_attempts=1, timeout_secs=remaining, ndjson=self._options.ndjson)
+
+    def close(self) -> None:
+        if self._owns_executor and not self._drained:
             self._executor.shutdown(wait=True)
 
     def _on_failure(
@@ -581,6 +1992,61 @@ def _create_batches(
             return
 
 
+_live_instances: weakref.WeakSet[AppInsightsTelemetry] = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    for ait in list(_live_instances):
+        ait._after_fork_in_child()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _drain_queue(source: Queue[p.Envelope]) -> list[p.Envelope]:
+    """Consume everything the source (queue) contains at the moment."""
+    items: list[p.Envelope] = []
+    while True:
+        try:
+            items.append(source.get_nowait())
+        except Empty:
+            return items
+
+
+def _queue_of(items: list[p.Envelope]) -> Queue[p.Envelope]:
+    """Put the items into a new unbounded queue."""
+    result: Queue[p.Envelope] = Queue()
+    for item in items:
+        result.put_nowait(item)
+    return result
+
+
+def _envelope_priority(envelope: p.Envelope) -> int:
+    """Return 0 for ERROR and CRITICAL traces and exceptions, 1 otherwise."""
+    data = envelope.data.baseData
+    if isinstance(data, p.MessageData | p.ExceptionData):
+        return 0 if data.severityLevel.value >= p.SeverityLevel.ERROR.value else 1
+    return 1
+
+
+def spill_to_local_storage(envelopes: Sequence[p.Envelope | orjson.Fragment], directory: str) -> int:
+    """
+    Write envelopes into a new JSON file in the local storage directory.
+    Envelopes already serialized for sending are not serialized again.
+    Return number of envelopes written (0 if the write has failed).
+    """
+    if not envelopes:
+        return 0
+    filename = f"easytelemetry-{time.time_ns()}-{os.getpid()}.json"
+    try:
+        body, _, _ = p.encode_batch(envelopes, gzip_threshold=-1)
+        Path(directory, filename).write_bytes(body)
+        return len(envelopes)
+    except (OSError, TypeError):
+        return 0
+
+
 EnvelopePredicateT = Callable[[p.Envelope], bool]
 
 
@@ -618,8 +2084,24 @@ class MockPublisher:
                 self._data.append(envelope)
                 i += 1
             except Empty:
-                n = -(i // -self._batch_maxsize)
-                return [self._result_fn() for _ in range(n)]
+                results = []
+                for start in range(0, i, self._batch_maxsize):
+                    result = self._result_fn()
+                    result.count = min(self._batch_maxsize, i - start)
+                    results.append(result)
+                return results
+
+    def drain(self, source: Queue[p.Envelope], deadline: float) -> DrainResult:  # noqa: ARG002
+        before = len(self._data)
+        results = self.publish(source)
+        published = self._data[before:]
+        if all(x.success for x in results):
+            return DrainResult(len(published), [], 0)
+        return DrainResult(0, published, 0)
+
+    def after_fork(self) -> None:
+        # no-op
+        pass
 
     def close(self) -> None:
         # no-op
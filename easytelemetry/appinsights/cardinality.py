@@ -0,0 +1,109 @@
+"""
+Module contains a limiter of distinct property value combinations
+(dimensions) of a metric. A careless dimension, such as user id, would
+otherwise create a new time series in the backend with every call.
+"""
+
+from __future__ import annotations
+
+import math
+
+from easytelemetry import LazyProp, PropsT
+
+
+OTHER = "__other__"
+
+# Keys correlating a single measurement with other entries (not dimensions),
+# which are neither counted nor folded.
+UNLIMITED_KEYS = frozenset({"activity_id"})
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(h: int) -> int:
+    """Spread bits of a Python hash (splitmix64 finalizer)."""
+    h &= _MASK64
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return h ^ (h >> 31)
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct hashes in fixed memory
+    (``2 ** precision`` one-byte registers; the standard error
+    is about ``1.04 / sqrt(2 ** precision)``).
+    """
+
+    __slots__ = ("_alpha", "_precision", "_registers")
+
+    def __init__(self, precision: int = 10):
+        m = 1 << precision
+        self._precision = precision
+        self._registers = bytearray(m)
+        self._alpha = 0.7213 / (1 + 1.079 / m)
+
+    def add(self, h: int) -> None:
+        h = _mix64(h)
+        rest_bits = 64 - self._precision
+        index = h >> rest_bits
+        rank = rest_bits - (h & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self) -> int:
+        registers = self._registers
+        m = len(registers)
+        estimate = self._alpha * m * m / sum(2.0**-r for r in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)  # small range correction
+        return round(estimate)
+
+
+class CardinalityGuard:
+    """
+    Lets through up to ``limit`` distinct combinations of property values
+    of one metric; the values of any further combination are replaced by
+    ``__other__``. Memory is bounded by the limit (hashes of the admitted
+    combinations) and the sketch estimating how many combinations there were.
+    """
+
+    __slots__ = ("_admitted", "_limit", "_sketch", "folded")
+
+    def __init__(self, limit: int, precision: int = 10):
+        self._limit = limit
+        self._admitted: set[int] = set()
+        self._sketch = HyperLogLog(precision)
+        self.folded = 0
+
+    def admit(self, props: PropsT) -> PropsT:
+        """Return the properties, or their folded copy when the combination is over the limit."""
+        key = _key(props)
+        admitted = self._admitted
+        if key in admitted:
+            return props
+        self._sketch.add(key)
+        if len(admitted) < self._limit:
+            admitted.add(key)
+            return props
+        self.folded += 1
+        return {k: v if k in UNLIMITED_KEYS else OTHER for k, v in props.items()}
+
+    def estimate(self) -> int:
+        """Estimated number of distinct combinations seen so far."""
+        # admitted combinations and at least one more when any was folded
+        # bound the estimate from below (the sketch errs on small counts)
+        return max(len(self._admitted) + (self.folded > 0), self._sketch.count())
+
+
+def _key(props: PropsT) -> int:
+    """
+    Hash of the combination. A lazy value counts by the property name only,
+    as it is not known until serialized and resolving it here would defeat it.
+    """
+    if UNLIMITED_KEYS.isdisjoint(props) and not any(isinstance(v, LazyProp) for v in props.values()):
+        return hash(frozenset(props.items()))
+    return hash(
+        frozenset((k, LazyProp if isinstance(v, LazyProp) else v) for k, v in props.items() if k not in UNLIMITED_KEYS)
+    )
@@ -0,0 +1,353 @@
+"""
+This module contains counters shared by processes on the same host
+through a memory-mapped file (POSIX only).
+
+Every process claims its own slot in the file and increments its counters
+there, so increments take no cross-process locks and never touch the queue
+or the network. Slot values only grow. Each cell is guarded by a sequence
+number (seqlock): the owner makes it odd before updating the values and even
+again afterward, and a reader retries until it reads the same even number
+before and after the values, so it never sees a half-written count or sum.
+A single elected process
+(the holder of an exclusive :func:`fcntl.flock` on ``<path>.leader``)
+periodically collects the difference between the current values and the values
+reported last time and emits one aggregated metric envelope per series.
+The reported values are kept in the file too, so when the leader exits
+another process takes over without reporting anything twice.
+
+File layout::
+
+    header      | magic, version, number of slots, number of series, key size
+    series keys | series x key size; u32 length + JSON {"n": name, "p": props}
+    slots       | slots x (slot header + series x cell)
+    slot header | owner pid, closed flag
+    cell        | sequence, count, sum (written by the owner),
+                | reported count, reported sum (written by the leader)
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import threading
+
+import orjson
+
+from easytelemetry import PropsT, str_dict
+import easytelemetry.appinsights.protocol as p
+
+
+DEFAULT_SLOTS = 64
+DEFAULT_SERIES = 256
+DEFAULT_KEY_SIZE = 512
+
+_MAGIC = b"ETSC"
+_VERSION = 2
+_HEADER = struct.Struct("<4sIIII")  # magic, version, slots, series, key size
+_HEADER_SIZE = 64
+_U32 = struct.Struct("<I")
+_PID = struct.Struct("<Q")
+_CLOSED_OFFSET = _PID.size
+_SLOT_HEADER_SIZE = 64
+_SEQ = struct.Struct("<Q")
+_VALUE = struct.Struct("<Qd")  # count, sum
+_CELL = struct.Struct("<QQdQd")  # sequence, count, sum, reported count, reported sum
+_VALUE_OFFSET = _SEQ.size
+_REPORTED_OFFSET = _SEQ.size + _VALUE.size
+# attempts to read a cell being updated; the cell is left for the next collection
+_READ_ATTEMPTS = 100
+
+CounterFuncT = Callable[[], None]
+
+
+class SharedCounters:
+    """
+    Counters and sums shared by all processes using the same file.
+
+    :param path: file shared by the processes; it is created
+        (with given dimensions) by the first process
+    :param slots: maximal number of processes using the file at the same time
+    :param series: maximal number of distinct series (name + properties)
+    :param key_size: maximal size of serialized series name and properties
+    """
+
+    def __init__(
+        self,
+        path: str,
+        slots: int = DEFAULT_SLOTS,
+        series: int = DEFAULT_SERIES,
+        key_size: int = DEFAULT_KEY_SIZE,
+    ):
+        self._path = path
+        self._lock_fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._file_lock():
+            if os.fstat(self._lock_fd).st_size == 0:
+                size = _HEADER_SIZE + series * key_size + slots * (_SLOT_HEADER_SIZE + series * _CELL.size)
+                os.ftruncate(self._lock_fd, size)
+                os.pwrite(self._lock_fd, _HEADER.pack(_MAGIC, _VERSION, slots, series, key_size), 0)
+            header = os.pread(self._lock_fd, _HEADER.size, 0)
+        magic, version, self._slots, self._series, self._key_size = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a shared counters file")
+        self._keys_offset = _HEADER_SIZE
+        self._slots_offset = _HEADER_SIZE + self._series * self._key_size
+        self._slot_size = _SLOT_HEADER_SIZE + self._series * _CELL.size
+        self._mm = mmap.mmap(self._lock_fd, self._slots_offset + self._slots * self._slot_size)
+        self._indexes: dict[bytes, int] = {}
+        self._write_lock = threading.Lock()  # threads of this process share the slot
+        self._leader_fd: int | None = None
+        self._slot = -1
+        self._slot_offset = -1
+        self._claim_slot()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def has_slot(self) -> bool:
+        """False if all slots were taken when this process tried to claim one."""
+        return self._slot >= 0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_fd is not None
+
+    def counter(self, name: str, props: PropsT) -> CounterFuncT | None:
+        """
+        Return a function incrementing the series (name + properties) by 1
+        or None, if this process has no slot, the series table is full
+        or the series key is too long.
+        """
+        add = self.adder(name, props)
+        if add is None:
+            return None
+
+        def inner() -> None:
+            add(1)
+
+        return inner
+
+    def adder(self, name: str, props: PropsT) -> Callable[[int | float], None] | None:
+        """
+        Return a function adding a value to the sum of the series
+        (and incrementing its count) or None, when the series cannot be tracked.
+        """
+        if not self.has_slot:
+            return None
+        index = self._series_index(name, props)
+        if index < 0:
+            return None
+        cell = index * _CELL.size
+        mm = self._mm
+
+        def inner(value: int | float) -> None:
+            with self._write_lock:
+                if self._slot_offset < 0:
+                    return  # closed
+                offset = self._slot_offset + cell
+                seq = _SEQ.unpack_from(mm, offset)[0]
+                _SEQ.pack_into(mm, offset, seq + 1)
+                count, total = _VALUE.unpack_from(mm, offset + _VALUE_OFFSET)
+                _VALUE.pack_into(mm, offset + _VALUE_OFFSET, count + 1, total + value)
+                _SEQ.pack_into(mm, offset, seq + 2)
+
+        return inner
+
+    def collect(self) -> list[p.Envelope]:
+        """
+        Return aggregated metric envelopes with everything incremented
+        since the last collection by any process. Only the leader collects;
+        other processes get an empty list (and try to become the leader).
+        """
+        if not self._try_lead():
+            return []
+        with self._file_lock():
+            keys = self._read_keys()
+            totals: dict[int, tuple[int, float]] = {}
+            for slot in range(self._slots):
+                base = self._slots_offset + slot * self._slot_size
+                pid = _PID.unpack_from(self._mm, base)[0]
+                if pid == 0:
+                    continue
+                complete = True
+                for index in keys:
+                    offset = base + _SLOT_HEADER_SIZE + index * _CELL.size
+                    value = _read_value(self._mm, offset)
+                    if value is None:
+                        complete = False
+                        continue
+                    count, total = value
+                    reported_count, reported_total = _VALUE.unpack_from(self._mm, offset + _REPORTED_OFFSET)
+                    if count == reported_count:
+                        continue
+                    _VALUE.pack_into(self._mm, offset + _REPORTED_OFFSET, count, total)
+                    prev_count, prev_total = totals.get(index, (0, 0.0))
+                    totals[index] = (prev_count + count - reported_count, prev_total + total - reported_total)
+                if pid == os.getpid():
+                    continue  # a slot shared by instances in this process is freed by their close
+                closed = _U32.unpack_from(self._mm, base + _CLOSED_OFFSET)[0]
+                # a process that died during an update loses that update
+                if (closed and complete) or not _is_alive(pid):
+                    self._free_slot(slot)
+        return [_create_envelope(keys[index], count, total) for index, (count, total) in totals.items()]
+
+    def after_fork(self) -> None:
+        """
+        Claim a new slot in a forked child process. File locks are shared
+        with the parent through inherited file descriptors, so the child
+        opens its own; the leadership stays with the parent.
+        """
+        if self._leader_fd is not None:
+            os.close(self._leader_fd)  # the parent keeps holding the lock
+            self._leader_fd = None
+        os.close(self._lock_fd)
+        self._lock_fd = os.open(self._path, os.O_RDWR)
+        self._write_lock = threading.Lock()
+        self._slot = -1
+        self._slot_offset = -1
+        self._claim_slot()
+
+    def close(self) -> None:
+        """
+        Give up the slot and the leadership. The leader should collect
+        before closing; increments of other processes are collected
+        by the next leader.
+        """
+        with self._write_lock:
+            if self._leader_fd is not None:
+                if self._slot >= 0:
+                    with self._file_lock():
+                        self._free_slot(self._slot)
+                os.close(self._leader_fd)
+                self._leader_fd = None
+            elif self._slot >= 0:
+                # the slot of a follower is marked as closed and freed by the leader
+                # once collected, otherwise increments not collected yet would be lost
+                _U32.pack_into(self._mm, self._slots_offset + self._slot * self._slot_size + _CLOSED_OFFSET, 1)
+            self._slot = -1
+            self._slot_offset = -1
+            self._mm.close()
+            os.close(self._lock_fd)
+
+    def describe(self) -> str:
+        role = "leader" if self.is_leader else "follower"
+        return f"{self._path} (slot {self._slot}, {role})"
+
+    @contextlib.contextmanager
+    def _file_lock(self):  # type: ignore[no-untyped-def]
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _try_lead(self) -> bool:
+        if self._leader_fd is not None:
+            return True
+        fd = os.open(f"{self._path}.leader", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        return True
+
+    def _claim_slot(self) -> None:
+        pid = os.getpid()
+        with self._file_lock():
+            claimed = -1
+            for slot in range(self._slots):
+                owner = _PID.unpack_from(self._mm, self._slots_offset + slot * self._slot_size)[0]
+                if owner == pid:
+                    claimed = slot  # already owned by this process; keep its values
+                    break
+                if owner == 0 and claimed < 0:
+                    claimed = slot
+            if claimed < 0:
+                return
+            base = self._slots_offset + claimed * self._slot_size
+            if _PID.unpack_from(self._mm, base)[0] != pid:
+                self._free_slot(claimed)
+                _PID.pack_into(self._mm, base, pid)
+            _U32.pack_into(self._mm, base + _CLOSED_OFFSET, 0)
+        self._slot = claimed
+        self._slot_offset = base + _SLOT_HEADER_SIZE
+
+    def _free_slot(self, slot: int) -> None:
+        base = self._slots_offset + slot * self._slot_size
+        self._mm[base : base + self._slot_size] = bytes(self._slot_size)
+
+    def _series_index(self, name: str, props: PropsT) -> int:
+        # lazy values are resolved now; the key is stored in the shared file
+        values = {k: str(v) for k, v in str_dict(props).items()}
+        key = orjson.dumps({"n": name, "p": values}, option=orjson.OPT_SORT_KEYS)
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+        if _U32.size + len(key) > self._key_size:
+            return -1
+        with self._file_lock():
+            index = -1
+            for i in range(self._series):
+                offset = self._keys_offset + i * self._key_size
+                size = _U32.unpack_from(self._mm, offset)[0]
+                if size == 0:
+                    self._mm[offset + _U32.size : offset + _U32.size + len(key)] = key
+                    _U32.pack_into(self._mm, offset, len(key))
+                    index = i
+                    break
+                if self._mm[offset + _U32.size : offset + _U32.size + size] == key:
+                    index = i
+                    break
+        if index >= 0:
+            self._indexes[key] = index
+        return index
+
+    def _read_keys(self) -> dict[int, dict[str, object]]:
+        keys: dict[int, dict[str, object]] = {}
+        for i in range(self._series):
+            offset = self._keys_offset + i * self._key_size
+            size = _U32.unpack_from(self._mm, offset)[0]
+            if size == 0:
+                break
+            keys[i] = orjson.loads(self._mm[offset + _U32.size : offset + _U32.size + size])
+        return keys
+
+
+def _create_envelope(key: dict[str, object], count: int, total: float) -> p.Envelope:
+    point = p.DataPoint(
+        name=str(key["n"]),
+        value=total,
+        kind=p.DataPointKind.AGGREGATION,
+        count=count,
+    )
+    properties = key["p"]
+    return p.MetricData([point], properties=properties).to_envelope()  # type: ignore[arg-type]
+
+
+def _read_value(mm: mmap.mmap, offset: int) -> tuple[int, float] | None:
+    """Return count and sum of the cell, or None if it was being updated during all attempts."""
+    for _ in range(_READ_ATTEMPTS):
+        seq = _SEQ.unpack_from(mm, offset)[0]
+        if not seq & 1:
+            count, total = _VALUE.unpack_from(mm, offset + _VALUE_OFFSET)
+            if _SEQ.unpack_from(mm, offset)[0] == seq:
+                return count, total
+        os.sched_yield()
+    return None
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
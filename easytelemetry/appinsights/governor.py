@@ -0,0 +1,117 @@
+"""
+This module contains a governor keeping the time the telemetry spends
+on application threads (logging calls) within a budget given as a fraction
+of wall time. When the budget is exceeded, logging is degraded in steps
+(see :class:`Stage`), and it is restored step by step once the load subsides.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Callable
+from enum import IntEnum
+import time
+
+import easytelemetry.appinsights.protocol as p
+
+
+class Stage(IntEnum):
+    NORMAL = 0
+    # caller information (stack inspection) is not captured
+    NO_CALLER = 1
+    # in addition, only every n-th DEBUG and INFO entry is kept
+    SAMPLED = 2
+    # in addition, DEBUG and INFO entries are dropped
+    NO_INFO = 3
+
+
+_STAGE_DESCRIPTIONS = {
+    Stage.NORMAL: "full logging",
+    Stage.NO_CALLER: "caller information is not captured",
+    Stage.SAMPLED: "caller information is not captured, DEBUG and INFO entries are sampled",
+    Stage.NO_INFO: "caller information is not captured, DEBUG and INFO entries are dropped",
+}
+
+TransitionFuncT = Callable[[Stage, Stage, float], None]
+
+
+class OverheadGovernor:
+    """
+    Measures overhead as nanoseconds reported by :meth:`spent` over a sliding
+    window of wall time. Every :meth:`evaluate` (once per publishing interval)
+    moves at most one stage: down when the overhead is over the budget,
+    up when it is under half of the budget. After a move the window starts
+    over, so the next decision reflects the new stage only.
+
+    Updates of the spent time from several threads are not synchronized;
+    an update lost now and then does not matter for the decision.
+    """
+
+    def __init__(
+        self,
+        budget: float,
+        window_secs: float = 60,
+        sample_every: int = 10,
+        on_transition: TransitionFuncT | None = None,
+    ):
+        self.budget = budget
+        self.stage = Stage.NORMAL
+        self.capture_caller = True
+        self._window_secs = window_secs
+        self._sample_every = sample_every
+        self._on_transition = on_transition
+        self._spent_ns = 0
+        self._sampled = 0
+        self._ratio = 0.0
+        self._window: deque[tuple[float, int]] = deque([(time.monotonic(), 0)])
+
+    @property
+    def ratio(self) -> float:
+        """Overhead (fraction of wall time) at the last evaluation."""
+        return self._ratio
+
+    def spent(self, ns: int) -> None:
+        self._spent_ns += ns
+
+    def admit(self, severity: p.SeverityLevel) -> bool:
+        """Return False when an entry of the severity is to be dropped at the current stage."""
+        if severity.value >= p.SeverityLevel.WARNING.value or self.stage < Stage.SAMPLED:
+            return True
+        if self.stage >= Stage.NO_INFO:
+            return False
+        self._sampled += 1
+        return self._sampled % self._sample_every == 0
+
+    def evaluate(self, now: float | None = None) -> float:
+        """Compute the overhead over the window and move one stage if needed; return the overhead."""
+        now = time.monotonic() if now is None else now
+        spent = self._spent_ns
+        window = self._window
+        window.append((now, spent))
+        while len(window) > 2 and window[1][0] <= now - self._window_secs:
+            window.popleft()
+        start, start_spent = window[0]
+        elapsed = now - start
+        self._ratio = (spent - start_spent) / (elapsed * 1e9) if elapsed > 0 else 0.0
+
+        stage = self.stage
+        if self._ratio > self.budget and stage < Stage.NO_INFO:
+            self._move(Stage(stage + 1), now, spent)
+        elif self._ratio < self.budget / 2 and stage > Stage.NORMAL:
+            self._move(Stage(stage - 1), now, spent)
+        return self._ratio
+
+    def describe(self) -> str:
+        return f"{self._ratio:.2%} of {self.budget:.2%} budget, {_STAGE_DESCRIPTIONS[self.stage]}"
+
+    def _move(self, stage: Stage, now: float, spent: int) -> None:
+        prev = self.stage
+        self.stage = stage
+        self.capture_caller = stage == Stage.NORMAL
+        self._window = deque([(now, spent)])
+        if self._on_transition is not None:
+            self._on_transition(prev, stage, self._ratio)
+
+
+def describe_stage(stage: Stage) -> str:
+    return _STAGE_DESCRIPTIONS[stage]
@@ -0,0 +1,72 @@
+"""
+This module contains reading of memory usage and limit of the container
+(control group) the process runs in, supporting both cgroup v2 and v1.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# cgroup v1 reports "no limit" as a huge number (page counter maximum)
+_V1_UNLIMITED = 1 << 60
+
+
+class CgroupMemory:
+    """
+    Memory usage and limit of the process' control group. Files are located
+    once; reading them is a couple of small reads per call.
+    """
+
+    def __init__(self, root: str = CGROUP_ROOT, proc_cgroup: str = "/proc/self/cgroup"):
+        self._usage_file: Path | None = None
+        self._limit_file: Path | None = None
+        base = Path(root)
+        for directory in (base / _v2_path(proc_cgroup), base):
+            if (directory / "memory.current").is_file():
+                self._usage_file = directory / "memory.current"
+                self._limit_file = directory / "memory.max"
+                return
+        v1 = base / "memory"
+        if (v1 / "memory.usage_in_bytes").is_file():
+            self._usage_file = v1 / "memory.usage_in_bytes"
+            self._limit_file = v1 / "memory.limit_in_bytes"
+
+    @property
+    def available(self) -> bool:
+        return self._usage_file is not None
+
+    def limit_bytes(self) -> int | None:
+        """Return the memory limit; None without a limit or cgroup files."""
+        if self._limit_file is None:
+            return None
+        try:
+            limit = self._limit_file.read_text().strip()
+            if limit == "max" or int(limit) >= _V1_UNLIMITED or int(limit) <= 0:
+                return None
+            return int(limit)
+        except (OSError, ValueError):
+            return None
+
+    def usage_ratio(self) -> float | None:
+        """Return memory usage as a fraction of the limit; None without a limit or cgroup files."""
+        limit = self.limit_bytes()
+        if self._usage_file is None or limit is None:
+            return None
+        try:
+            return int(self._usage_file.read_text()) / limit
+        except (OSError, ValueError):
+            return None
+
+
+def _v2_path(proc_cgroup: str) -> str:
+    """Return path of the unified (v2) hierarchy from /proc/self/cgroup ("0::/path"), relative to the root."""
+    try:
+        for line in Path(proc_cgroup).read_text().splitlines():
+            if line.startswith("0::"):
+                return line[3:].strip().lstrip("/")
+    except OSError:
+        pass
+    return ""
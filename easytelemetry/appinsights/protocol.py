@@ -8,20 +8,23 @@ to construct JSON body of HTTP request to Application Insights.
 from __future__ import annotations
 
 from collections.abc import Sequence
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import UTC, datetime, timedelta
 from enum import Enum
-import gzip
 import hashlib
 from pathlib import Path
 import re
 import time
 import traceback
 from typing import Any
+import zlib
 
 import orjson
 import requests
 
+from easytelemetry import LazyProp
+from easytelemetry.context import suppress_instrumentation
+
 
 # fmt: off
 # https://github.com/microsoft/ApplicationInsights-dotnet/tree/master/BASE/Schema/PublicSchema
@@ -33,6 +36,9 @@ SAFE_STR_REGEX = re.compile(f"^[a-zA-Z]\\w{{0,{MAX_KEY_LENGTH - 1}}}$")
 
 GZIP_COMPRESS_LEVEL = 6
 GZIP_THRESHOLD_BYTES = 1000
+_GZIP_WBITS = 16 + zlib.MAX_WBITS  # gzip header and trailer
+# JSON is handed to the compressor in chunks of about this size
+_COMPRESS_CHUNK_BYTES = 64 * 1024
 MAX_ATTEMPTS = 3
 DELAY_BETWEEN_ATTEMPTS_SECS = 0.5
 REQUEST_TIMEOUT_SECS = 15
@@ -41,6 +47,16 @@ UNSPECIFIED_ERROR = -1
 CONNECTION_ERROR = 0
 SUCCESS_HTTP_STATUSES = [200]
 RETRYABLE_HTTP_STATUSES = [CONNECTION_ERROR, 500, 502]
+# some of the items were accepted; the response lists the others
+PARTIAL_SUCCESS_HTTP_STATUS = 206
+RETRYABLE_ITEM_STATUSES = [408, 429, 439, 500, 503]
+
+JSON_CONTENT_TYPE = "application/json"
+NDJSON_CONTENT_TYPE = "application/x-json-stream"
+
+# Approximate size of an envelope without its variable-length content.
+ENVELOPE_BASE_BYTES = 600
+STACK_FRAME_BYTES = 80
 
 PropertiesT = dict[str, str] | None
 MeasurementsT = dict[str, float] | None
@@ -56,15 +72,94 @@ def sanitize_value(s: str) -> str:
     return s[:MAX_VALUE_LENGTH] if s and len(s) > MAX_VALUE_LENGTH else s
 
 
-def serialize(data: Sequence[Envelope] | Envelope) -> bytes:
-    def convert(obj: Any) -> str:
-        if isinstance(obj, timedelta):
-            return str(obj)
-        type_name = obj.__class__.__name__
-        raise TypeError(f"Type '{type_name}' is not serializable.")
+_JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def _convert(obj: Any) -> str:
+    if isinstance(obj, timedelta):
+        return str(obj)
+    if isinstance(obj, LazyProp):
+        return obj.resolve()
+    type_name = obj.__class__.__name__
+    raise TypeError(f"Type '{type_name}' is not serializable.")
 
-    jsopts = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
-    return orjson.dumps(data, default=convert, option=jsopts)
+
+def serialize(data: Sequence[Envelope | orjson.Fragment] | Envelope) -> bytes:
+    return orjson.dumps(data, default=_convert, option=_JSON_OPTIONS)
+
+
+def encode_batch(
+    batch: Sequence[Envelope | orjson.Fragment],
+    gzip_threshold: int = GZIP_THRESHOLD_BYTES,
+    ndjson: bool = False,
+) -> tuple[bytes, int, bool]:
+    """
+    Serialize the batch as a JSON array envelope by envelope into a reused
+    buffer. Once the JSON is larger than the threshold, the buffer is fed
+    into a gzip stream whenever it fills up, so the whole serialized batch
+    never exists in memory next to the compressed body.
+
+    :param gzip_threshold: size of JSON in bytes above which the body
+        is compressed; use -1 for no compression
+    :param ndjson: serialize the batch as newline-delimited JSON instead
+        of an array; envelopes are serialized by :meth:`Envelope.encode`,
+        so encoding the same envelopes again only joins their bytes
+    :return: request body, size of the JSON and whether the body is gzipped
+    """
+    dumps = orjson.dumps
+    start, separator, end = (b"", b"\n", b"") if ndjson else (b"[", b",", b"]")
+    buffer = bytearray(start)
+    compressor = None
+    chunks: list[bytes] = []
+    size = len(start)
+    for i, envelope in enumerate(batch):
+        if i:
+            buffer += separator
+        if not isinstance(envelope, Envelope):
+            piece = dumps(envelope)
+        elif ndjson:
+            piece = envelope.encode()
+        else:
+            piece = envelope.encoded or dumps(envelope, default=_convert, option=_JSON_OPTIONS)
+        buffer += piece
+        size += len(piece) + (1 if i else 0)
+        if compressor is None and 0 < gzip_threshold < size:
+            compressor = zlib.compressobj(GZIP_COMPRESS_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+        if compressor is not None and len(buffer) >= _COMPRESS_CHUNK_BYTES:
+            # the buffer is reused, so memory of JSON is bounded by the chunk
+            chunks.append(compressor.compress(buffer))
+            buffer.clear()
+    buffer += end
+    size += len(end)
+    if compressor is None and 0 < gzip_threshold < size:
+        compressor = zlib.compressobj(GZIP_COMPRESS_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+    if compressor is None:
+        return bytes(buffer), size, False
+    chunks.append(compressor.compress(buffer))
+    chunks.append(compressor.flush())
+    return b"".join(chunks), size, True
+
+
+def estimate_size(envelope: Envelope) -> int:
+    """
+    Estimate size of the envelope in bytes without serializing it:
+    a fixed overhead plus lengths of messages, properties and stack frames.
+    Shared tags are not counted.
+    """
+    data = envelope.data.baseData
+    size = ENVELOPE_BASE_BYTES
+    props = getattr(data, "properties", None)
+    if props:
+        for k, v in props.items():
+            size += len(k) + (len(v) if isinstance(v, str) else 16) + 6
+    if isinstance(data, MessageData):
+        size += len(data.message)
+    elif isinstance(data, ExceptionData):
+        for ex in data.exceptions:
+            size += len(ex.typeName) + len(ex.message) + len(ex.stack or "")
+            for frame in ex.parsedStack or ():
+                size += STACK_FRAME_BYTES + len(frame.method) + len(frame.fileName or "")
+    return size
 
 
 def deserialize(data: bytes) -> ApiResponseBody | str | None:
@@ -98,9 +193,11 @@ def http_send(
     body: bytes,
     headers: dict[str, str],
     attempt: int,
+    timeout_secs: float = REQUEST_TIMEOUT_SECS,
 ) -> PublishResult:
     try:
-        resp = requests.post(url, headers=headers, data=body, timeout=REQUEST_TIMEOUT_SECS)
+        with suppress_instrumentation():  # never track publishing as a dependency
+            resp = requests.post(url, headers=headers, data=body, timeout=timeout_secs)
 
         if resp.status_code in SUCCESS_HTTP_STATUSES:
             return PublishResult(True, resp.status_code, attempt)
@@ -116,16 +213,19 @@ def http_send(
 
 
 def send_batch(
-    batch: Sequence[Envelope],
+    batch: Sequence[Envelope | orjson.Fragment],
     endpoint: str,
     max_attempts: int = MAX_ATTEMPTS,
     delay_between_attempts_secs: float = DELAY_BETWEEN_ATTEMPTS_SECS,
     gzip_threshold: int = GZIP_THRESHOLD_BYTES,
+    timeout_secs: float = REQUEST_TIMEOUT_SECS,
+    ndjson: bool = False,
 ) -> PublishResult:
     """
     Serialize and send the batch to ingestion endpoint.
 
-    :param batch: sequence of envelopes to publish
+    :param batch: sequence of envelopes to publish; already serialized
+        envelopes can be passed wrapped in :class:`orjson.Fragment`
     :param endpoint: endpoint URL for publishing
     :param max_attempts: maximum number of publish attempts.
         Use 0 to turn retries off.
@@ -134,32 +234,79 @@ def send_batch(
     :param gzip_threshold: if serialized payload is larger than this threshold,
         than it will be gzipped. Use -1 for no compression regardless
         of the payload size. The value represents number of bytes.
-    :return: object describing publish result
+    :param timeout_secs: timeout of a single HTTP request in seconds
+    :param ndjson: send newline-delimited JSON (``application/x-json-stream``)
+        instead of a JSON array. Every envelope is serialized once and its
+        bytes are kept, so when only some items are rejected as retryable
+        (partial success), just those are sent again without serializing them.
+    :return: object describing publish result; envelopes which were not
+        accepted (all of them or the rejected ones of a partial success)
+        are in :attr:`PublishResult.unsent`
     """
-    body = serialize(batch)
-    if 0 < gzip_threshold < len(body):
-        body = gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
-        headers = {
-            "Content-Encoding": "gzip",
-            "Content-Type": "application/json",
-            "User-Agent": "easytelemetry",
-        }
-    else:
-        headers = {
-            "Content-Type": "application/json",
-            "User-Agent": "easytelemetry",
-        }
+    start = time.perf_counter()
+    body, body_bytes, gzipped = encode_batch(batch, gzip_threshold, ndjson)
+    headers = _headers(gzipped, ndjson)
+    serialize_ms = (time.perf_counter() - start) * 1000
+    count = len(batch)
+
+    def finish(result: PublishResult, http_start: float, sent: Sequence[Envelope | orjson.Fragment]) -> PublishResult:
+        if not result.success:
+            rejected = _rejected_items(sent, result)
+            result.unsent = list(sent) if rejected is None else rejected
+            result.success = not result.unsent
+        result.count = count
+        result.body_bytes = body_bytes
+        result.wire_bytes = len(body)
+        result.serialize_ms = serialize_ms
+        result.http_ms = (time.perf_counter() - http_start) * 1000
+        return result
 
     if max_attempts > 1 and delay_between_attempts_secs > 0:
         for attempt in range(1, MAX_ATTEMPTS + 1):
-            result = http_send(endpoint, body, headers, attempt)
+            http_start = time.perf_counter()
+            result = http_send(endpoint, body, headers, attempt, timeout_secs)
+            rejected = _rejected_items(batch, result) if ndjson and attempt < MAX_ATTEMPTS else None
+            if rejected and all(_is_retryable_item(e) for e in result.response_body.errors):  # type: ignore[union-attr]
+                batch = rejected
+                body, _, gzipped = encode_batch(batch, gzip_threshold, ndjson)
+                headers = _headers(gzipped, ndjson)
+                time.sleep(delay_between_attempts_secs)
+                continue
             end = result.success or attempt == MAX_ATTEMPTS or result.status_code not in RETRYABLE_HTTP_STATUSES
             if end:
-                return result
+                return finish(result, http_start, batch)
             time.sleep(delay_between_attempts_secs)
         raise NotImplementedError("this should be unreachable")
     else:
-        return http_send(endpoint, body, headers, 1)
+        http_start = time.perf_counter()
+        return finish(http_send(endpoint, body, headers, 1, timeout_secs), http_start, batch)
+
+
+def _headers(gzipped: bool, ndjson: bool) -> dict[str, str]:
+    headers = {
+        "Content-Type": NDJSON_CONTENT_TYPE if ndjson else JSON_CONTENT_TYPE,
+        "User-Agent": "easytelemetry",
+    }
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return headers
+
+
+def _rejected_items(
+    batch: Sequence[Envelope | orjson.Fragment],
+    result: PublishResult,
+) -> list[Envelope | orjson.Fragment] | None:
+    """Return items rejected within a partially accepted batch; None if the response does not tell which."""
+    body = result.response_body
+    if result.status_code != PARTIAL_SUCCESS_HTTP_STATUS or not isinstance(body, ApiResponseBody):
+        return None
+    if any(not 0 <= e.index < len(batch) for e in body.errors):
+        return None
+    return [batch[e.index] for e in body.errors]
+
+
+def _is_retryable_item(error: ApiResponseError) -> bool:
+    return error.statusCode in RETRYABLE_ITEM_STATUSES
 
 
 @dataclass
@@ -171,6 +318,22 @@ class PublishResult:
     attempt: int = 1
     response_body: ApiResponseBody | str | None = None
     exception: Exception | None = None
+    # envelopes in the batch and those of them which were not accepted
+    count: int = 0
+    unsent: list[Envelope | orjson.Fragment] = field(default_factory=list)
+    # size of the serialized batch and of the request body (compressed)
+    body_bytes: int = 0
+    wire_bytes: int = 0
+    # duration of serialization (with compression) and of HTTP requests
+    serialize_ms: float = 0
+    http_ms: float = 0
+
+    @property
+    def accepted(self) -> int:
+        """Number of envelopes accepted by the endpoint (all of them unless :attr:`unsent` tells otherwise)."""
+        if self.success:
+            return self.count
+        return self.count - len(self.unsent) if self.unsent else 0
 
 
 class SeverityLevel(Enum):
@@ -821,6 +984,23 @@ class Envelope:
         bts = serialize(self)
         return bts.decode("utf-8")
 
+    def encode(self) -> bytes:
+        """
+        Return the envelope serialized to JSON. It is serialized only once
+        and the bytes are kept, so the envelope must not change afterward.
+        """
+        encoded: bytes | None = self.__dict__.get("_encoded")
+        if encoded is None:
+            encoded = serialize(self)
+            # orjson does not serialize attributes starting with underscore
+            self.__dict__["_encoded"] = encoded
+        return encoded
+
+    @property
+    def encoded(self) -> bytes | None:
+        """Bytes kept by :meth:`encode`, if it was called."""
+        return self.__dict__.get("_encoded")
+
 
 @dataclass(frozen=True)
 class ApiResponseError:
@@ -0,0 +1,188 @@
+"""
+This module contains a collector of process runtime metrics: CPU time,
+memory, open file descriptors, threads, garbage collections and event loop lag.
+
+Values are read once per publishing interval from ``/proc/self`` (Linux),
+:mod:`resource` and hooks in :data:`gc.callbacks`, so no third-party package
+is needed and nothing runs between the intervals except the GC hooks.
+Metrics not available on the platform are not published.
+
+Published metrics (aggregated data points, one envelope each):
+
+==================== ==========================================================
+name                 value
+==================== ==========================================================
+process_cpu_ms       user and system CPU time used since the previous interval
+process_rss_bytes    resident memory (``/proc/self/statm``)
+process_peak_rss     peak resident memory in bytes (:mod:`resource`)
+process_open_fds     open file descriptors (``/proc/self/fd``)
+process_threads      OS threads of the process
+gc_collections       garbage collections since the previous interval
+gc_pause_ms          time spent in those collections (count = collections)
+event_loop_lag_ms    delay of a callback scheduled on the watched event loop
+==================== ==========================================================
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Any
+
+import easytelemetry.appinsights.protocol as p
+
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+
+_PROC_SELF = "/proc/self"
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# ru_maxrss is in kilobytes except on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class RuntimeMetrics:
+    """
+    Collector of process runtime metrics, see the module documentation.
+    Collecting takes tens of microseconds (see benchmarks/runtime_metrics.py).
+    """
+
+    def __init__(self, props: dict[str, str]):
+        self._props = props
+        self._has_proc = Path(_PROC_SELF).is_dir()
+        self._cpu_prev = self._cpu_secs()
+        # written by GC hooks, which may run in any thread at any time,
+        # so only ever incremented and never guarded by a lock
+        self._gc_count = 0
+        self._gc_pause_ns = 0
+        self._gc_started_ns = 0
+        self._gc_reported = (0, 0)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._probe_sent: float | None = None
+        self._loop_lag_ms: float | None = None
+        gc.callbacks.append(self._on_gc)
+
+    def watch_event_loop(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        """
+        Measure lag of the event loop (the running loop by default). Once per
+        interval a callback is scheduled on the loop; the lag is how long it
+        waited to run. A loop blocked during the whole interval reports
+        the time since the callback was scheduled.
+        """
+        self._loop = loop or asyncio.get_running_loop()
+        self._probe_sent = None
+        self._loop_lag_ms = None
+
+    def collect(self) -> list[p.Envelope]:
+        """Return metric envelopes with the current values."""
+        envelopes = []
+
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            cpu = usage.ru_utime + usage.ru_stime
+            envelopes.append(self._envelope("process_peak_rss", usage.ru_maxrss * _MAXRSS_UNIT))
+        else:
+            cpu = time.process_time()
+        envelopes.append(self._envelope("process_cpu_ms", max(cpu - self._cpu_prev, 0.0) * 1000))
+        self._cpu_prev = cpu
+
+        if self._has_proc:
+            try:
+                with open(f"{_PROC_SELF}/statm", "rb") as f:
+                    rss_pages = int(f.read().split()[1])
+                envelopes.append(self._envelope("process_rss_bytes", rss_pages * _PAGE_SIZE))
+                # listing names is much cheaper than creating Path objects
+                fds = len(os.listdir(f"{_PROC_SELF}/fd"))  # noqa: PTH208
+                threads = len(os.listdir(f"{_PROC_SELF}/task"))  # noqa: PTH208
+                envelopes.append(self._envelope("process_open_fds", fds))
+                envelopes.append(self._envelope("process_threads", threads))
+            except (OSError, ValueError, IndexError):
+                self._has_proc = False
+        if not self._has_proc:
+            envelopes.append(self._envelope("process_threads", threading.active_count()))
+
+        count, pause_ns = self._gc_count, self._gc_pause_ns
+        reported_count, reported_pause_ns = self._gc_reported
+        self._gc_reported = (count, pause_ns)
+        collections = count - reported_count
+        envelopes.append(self._envelope("gc_collections", collections))
+        if collections > 0:
+            pause_ms = (pause_ns - reported_pause_ns) / 1_000_000
+            envelopes.append(self._envelope("gc_pause_ms", pause_ms, collections))
+
+        lag = self._probe_event_loop()
+        if lag is not None:
+            envelopes.append(self._envelope("event_loop_lag_ms", lag))
+        return envelopes
+
+    def after_fork(self) -> None:
+        """Start over in a forked child process; the event loop stays with the parent."""
+        self._cpu_prev = self._cpu_secs()
+        self._gc_reported = (self._gc_count, self._gc_pause_ns)
+        self._loop = None
+        self._probe_sent = None
+        self._loop_lag_ms = None
+
+    def close(self) -> None:
+        """Remove the GC hooks."""
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        self._loop = None
+
+    def describe(self) -> str:
+        sources = ["/proc/self"] if self._has_proc else []
+        if resource is not None:
+            sources.append("resource")
+        sources.append("gc")
+        if self._loop is not None:
+            sources.append("event loop")
+        return ", ".join(sources)
+
+    def _on_gc(self, phase: str, info: dict[str, Any]) -> None:  # noqa: ARG002
+        if phase == "start":
+            self._gc_started_ns = time.perf_counter_ns()
+        else:
+            self._gc_pause_ns += time.perf_counter_ns() - self._gc_started_ns
+            self._gc_count += 1
+
+    def _probe_event_loop(self) -> float | None:
+        """Return the lag measured since the previous call and schedule the next probe."""
+        loop = self._loop
+        if loop is None:
+            return None
+        if loop.is_closed():
+            self._loop = None
+            return None
+        lag = self._loop_lag_ms
+        self._loop_lag_ms = None
+        sent = self._probe_sent
+        if sent is not None:
+            # the previous probe has not run yet
+            return (time.perf_counter() - sent) * 1000
+        self._probe_sent = time.perf_counter()
+        loop.call_soon_threadsafe(self._on_probe)
+        return lag
+
+    def _on_probe(self) -> None:
+        sent = self._probe_sent
+        if sent is not None:
+            self._loop_lag_ms = (time.perf_counter() - sent) * 1000
+            self._probe_sent = None
+
+    def _cpu_secs(self) -> float:
+        if resource is None:
+            return time.process_time()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def _envelope(self, name: str, value: float, count: int = 1) -> p.Envelope:
+        point = p.DataPoint(name=name, value=value, kind=p.DataPointKind.AGGREGATION, count=count)
+        return p.MetricData([point], properties=self._props).to_envelope()
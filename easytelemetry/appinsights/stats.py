@@ -0,0 +1,170 @@
+"""
+This module contains statistics of the telemetry pipeline itself: counters
+(envelopes enqueued, dropped and sent, batches, bytes, retries) and histograms
+(batch sizes, serialization and HTTP latencies).
+
+Every thread updates its own shard without any lock; shards are merged only
+when the statistics are read, which is rare compared to the updates. Shards
+of finished threads are folded into one, so short-lived threads do not
+accumulate them.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from enum import IntEnum
+import math
+import threading
+import weakref
+
+
+class Counter(IntEnum):
+    ENQUEUED = 0
+    DROPPED = 1
+    BATCHES = 2
+    SENT = 3
+    FAILED = 4
+    RETRIES = 5
+    BYTES_SERIALIZED = 6
+    BYTES_SENT = 7
+
+
+class Histogram(IntEnum):
+    BATCH_SIZE = 0
+    SERIALIZE_MS = 1
+    HTTP_MS = 2
+
+
+# Upper bounds of histogram buckets (milliseconds or envelopes).
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+
+class _Shard:
+    """Statistics updated by a single thread."""
+
+    __slots__ = ("buckets", "counters", "maxima", "sums")
+
+    def __init__(self) -> None:
+        self.counters = [0] * len(Counter)
+        self.buckets = [[0] * len(BUCKETS) for _ in Histogram]
+        self.sums = [0.0] * len(Histogram)
+        self.maxima = [0.0] * len(Histogram)
+
+    def merge(self, other: _Shard) -> None:
+        for i, n in enumerate(other.counters):
+            self.counters[i] += n
+        for h in range(len(Histogram)):
+            for i, n in enumerate(other.buckets[h]):
+                self.buckets[h][i] += n
+            self.sums[h] += other.sums[h]
+            self.maxima[h] = max(self.maxima[h], other.maxima[h])
+
+
+@dataclass(frozen=True)
+class HistogramSnapshot:
+    count: int
+    sum: float
+    max: float
+    buckets: tuple[int, ...]
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Return upper bound of the bucket containing the q-th percentile (0 < q <= 100)."""
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets, strict=True):
+            seen += n
+            if seen >= rank > 0:
+                return min(bound, self.max)
+        return 0.0
+
+
+@dataclass(frozen=True)
+class StatsSnapshot:
+    """Merged pipeline statistics since the telemetry was created."""
+
+    counters: dict[str, int]
+    histograms: dict[str, HistogramSnapshot]
+    queue_depth: int = 0
+
+    @property
+    def compression_ratio(self) -> float:
+        """Serialized bytes per byte sent (1 when nothing was compressed)."""
+        sent = self.counters["bytes_sent"]
+        return self.counters["bytes_serialized"] / sent if sent else 1.0
+
+    def describe(self) -> str:
+        items = [f"{k} {v}" for k, v in self.counters.items()]
+        items.append(f"queue_depth {self.queue_depth}")
+        items.append(f"compression {self.compression_ratio:.1f}x")
+        for name, h in self.histograms.items():
+            if h.count:
+                items.append(f"{name} p50 {h.percentile(50):g} p99 {h.percentile(99):g} max {h.max:g}")
+        return ", ".join(items)
+
+
+class PipelineStats:
+    """Counters and histograms of the pipeline, sharded per thread."""
+
+    def __init__(self) -> None:
+        self.after_fork()
+
+    def incr(self, counter: Counter, n: int = 1) -> None:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard.counters[counter] += n
+
+    def observe(self, histogram: Histogram, value: float) -> None:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        i = 0
+        while value > BUCKETS[i]:
+            i += 1
+        shard.buckets[histogram][i] += 1
+        shard.sums[histogram] += value
+        if value > shard.maxima[histogram]:
+            shard.maxima[histogram] = value
+
+    def snapshot(self, queue_depth: int = 0) -> StatsSnapshot:
+        with self._lock:
+            shards = [self._retired, *(x[1] for x in self._shards)]
+        counters = {c.name.lower(): sum(s.counters[c] for s in shards) for c in Counter}
+        histograms = {}
+        for h in Histogram:
+            buckets = tuple(sum(s.buckets[h][i] for s in shards) for i in range(len(BUCKETS)))
+            histograms[h.name.lower()] = HistogramSnapshot(
+                count=sum(buckets),
+                sum=sum(s.sums[h] for s in shards),
+                max=max((s.maxima[h] for s in shards), default=0.0),
+                buckets=buckets,
+            )
+        return StatsSnapshot(counters, histograms, queue_depth)
+
+    def after_fork(self) -> None:
+        """Start over in a forked child process."""
+        self._local = threading.local()
+        self._shards: list[tuple[weakref.ref[threading.Thread], _Shard]] = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+
+    def _new_shard(self) -> _Shard:
+        shard = _Shard()
+        with self._lock:
+            live = []
+            for thread, s in self._shards:
+                t = thread()
+                if t is not None and t.is_alive():
+                    live.append((thread, s))
+                else:
+                    self._retired.merge(s)
+            live.append((weakref.ref(threading.current_thread()), shard))
+            self._shards = live
+        self._local.shard = shard
+        return shard
@@ -0,0 +1,241 @@
+"""
+Module contains operation context, which correlates logs, metrics,
+requests and dependency calls belonging to the same logical operation.
+The current operation is kept in :mod:`contextvars`, so asyncio tasks
+(and :func:`asyncio.to_thread`) inherit it on their own. Work handed over
+to thread pools (including :meth:`asyncio.loop.run_in_executor`)
+or process pools has to be wrapped by :func:`wrap`, :class:`ContextExecutor`
+or :func:`run_in_executor`.
+Identifiers are compatible with W3C trace context
+(32 hex digits for the operation, 16 hex digits for a request or dependency).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Generator, Iterator
+import concurrent.futures as cf
+import contextlib
+from contextvars import ContextVar, Token, copy_context
+import functools
+import random
+import re
+from typing import Any, ParamSpec, TypeVar
+
+
+class Operation:
+    """Identifiers of the current request or dependency call."""
+
+    __slots__ = ("cache", "id", "name", "operation_id", "parent_id")
+
+    def __init__(
+        self,
+        operation_id: str,
+        id: str,  # noqa: A002
+        parent_id: str | None = None,
+        name: str | None = None,
+    ):
+        # Identifier shared by everything within the operation (trace id).
+        self.operation_id = operation_id
+
+        # Identifier of the request or dependency call (span id).
+        self.id = id
+
+        # Identifier of the parent request or dependency call.
+        self.parent_id = parent_id
+
+        # Name of the operation; usually name of the root request.
+        self.name = name
+
+        # Data derived from the operation by a telemetry implementation,
+        # e.g. envelope tags, so they are built once per operation.
+        self.cache: Any = None
+
+    def child(self) -> Operation:
+        """Create operation of a nested request or dependency call."""
+        return Operation(self.operation_id, new_span_id(), self.id, self.name)
+
+    def __repr__(self) -> str:
+        return f"Operation({self.operation_id}, id={self.id}, parent_id={self.parent_id})"
+
+
+_current: ContextVar[Operation | None] = ContextVar("easytelemetry_operation", default=None)
+_suppressed: ContextVar[bool] = ContextVar("easytelemetry_suppressed", default=False)
+_traceparent_rgx = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+_SAMPLED_FLAG = 0x01
+
+
+def new_operation_id() -> str:
+    """Create random operation (trace) identifier; 32 hex digits."""
+    return f"{random.getrandbits(128):032x}"
+
+
+def new_span_id() -> str:
+    """Create random request or dependency (span) identifier; 16 hex digits."""
+    return f"{random.getrandbits(64):016x}"
+
+
+def current_operation() -> Operation | None:
+    """Get the operation of the current context, if any."""
+    return _current.get()
+
+
+def start_operation(
+    name: str | None = None,
+    operation_id: str | None = None,
+    parent_id: str | None = None,
+) -> tuple[Operation, Token[Operation | None]]:
+    """
+    Make a new operation current. Without explicit identifiers it is a child
+    of the current operation or a new root operation.
+
+    :param name: operation name used for a new root operation
+    :param operation_id: continue the operation of given identifier
+        (e.g. received from the caller)
+    :param parent_id: identifier of the caller's request or dependency call
+    """
+    parent = _current.get()
+    if operation_id:
+        op = Operation(operation_id, new_span_id(), parent_id, name)
+    elif parent is not None:
+        op = parent.child()
+    else:
+        op = Operation(new_operation_id(), new_span_id(), None, name)
+    return op, _current.set(op)
+
+
+def end_operation(token: Token[Operation | None]) -> None:
+    """Restore the operation which was current before :func:`start_operation`."""
+    _current.reset(token)
+
+
+def format_traceparent(op: Operation, sampled: bool = True) -> str:
+    """Create W3C ``traceparent`` header value with the operation as the parent."""
+    return f"00-{op.operation_id}-{op.id}-{'01' if sampled else '00'}"
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str] | None:
+    """
+    Parse W3C ``traceparent`` header value (version 00) and return
+    operation identifier and caller's identifier or None, if it is not valid.
+    """
+    if not value:
+        return None
+    m = _traceparent_rgx.match(value.strip().lower())
+    if m is None or m.group(1) == _INVALID_TRACE_ID or m.group(2) == _INVALID_SPAN_ID:
+        return None
+    return m.group(1), m.group(2)
+
+
+def is_traceparent_sampled(value: str | None) -> bool | None:
+    """
+    Return the sampled flag of W3C ``traceparent`` header value (version 00),
+    i.e. whether the caller records the operation, or None if it is not valid.
+    """
+    if not value:
+        return None
+    m = _traceparent_rgx.match(value.strip().lower())
+    if m is None or m.group(1) == _INVALID_TRACE_ID or m.group(2) == _INVALID_SPAN_ID:
+        return None
+    return bool(int(m.group(3), 16) & _SAMPLED_FLAG)
+
+
+@contextlib.contextmanager
+def suppress_instrumentation() -> Generator[None, None, None]:
+    """
+    Do not track anything done within the block by automatic instrumentation;
+    used for sending telemetry itself.
+    """
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def is_instrumentation_suppressed() -> bool:
+    return _suppressed.get()
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def wrap(fn: Callable[P, R]) -> Callable[P, R]:  # noqa: UP047
+    """
+    Bind the function to a snapshot of the current context,
+    so it runs within the current operation wherever it is called.
+    The snapshot can be entered only by one thread at a time;
+    wrap the function for every call handed over to a thread pool.
+    """
+    return functools.partial(copy_context().run, fn)
+
+
+class _OperationCall:
+    """
+    Picklable call for process pools, which carries only the current
+    operation (contexts cannot be pickled) and makes it current in the worker.
+    """
+
+    def __init__(self, fn: Callable[..., Any], op: Operation | None):
+        self.fn = fn
+        self.op = None if op is None else (op.operation_id, op.id, op.parent_id, op.name)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        if self.op is None:
+            return self.fn(*args, **kwargs)
+        token = _current.set(Operation(*self.op))
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+
+class ContextExecutor(cf.Executor):
+    """
+    Executor wrapper running every submitted call within the operation
+    current at the time of submission. Calls submitted to thread pools get
+    a snapshot of the whole context; calls submitted to process pools
+    get the operation only.
+    """
+
+    def __init__(self, executor: cf.Executor):
+        self._executor = executor
+        self._pickled = isinstance(executor, cf.ProcessPoolExecutor)
+
+    @property
+    def executor(self) -> cf.Executor:
+        return self._executor
+
+    def submit(self, fn: Callable[..., R], /, *args: Any, **kwargs: Any) -> cf.Future[R]:
+        if self._pickled:
+            return self._executor.submit(_OperationCall(fn, _current.get()), *args, **kwargs)
+        return self._executor.submit(copy_context().run, fn, *args, **kwargs)
+
+    def map(
+        self,
+        fn: Callable[..., R],
+        *iterables: Any,
+        timeout: float | None = None,
+        chunksize: int = 1,
+    ) -> Iterator[R]:
+        if self._pickled:
+            call = _OperationCall(fn, _current.get())
+            return self._executor.map(call, *iterables, timeout=timeout, chunksize=chunksize)
+        return super().map(fn, *iterables, timeout=timeout, chunksize=chunksize)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+def run_in_executor(executor: cf.Executor | None, fn: Callable[..., R], *args: Any) -> asyncio.Future[R]:  # noqa: UP047
+    """
+    Variant of :meth:`asyncio.loop.run_in_executor` for the running loop,
+    which keeps the current operation (the loop's method does not).
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, cf.ProcessPoolExecutor):
+        return loop.run_in_executor(executor, _OperationCall(fn, _current.get()), *args)
+    return loop.run_in_executor(executor, functools.partial(copy_context().run, fn), *args)
@@ -8,16 +8,22 @@ Also, this module is ignored when calculating test code coverage.
 
 from __future__ import annotations
 
-from collections.abc import Callable
+from collections.abc import Callable, Mapping
+import contextlib
 from dataclasses import dataclass
 from datetime import UTC, datetime
+import logging
+import threading
 from typing import Any
+import weakref
 
 from easytelemetry import (
+    GaugeCallbackT,
     Level,
     Logger,
     MetricFuncT,
     MetricFuncWithPropsT,
+    OperationScope,
     PropsT,
     StdLoggingHandler,
     Telemetry,
@@ -26,7 +32,10 @@ from easytelemetry import (
     get_environment_name,
     get_host_name,
     merge_props,
+    std_logging_to_level,
 )
+from easytelemetry.context import Operation, current_operation
+from easytelemetry.levels import LevelOverrides, apply_levels
 
 
 @dataclass(frozen=True)
@@ -40,6 +49,7 @@ class LogEntry:
     ex: BaseException | None
     args: tuple[Any, ...] | None
     props: PropsT | None
+    operation: Operation | None = None
 
     def __str__(self) -> str:
         m = self.msg % self.args if self.args else self.msg
@@ -106,6 +116,7 @@ def build(
     if setup_std_logging:
         handler = StdLoggingHandler(imt)
         handler.configure_std_logging(clear_std_logging_handlers)
+        imt.register_std_logging_handler(handler)
     return imt
 
 
@@ -129,7 +140,12 @@ class InMemoryTelemetry(Telemetry):
             self._logs,
         )
         self._loggers: dict[str, Logger] = {self._rootlgr.name: self._rootlgr}
+        self._base_levels: dict[str, Level] = {self._rootlgr.name: min_level}
+        self._level_overrides = LevelOverrides()
+        self._std_logging_handler: StdLoggingHandler | None = None
         self._metrics: dict[str, Metric] = {}
+        self._gauges: dict[str, tuple[GaugeCallbackT, PropsT | None]] = {}
+        self._operations: list[OperationScope] = []
 
     @property
     def root(self) -> Logger:
@@ -147,6 +163,11 @@ class InMemoryTelemetry(Telemetry):
     def metrics(self) -> dict[str, Metric]:
         return self._metrics
 
+    @property
+    def operations(self) -> list[OperationScope]:
+        """Finished requests and dependency calls."""
+        return self._operations
+
     @property
     def min_level(self) -> Level:
         return self._min_level
@@ -161,10 +182,25 @@ class InMemoryTelemetry(Telemetry):
         if not lgr:
             lvl = level if level else self._min_level
             extra = {**self._global_props, **props} if props else self._global_props
-            lgr = InMemoryLogger(name, lvl, extra, self._logs)
+            lgr = InMemoryLogger(name, self._level_overrides.level_for(name) or lvl, extra, self._logs)
+            self._base_levels[name] = lvl
             self._loggers[name] = lgr
         return lgr
 
+    @property
+    def log_levels(self) -> dict[str, Level]:
+        return self._level_overrides.as_dict()
+
+    def set_log_levels(self, levels: Mapping[str, Level] | None) -> None:
+        self._level_overrides = LevelOverrides(levels)
+        apply_levels(self._level_overrides, self._loggers.items(), self._base_levels)
+        if self._std_logging_handler is not None:
+            min_level = self._level_overrides.min_level() or Level.CRITICAL
+            self._std_logging_handler.set_level(min(self._min_level, min_level))
+
+    def register_std_logging_handler(self, h: StdLoggingHandler) -> None:
+        self._std_logging_handler = h
+
     def metric(
         self,
         name: str,
@@ -188,6 +224,26 @@ class InMemoryTelemetry(Telemetry):
             self._metrics[name] = m
         return m.track_extra
 
+    def gauge(
+        self,
+        name: str,
+        callback: GaugeCallbackT,
+        props: PropsT | None = None,
+    ) -> None:
+        self._gauges[name] = (callback, props)
+
+    def sample_gauges(self) -> None:
+        """Track current values of all gauges; callbacks raising an exception are skipped."""
+        for name, (callback, props) in self._gauges.items():
+            value = None
+            with contextlib.suppress(Exception):
+                value = callback()
+            if value is not None:
+                self.metric(name, props)(value)
+
+    def track_operation(self, scope: OperationScope) -> None:
+        self._operations.append(scope)
+
     def describe(self) -> str:
         s = [
             f"name: {self._name}",
@@ -198,6 +254,7 @@ class InMemoryTelemetry(Telemetry):
 
     def clear(self) -> None:
         self._logs.clear()
+        self._operations.clear()
         for m in self._metrics.values():
             m.clear()
 
@@ -258,6 +315,9 @@ class InMemoryLogger(Logger):
         self._level = min_level
         self._props = props
         self._logs = logs
+        self._children: weakref.WeakSet[InMemoryLogger] | None = None
+        self._children_lock = threading.Lock()  # shared by bind() and the level setter
+        self._bind_level_methods()
 
     @property
     def name(self) -> str:
@@ -267,6 +327,23 @@ class InMemoryLogger(Logger):
     def level(self) -> Level:
         return self._level
 
+    @level.setter
+    def level(self, value: Level) -> None:
+        with self._children_lock:  # a child bound meanwhile gets the new level
+            self._level = value
+            self._bind_level_methods()
+            children = list(self._children) if self._children else []
+        for child in children:
+            child.level = value
+
+    def bind(self, **kwargs: Any) -> Logger:
+        with self._children_lock:
+            child = InMemoryLogger(self._name, self._level, {**self._props, **kwargs}, self._logs)
+            if self._children is None:
+                self._children = weakref.WeakSet()
+            self._children.add(child)
+        return child
+
     def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
         if self._level <= Level.DEBUG:
             props = create_props(kwargs, 3)
@@ -300,6 +377,24 @@ class InMemoryLogger(Logger):
         props = merge_props(self._props, kwargs)
         self._enqueue(self._name, level, str(ex), None, props, ex)
 
+    def log_record(self, record: logging.LogRecord) -> None:
+        if record.levelno < self._level and record.levelno < logging.CRITICAL:
+            return
+        props: PropsT = {**self._props, "path": record.pathname, "line": record.lineno, "module": record.module}
+        if record.funcName and record.funcName != "<module>":
+            props["func"] = record.funcName
+        entry = LogEntry(
+            time=datetime.fromtimestamp(record.created),
+            level=std_logging_to_level(record.levelno),
+            source=self._name,
+            msg=record.getMessage(),
+            ex=record.exc_info[1] if record.exc_info else None,
+            args=None,
+            props=props,
+            operation=getattr(record, "easytelemetry_operation", None) or current_operation(),
+        )
+        self._logs.append(entry)
+
     def __str__(self) -> str:
         return f"{self._name}:{self._level}"
 
@@ -321,5 +416,6 @@ class InMemoryLogger(Logger):
             ex=ex,
             args=args,
             props=props,
+            operation=current_operation(),
         )
         self._logs.append(entry)
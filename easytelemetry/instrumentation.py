@@ -0,0 +1,189 @@
+"""
+Module contains opt-in instrumentation of outbound HTTP calls made
+with :mod:`requests` or :mod:`http.client`. Every call gets W3C
+``traceparent`` header with the current operation, and calls which pass
+sampling are tracked as dependency calls of the telemetry.
+Calls made while sending telemetry itself are never instrumented
+(see :func:`easytelemetry.context.suppress_instrumentation`).
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+import contextlib
+from datetime import UTC, datetime, timedelta
+import http.client
+import random
+import time
+from typing import Any
+from urllib.parse import SplitResult, urlsplit
+
+import requests
+
+from easytelemetry import OperationKind, OperationScope, Telemetry
+from easytelemetry.context import (
+    Operation,
+    current_operation,
+    format_traceparent,
+    is_instrumentation_suppressed,
+    new_operation_id,
+    new_span_id,
+    suppress_instrumentation,
+)
+
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+def instrument_http(
+    telemetry: Telemetry,
+    sample_rate: float = 1.0,
+    exclude_hosts: Iterable[str] | None = None,
+) -> None:
+    """
+    Start instrumenting outbound HTTP calls. Calling it again replaces
+    the configuration.
+
+    :param telemetry: telemetry tracking the dependency calls
+    :param sample_rate: fraction (0 - 1) of calls tracked as dependency calls;
+        the decision is made before anything is allocated for the call
+        and the ``traceparent`` header is injected even to calls not sampled
+    :param exclude_hosts: host names which are neither tracked nor get the header
+    """
+    global _config
+    _config = _Config(telemetry, sample_rate, exclude_hosts)
+    if not _originals:
+        _originals["requests"] = requests.Session.send
+        _originals["request"] = http.client.HTTPConnection.request
+        _originals["getresponse"] = http.client.HTTPConnection.getresponse
+        requests.Session.send = _session_send  # type: ignore[method-assign]
+        http.client.HTTPConnection.request = _connection_request  # type: ignore[method-assign]
+        http.client.HTTPConnection.getresponse = _connection_getresponse  # type: ignore[method-assign]
+
+
+def uninstrument_http() -> None:
+    """Stop instrumenting outbound HTTP calls."""
+    global _config
+    _config = None
+    if _originals:
+        requests.Session.send = _originals.pop("requests")  # type: ignore[method-assign]
+        http.client.HTTPConnection.request = _originals.pop("request")  # type: ignore[method-assign]
+        http.client.HTTPConnection.getresponse = _originals.pop("getresponse")  # type: ignore[method-assign]
+
+
+class _Call:
+    """Outbound call tracked as a dependency call."""
+
+    __slots__ = ("method", "op", "start", "start_time", "url")
+
+    def __init__(self, method: str, url: SplitResult, op: Operation):
+        self.method = method
+        self.url = url
+        self.op = op
+        self.start = time.perf_counter_ns()
+        self.start_time = datetime.now(UTC)
+
+
+class _Config:
+    def __init__(
+        self,
+        telemetry: Telemetry,
+        sample_rate: float,
+        exclude_hosts: Iterable[str] | None,
+    ):
+        self.telemetry = telemetry
+        self.sample_rate = sample_rate
+        self.exclude_hosts = frozenset(x.lower() for x in exclude_hosts or ())
+
+    def begin(self, method: str, url: SplitResult) -> tuple[str | None, _Call | None]:
+        """Return ``traceparent`` header value for the call and the call, if it is tracked."""
+        if (url.hostname or "").lower() in self.exclude_hosts:
+            return None, None
+        parent = current_operation()
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:  # noqa: S311
+            return (None if parent is None else format_traceparent(parent, sampled=False)), None
+        op = parent.child() if parent is not None else Operation(new_operation_id(), new_span_id())
+        return format_traceparent(op), _Call(method, url, op)
+
+    def end(self, call: _Call, status: int | None, ex: BaseException | None) -> None:
+        with contextlib.suppress(Exception):  # telemetry must not break the call
+            url = call.url
+            scope = OperationScope(self.telemetry, OperationKind.DEPENDENCY, f"{call.method} {url.path or '/'}")
+            scope.type = "HTTP"
+            scope.target = url.netloc
+            scope.data = url.geturl()
+            scope.operation = call.op
+            scope.start_time = call.start_time
+            scope.duration = timedelta(microseconds=(time.perf_counter_ns() - call.start) / 1000)
+            scope.result_code = None if status is None else str(status)
+            scope.success = ex is None and status is not None and status < 400
+            self.telemetry.track_operation(scope)
+
+
+_config: _Config | None = None
+_originals: dict[str, Any] = {}
+
+
+def _session_send(self: requests.Session, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+    send = _originals["requests"]
+    cfg = _config
+    if cfg is None or is_instrumentation_suppressed():
+        return send(self, request, **kwargs)
+    header, call = cfg.begin(request.method or "GET", urlsplit(request.url or ""))
+    if header is not None and TRACEPARENT_HEADER not in request.headers:
+        request.headers[TRACEPARENT_HEADER] = header
+    # the connection underneath must not be tracked once more
+    with suppress_instrumentation():
+        if call is None:
+            return send(self, request, **kwargs)
+        try:
+            resp = send(self, request, **kwargs)
+        except BaseException as e:
+            cfg.end(call, None, e)
+            raise
+    cfg.end(call, resp.status_code, None)
+    return resp
+
+
+def _connection_request(
+    self: http.client.HTTPConnection,
+    method: str,
+    url: str,
+    body: Any = None,
+    headers: Any = None,
+    **kwargs: Any,
+) -> None:
+    request = _originals["request"]
+    cfg = _config
+    if cfg is None or is_instrumentation_suppressed():
+        return request(self, method, url, body, {} if headers is None else headers, **kwargs)
+    scheme = "https" if isinstance(self, http.client.HTTPSConnection) else "http"
+    netloc = self.host if self.port in (None, self.default_port) else f"{self.host}:{self.port}"
+    header, call = cfg.begin(method, urlsplit(f"{scheme}://{netloc}{url}"))
+    headers = dict(headers) if headers else {}
+    if header is not None and not any(k.lower() == TRACEPARENT_HEADER for k in headers):
+        headers[TRACEPARENT_HEADER] = header
+    self._easytelemetry_call = call  # type: ignore[attr-defined]
+    try:
+        return request(self, method, url, body, headers, **kwargs)
+    except BaseException as e:
+        if call is not None:
+            self._easytelemetry_call = None  # type: ignore[attr-defined]
+            cfg.end(call, None, e)
+        raise
+
+
+def _connection_getresponse(self: http.client.HTTPConnection) -> http.client.HTTPResponse:
+    getresponse = _originals["getresponse"]
+    call: _Call | None = getattr(self, "_easytelemetry_call", None)
+    cfg = _config
+    if call is None or cfg is None:
+        return getresponse(self)
+    self._easytelemetry_call = None  # type: ignore[attr-defined]
+    try:
+        resp = getresponse(self)
+    except BaseException as e:
+        cfg.end(call, None, e)
+        raise
+    cfg.end(call, resp.status, None)
+    return resp
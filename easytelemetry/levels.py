@@ -0,0 +1,121 @@
+"""
+Module contains runtime control of logging levels. Levels of loggers
+are overridden by glob patterns (:mod:`fnmatch`) of logger names, e.g.
+``{"db.*": Level.DEBUG}``, see :meth:`easytelemetry.Telemetry.set_log_levels`.
+
+Overrides can be also read from a text file with one ``pattern = LEVEL``
+per line (``#`` starts a comment)::
+
+    # everything from the data layer
+    db.* = DEBUG
+    _root = WARN
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+from easytelemetry import Level, Logger
+
+
+_LEVEL_NAMES = {x.name: x for x in Level} | {"WARNING": Level.WARN}
+
+
+class LevelOverrides:
+    """
+    Immutable set of level overrides. The most specific (longest)
+    pattern matching a logger name wins.
+    """
+
+    __slots__ = ("_patterns",)
+
+    def __init__(self, levels: Mapping[str, Level] | None = None):
+        items = (levels or {}).items()
+        self._patterns = tuple(sorted(items, key=lambda x: len(x[0]), reverse=True))
+
+    def level_for(self, name: str) -> Level | None:
+        """Return level of the most specific pattern matching the logger name, if any."""
+        for pattern, level in self._patterns:
+            if fnmatchcase(name, pattern):
+                return level
+        return None
+
+    def min_level(self) -> Level | None:
+        return min((x for _, x in self._patterns), default=None)
+
+    def as_dict(self) -> dict[str, Level]:
+        return dict(self._patterns)
+
+    def __bool__(self) -> bool:
+        return len(self._patterns) > 0
+
+
+def apply_levels(
+    overrides: LevelOverrides,
+    loggers: Iterable[tuple[str, Logger]],
+    base_levels: Mapping[str, Level],
+) -> None:
+    """
+    Set level of every logger to the override matching its name, or back
+    to the level it was created with. Each logger switches atomically
+    (see :meth:`easytelemetry.Logger._bind_level_methods`), so no lock
+    is needed and the logging path does not pay anything for it.
+    """
+    for name, lgr in list(loggers):
+        level = overrides.level_for(name) or base_levels.get(name)
+        if level is not None and level != lgr.level:
+            lgr.level = level
+
+
+def parse_levels(text: str) -> dict[str, Level]:
+    """
+    Parse level overrides from lines ``pattern = LEVEL``.
+
+    :raises ValueError: when a line or a level name is invalid
+    """
+    levels: dict[str, Level] = {}
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        pattern, sep, name = line.partition("=")
+        level = _LEVEL_NAMES.get(name.strip().upper())
+        if not sep or not pattern.strip() or level is None:
+            raise ValueError(f"invalid level override on line {lineno}: {line}")
+        levels[pattern.strip()] = level
+    return levels
+
+
+class LevelFileWatcher:
+    """
+    Watches a file with level overrides by polling its modification time.
+    A missing file means no overrides.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._mtime: int | None = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def poll(self) -> dict[str, Level] | None:
+        """
+        Return overrides when the file has changed since the last poll,
+        otherwise None.
+
+        :raises ValueError: when the file content is invalid
+        """
+        try:
+            mtime = Path(self._path).stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        if mtime == 0:
+            return {}
+        return parse_levels(Path(self._path).read_text(encoding="utf-8"))
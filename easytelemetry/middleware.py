@@ -0,0 +1,318 @@
+"""
+Module contains WSGI and ASGI middleware tracking every handled HTTP
+request as a single request telemetry item (duration, response code,
+route template). The request continues the operation of the caller
+(W3C ``traceparent`` header) and is the current operation while the
+application handles it, so everything logged within is correlated with it.
+
+Requests not passing sampling are handed over to the application directly,
+without any allocation. A caller's decision (the sampled flag of
+``traceparent``) takes precedence over the sample rate, so an operation
+is either tracked by all services or by none.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable, Iterable, Iterator, MutableMapping
+import contextlib
+from contextvars import ContextVar
+from datetime import UTC, datetime, timedelta
+import random
+import time
+from typing import Any
+
+from easytelemetry import OperationKind, OperationScope, Telemetry
+from easytelemetry.context import (
+    Operation,
+    end_operation,
+    is_traceparent_sampled,
+    parse_traceparent,
+    start_operation,
+)
+
+
+WsgiAppT = Callable[[dict[str, Any], Callable[..., Any]], Iterable[bytes]]
+AsgiScopeT = MutableMapping[str, Any]
+AsgiAppT = Callable[[AsgiScopeT, Callable[[], Awaitable[Any]], Callable[[Any], Awaitable[None]]], Awaitable[None]]
+RouteNameFuncT = Callable[[Any], str | None]
+
+
+def set_route_name(template: str) -> None:
+    """
+    Set route template (e.g. '/items/{id}') of the request handled
+    in the current context. Request name becomes 'METHOD template'
+    instead of 'METHOD path', which keeps the cardinality of names low.
+    """
+    req = _request.get()
+    if req is not None:
+        req.route = template
+        req.op.name = f"{req.method} {template}"
+        req.op.cache = None  # envelope tags include the name
+
+
+class _Request:
+    """Request being tracked by the middleware."""
+
+    __slots__ = ("method", "op", "path", "route", "source", "start", "start_time", "url")
+
+    def __init__(self, method: str, path: str, url: str, source: str | None, op: Operation):
+        self.method = method
+        self.path = path
+        self.url = url
+        self.source = source
+        self.op = op
+        self.route: str | None = None
+        self.start = time.perf_counter_ns()
+        self.start_time = datetime.now(UTC)
+
+
+_request: ContextVar[_Request | None] = ContextVar("easytelemetry_request", default=None)
+
+
+class _Middleware:
+    def __init__(
+        self,
+        telemetry: Telemetry,
+        sample_rate: float,
+        route_name: RouteNameFuncT | None,
+        exclude_paths: Iterable[str] | None,
+    ):
+        self._telemetry = telemetry
+        self._sample_rate = sample_rate
+        self._route_name = route_name
+        self._exclude_paths = frozenset(exclude_paths or ())
+
+    def _is_tracked(self, path: str, traceparent: str | None) -> bool:
+        if path in self._exclude_paths:
+            return False
+        if traceparent is not None:
+            sampled = is_traceparent_sampled(traceparent)
+            if sampled is not None:
+                return sampled
+        return self._sample_rate >= 1 or random.random() < self._sample_rate  # noqa: S311
+
+    def _begin(
+        self,
+        method: str,
+        path: str,
+        url: str,
+        source: str | None,
+        traceparent: str | None,
+    ) -> tuple[_Request, Callable[[], None]]:
+        """Make the request current; return it with a function restoring the previous context."""
+        ids = parse_traceparent(traceparent)
+        name = f"{method} {path}"
+        op, op_token = start_operation(name, *ids) if ids else start_operation(name)
+        req = _Request(method, path, url, source, op)
+        req_token = _request.set(req)
+
+        def restore() -> None:
+            _request.reset(req_token)
+            end_operation(op_token)
+
+        return req, restore
+
+    def _track(self, req: _Request, status: int | None, ex: BaseException | None, native: Any) -> None:
+        with contextlib.suppress(Exception):  # telemetry must not break the response
+            route = req.route
+            if route is None and self._route_name is not None:
+                route = self._route_name(native)
+            name = f"{req.method} {route or req.path}"
+            req.op.name = name
+            scope = OperationScope(self._telemetry, OperationKind.REQUEST, name)
+            scope.url = req.url
+            scope.source = req.source
+            scope.operation = req.op
+            scope.start_time = req.start_time
+            scope.duration = timedelta(microseconds=(time.perf_counter_ns() - req.start) / 1000)
+            if status is None:
+                status = 200 if ex is None else 500
+            scope.result_code = str(status)
+            scope.success = ex is None and status < 400
+            self._telemetry.track_operation(scope)
+
+
+class WsgiMiddleware(_Middleware):
+    """
+    WSGI middleware tracking requests.
+
+    :param app: WSGI application
+    :param telemetry: telemetry publishing the requests
+    :param sample_rate: fraction (0 - 1) of tracked requests
+    :param route_name: function returning route template for the WSGI
+        environment once the request is handled; alternatively the application
+        calls :func:`set_route_name`; the path is used when neither is available
+    :param exclude_paths: paths which are never tracked, e.g. health checks
+    """
+
+    def __init__(
+        self,
+        app: WsgiAppT,
+        telemetry: Telemetry,
+        sample_rate: float = 1.0,
+        route_name: RouteNameFuncT | None = None,
+        exclude_paths: Iterable[str] | None = None,
+    ):
+        super().__init__(telemetry, sample_rate, route_name, exclude_paths)
+        self._app = app
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable[..., Any]) -> Iterable[bytes]:
+        path = environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", "")
+        traceparent = environ.get("HTTP_TRACEPARENT")
+        if not self._is_tracked(path, traceparent):
+            return self._app(environ, start_response)
+
+        req, restore = self._begin(
+            environ.get("REQUEST_METHOD", "GET"),
+            path,
+            _wsgi_url(environ, path),
+            environ.get("REMOTE_ADDR"),
+            traceparent,
+        )
+        status: list[int] = []
+
+        def start_response_wrapper(status_line: str, headers: Any, exc_info: Any = None) -> Any:
+            status.append(int(status_line[:3]))
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            result = self._app(environ, start_response_wrapper)
+        except BaseException as e:
+            self._track(req, status[-1] if status else None, e, environ)
+            restore()
+            raise
+        # the request stays current while the server iterates the response and ends when it closes it
+        return _ClosingIterable(
+            result,
+            lambda ex: self._track(req, status[-1] if status else None, ex, environ),
+            restore,
+        )
+
+
+class _ClosingIterable:
+    """Response body calling back and restoring the context once the server has closed it."""
+
+    def __init__(
+        self,
+        result: Iterable[bytes],
+        on_close: Callable[[BaseException | None], None],
+        restore: Callable[[], None],
+    ):
+        self._result = result
+        self._on_close = on_close
+        self._restore: Callable[[], None] | None = restore
+        self._error: BaseException | None = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            yield from self._result
+        except BaseException as e:
+            self._error = e
+            raise
+
+    def close(self) -> None:
+        restore, self._restore = self._restore, None
+        if restore is None:
+            return  # closed already
+        try:
+            close = getattr(self._result, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._on_close(self._error)
+            with contextlib.suppress(ValueError):  # closed in another context than the request began
+                restore()
+
+
+class AsgiMiddleware(_Middleware):
+    """
+    ASGI middleware tracking HTTP requests. Route template is taken
+    from the ``route`` of ASGI scope (set by Starlette and FastAPI routers),
+    ``route_name`` function or :func:`set_route_name`.
+
+    :param app: ASGI application
+    :param telemetry: telemetry publishing the requests
+    :param sample_rate: fraction (0 - 1) of tracked requests
+    :param route_name: function returning route template for the ASGI scope
+        once the request is handled
+    :param exclude_paths: paths which are never tracked, e.g. health checks
+    """
+
+    def __init__(
+        self,
+        app: AsgiAppT,
+        telemetry: Telemetry,
+        sample_rate: float = 1.0,
+        route_name: RouteNameFuncT | None = None,
+        exclude_paths: Iterable[str] | None = None,
+    ):
+        super().__init__(telemetry, sample_rate, route_name or _asgi_route, exclude_paths)
+        self._app = app
+
+    async def __call__(
+        self,
+        scope: AsgiScopeT,
+        receive: Callable[[], Awaitable[Any]],
+        send: Callable[[Any], Awaitable[None]],
+    ) -> None:
+        if scope["type"] != "http":
+            return await self._app(scope, receive, send)
+        path = scope.get("root_path", "") + scope["path"]
+        traceparent = None
+        for key, value in scope.get("headers", ()):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        if not self._is_tracked(path, traceparent):
+            return await self._app(scope, receive, send)
+
+        client = scope.get("client")
+        req, restore = self._begin(
+            scope.get("method", "GET"),
+            path,
+            _asgi_url(scope, path),
+            client[0] if client else None,
+            traceparent,
+        )
+        status: list[int] = []
+
+        async def send_wrapper(message: Any) -> None:
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            await send(message)
+
+        ex: BaseException | None = None
+        try:
+            await self._app(scope, receive, send_wrapper)
+        except BaseException as e:
+            ex = e
+            raise
+        finally:
+            restore()
+            self._track(req, status[-1] if status else None, ex, scope)
+
+
+def _wsgi_url(environ: dict[str, Any], path: str) -> str:
+    host = environ.get("HTTP_HOST") or f"{environ.get('SERVER_NAME', '')}:{environ.get('SERVER_PORT', '')}"
+    query = environ.get("QUERY_STRING")
+    url = f"{environ.get('wsgi.url_scheme', 'http')}://{host}{path}"
+    return f"{url}?{query}" if query else url
+
+
+def _asgi_url(scope: AsgiScopeT, path: str) -> str:
+    host = None
+    for key, value in scope.get("headers", ()):
+        if key == b"host":
+            host = value.decode("latin-1")
+            break
+    if host is None:
+        server = scope.get("server")
+        host = f"{server[0]}:{server[1]}" if server else ""
+    query = scope.get("query_string", b"")
+    url = f"{scope.get('scheme', 'http')}://{host}{path}"
+    return f"{url}?{query.decode('latin-1')}" if query else url
+
+
+def _asgi_route(scope: AsgiScopeT) -> str | None:
+    route = scope.get("route")
+    return getattr(route, "path", None) if route is not None else None
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import stat
+import threading
+import time
+
+import pytest
+
+from easytelemetry.agent import Agent, AgentPublisher, FrameReader, frame
+from easytelemetry.appinsights import ConnectionString, Options, build
+
+
+pytestmark = pytest.mark.timeout(15)
+
+
+class _Ingestion(BaseHTTPRequestHandler):
+    received: list[dict] = []
+
+    def do_POST(self) -> None:  # noqa: N802
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        _Ingestion.received.extend(json.loads(body))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def ingestion():
+    _Ingestion.received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Ingestion)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{server.server_port}/v2/track"
+    server.shutdown()
+    server.server_close()
+
+
+def _options(endpoint: str) -> Options:
+    cs = ConnectionString("00000000-0000-0000-0000-000000000000", endpoint)
+    return Options(connection=cs, publish_interval_secs=60)
+
+
+def test_frame_reader_handles_partial_frames():
+    stream = frame(b"alpha") + frame(b"") + frame(b"gamma")
+    reader = FrameReader()
+    frames = []
+    for i in range(0, len(stream), 3):
+        frames.extend(reader.feed(stream[i : i + 3]))
+    assert frames == [b"alpha", b"", b"gamma"]
+
+
+def test_frame_reader_rejects_large_frames():
+    reader = FrameReader(max_frame_bytes=4)
+    with pytest.raises(ValueError, match="exceeds"):
+        reader.feed(frame(b"too long"))
+
+
+def test_agent_publishes_worker_envelopes(ingestion: str, tmp_path: Path):
+    options = _options(ingestion)
+    socket_path = str(tmp_path / "agent.sock")
+    agent = Agent(options, socket_path)
+    agent.start()
+    worker = build("tests", options=options, publisher=AgentPublisher(options, socket_path))
+    worker.root.info("hello from worker")
+    worker.metric("m1")(42)
+    worker.flush()
+
+    deadline = time.monotonic() + 5
+    while agent.received < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    report = agent.stop()
+    worker.shutdown()
+
+    assert report.sent == 2
+    assert len(_Ingestion.received) == 2
+    assert {x["data"]["baseType"] for x in _Ingestion.received} == {"MessageData", "MetricData"}
+    assert all(x["iKey"] == options.connection.instrumentation_key for x in _Ingestion.received)
+
+
+def test_agent_publisher_keeps_bounded_fallback(tmp_path: Path):
+    options = _options("http://127.0.0.1:9/v2/track")
+    pub = AgentPublisher(options, str(tmp_path / "missing.sock"), fallback_maxsize=3)
+    worker = build("tests", options=options, publisher=pub)
+    for i in range(5):
+        worker.root.info(f"message {i}")
+    success, _ = worker.flush()
+    assert success is False
+    assert pub.pending == 3
+    assert pub.dropped == 2
+
+
+def test_agent_replaces_instrumentation_key(ingestion: str):
+    options = _options(ingestion)
+    agent = Agent(options, socket_path=None)
+    foreign = {"name": "x", "iKey": "11111111-1111-1111-1111-111111111111", "data": {}}
+    agent.accept([json.dumps(foreign).encode(), b"not json"])
+    assert agent.dropped == 1
+    for f in agent.flush():
+        assert f.result().success
+    agent.stop()
+    assert [x["iKey"] for x in _Ingestion.received] == [options.connection.instrumentation_key]
+
+
+def test_agent_socket_is_private_and_not_taken_over(tmp_path: Path):
+    options = _options("http://127.0.0.1:9/v2/track")
+    socket_path = str(tmp_path / "run" / "agent.sock")
+    agent = Agent(options, socket_path)
+    agent.start()
+    try:
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        with pytest.raises(OSError, match="another agent"):
+            Agent(options, socket_path).start()
+    finally:
+        agent.stop(timeout_secs=0)
+
+
+def test_agent_refuses_shared_socket_directory(tmp_path: Path):
+    options = _options("http://127.0.0.1:9/v2/track")
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o755)
+    link = tmp_path / "link"
+    link.symlink_to(tmp_path)
+    for directory in (shared, link):
+        with pytest.raises(OSError, match="mode 0700"):
+            Agent(options, str(directory / "agent.sock")).start()
+    pub = AgentPublisher(options, str(shared / "agent.sock"))
+    worker = build("tests", options=options, publisher=pub)
+    worker.root.info("kept in fallback")
+    success, _ = worker.flush()
+    assert success is False
+    assert pub.pending == 1
+
+
+def test_agent_publisher_keeps_only_undelivered_envelopes(tmp_path: Path):
+    class Socket:
+        """Accepts the first frame and a part of the second one, then times out."""
+
+        limit: int | None = None
+
+        def settimeout(self, timeout: float) -> None:
+            pass
+
+        def send(self, data) -> int:
+            if self.limit is None:
+                self.limit = len(frame(b"")) + int.from_bytes(data[:4], "big") + 10
+            if self.limit <= 0:
+                raise TimeoutError("timed out")
+            n = min(len(data), self.limit)
+            self.limit -= n
+            return n
+
+        def close(self) -> None:
+            pass
+
+    options = _options("http://127.0.0.1:9/v2/track")
+    pub = AgentPublisher(options, str(tmp_path / "agent.sock"))
+    worker = build("tests", options=options, publisher=pub)
+    for i in range(3):
+        worker.root.info(f"message {i}")
+    pub._sock = Socket()
+    success, _ = worker.flush()
+    assert success is False
+    assert pub.pending == 2
@@ -1,8 +1,21 @@
+import concurrent.futures as cf
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+from pathlib import Path
+import signal
+import subprocess
+import sys
 import threading
 import time
+from types import SimpleNamespace
 from typing import Tuple
 
+import orjson
 import pytest
+import requests
 from utils import (
     contains_datapoint,
     contains_ikey,
@@ -14,7 +27,15 @@ from utils import (
     is_trace,
 )
 
-from easytelemetry.appinsights import AppInsightsTelemetry, MockPublisher
+from easytelemetry import ActivityMode, Level, StdLoggingHandler, lazy
+from easytelemetry.appinsights import (
+    AppInsightsTelemetry,
+    MockPublisher,
+    Options,
+    build,
+)
+from easytelemetry.appinsights.memory import CgroupMemory
+import easytelemetry.appinsights.protocol as p
 
 
 _evt = threading.Event()
@@ -70,6 +91,326 @@ def test_metrics(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
     _assert(pub)
 
 
+def test_disabled_levels_are_rebound(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    with ait:
+        lgr = ait.logger("quiet", Level.WARN)
+        lgr.debug("dropped %s", 1, key="value")
+        lgr.info("dropped")
+        lgr.warn("kept")
+        assert not lgr.is_enabled_for(Level.INFO)
+        assert lgr.is_enabled_for(Level.ERROR)
+        lgr.level = Level.DEBUG
+        lgr.debug("kept %s", 2)
+        assert lgr.is_enabled_for(Level.DEBUG)
+        lgr.level = Level.CRITICAL
+        lgr.error("dropped")
+        lgr.critical("kept")
+    assert [x.data.baseData.message for x in pub.data] == ["kept", "kept 2", "kept"]
+
+
+def test_bound_logger(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    with ait:
+        lgr = ait.logger("handler")
+        bound = lgr.bind(tenant="acme", user_id=7)
+        bound.info("first", user_id=8)
+        lgr.level = Level.WARN
+        bound.info("dropped")
+        try:
+            func_raise_error()
+        except ZeroDivisionError as e:
+            bound.exception(e, tenant="other")
+        lgr.info("dropped too")
+    assert pub.count() == 2
+    trace = next(x.data.baseData for x in pub.data if is_trace(x))
+    exception = next(x.data.baseData for x in pub.data if is_exception(x))
+    assert trace.properties["user_id"] == "8"
+    assert trace.properties["tenant"] == "acme"
+    assert trace.properties["logger"] == "handler"
+    assert exception.properties["tenant"] == "other"
+    _assert(pub)
+
+
+def test_bound_loggers_follow_concurrent_level_changes(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, _ = sut
+    lgr = ait.logger("handler")
+    children = []
+
+    def bind() -> None:
+        for i in range(300):
+            children.append(lgr.bind(n=i))
+
+    threads = [threading.Thread(target=bind) for _ in range(4)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often to hit the race
+    try:
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            lgr.level = Level.DEBUG
+            lgr.level = Level.ERROR
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(children) == 1200
+    assert all(x.level == Level.ERROR for x in children)
+
+
+def test_lazy_props(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    calls = []
+
+    def summary() -> str:
+        calls.append(1)
+        return "expensive"
+
+    def broken() -> str:
+        raise KeyError("missing")
+
+    with ait:
+        lgr = ait.logger("lazy", Level.INFO)
+        lgr.debug("dropped", summary=lazy(summary))
+        lgr.info("kept", summary=lazy(summary), broken=lazy(broken), kind=int)
+        ait.metric_extra("lazy_ms")(1, {"summary": lazy(summary)})
+        assert calls == []
+    props = [orjson.loads(p.serialize(x))["data"]["baseData"]["properties"] for x in pub.data]
+    assert [x["summary"] for x in props] == ["expensive", "expensive"]
+    assert props[0]["broken"] == "<KeyError: 'missing'>"
+    assert props[0]["kind"] == "<class 'int'>"  # only values marked as lazy are called
+    assert len(calls) == 2
+
+
+def test_std_logging_records(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    handler = StdLoggingHandler(ait)
+    std = logging.getLogger("tests.std")
+    std.addHandler(handler)
+    try:
+        with ait:
+            std.warning("order %s of %d%%", "NY9584", 5)
+            std.debug("dropped")
+            try:
+                func_raise_error()
+            except ZeroDivisionError:
+                std.exception("failed")
+    finally:
+        std.removeHandler(handler)
+    trace = pub.data[0] if is_trace(pub.data[0]) else pub.data[1]
+    assert trace.data.baseData.message == "order NY9584 of 5%"
+    assert trace.data.baseData.properties["logger"] == "tests.std"
+    assert trace.data.baseData.properties["func"] == "test_std_logging_records"
+    assert pub.count(lambda x: is_exception(x)) == 1
+    assert pub.count() == 2
+    _assert(pub)
+
+
+def test_std_logging_hand_off(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    handler = StdLoggingHandler(ait)
+    handler.configure_std_logging(queue_maxsize=100)
+    ait.register_std_logging_handler(handler)
+    std = logging.getLogger("tests.queued")
+    std.addHandler(handler._hand_off)
+    try:
+        with ait:
+            with ait.request("incoming") as req:
+                std.warning("queued %d", 1)
+    finally:
+        std.removeHandler(handler._hand_off)
+    trace = pub.data[0] if is_trace(pub.data[0]) else pub.data[1]
+    assert trace.data.baseData.message == "queued 1"
+    assert trace.tags[p.TagKey.OPERATION_PARENT_ID] == req.operation.id
+    assert handler.dropped == 0
+
+
+def test_bounded_registries(options: Options):
+    options.max_loggers = 4
+    ait = build("tests", options=options, publisher=MockPublisher())
+    hot = ait.logger("hot")
+    for i in range(10):
+        assert ait.logger("hot") is hot
+        ait.logger(f"lib.{i}")
+    assert "4 live (max 4), 8 evicted" in ait.describe()
+    assert ait.logger("hot") is hot
+    assert ait.logger("_root") is ait.root
+
+    module_level = ait.logger("module", Level.WARN)
+    for i in range(10):
+        ait.logger(f"other.{i}")
+    assert "module" not in ait._loggers.names()
+    ait.set_log_levels({"mod*": Level.DEBUG})
+    assert module_level.level == Level.DEBUG
+    ait.set_log_levels(None)
+    assert module_level.level == Level.WARN
+    assert ait.logger("module") is module_level
+
+    barrier = threading.Barrier(8)
+    created: list[object] = []
+
+    def create() -> None:
+        barrier.wait()
+        created.append(ait.metric_extra("shared"))
+
+    threads = [threading.Thread(target=create) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({x.__self__ for x in created}) == 1
+
+
+def test_metric_cardinality_is_limited(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    ait._options.metric_max_cardinality = 2
+    with ait:
+        m = ait.metric_extra("latency")
+        for user in ("a", "b", "c", "d"):
+            m(1, {"user": user})
+    metrics = [x for x in pub.data if is_metric(x)]
+    assert [x.data.baseData.properties["user"] for x in metrics] == ["a", "b", "__other__", "__other__"]
+    warnings = [x for x in pub.data if is_trace(x)]
+    assert len(warnings) == 1
+    assert contains_prop(warnings[0], "logger", "easytelemetry")
+    assert contains_prop(warnings[0], "metric", "latency")
+
+
+def test_gauges(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    ait._options.gauge_timeout_secs = 0.2
+    release = threading.Event()
+    calls = {"slow": 0}
+    depth = [3]
+
+    def slow() -> int:
+        calls["slow"] += 1
+        release.wait(5)
+        return 1
+
+    ait.gauge("queue_depth", lambda: depth[0])
+    ait.gauge("broken", lambda: 1 / 0)
+    ait.gauge("slow", slow)
+    ait.gauge("skipped", lambda: None)
+    ait.flush()
+    depth[0] = 5
+    ait.flush()
+    release.set()
+
+    points = [x.data.baseData.metrics[0] for x in pub.data if is_metric(x)]
+    assert [(x.name, x.value) for x in points] == [("queue_depth", 3), ("queue_depth", 5)]
+    assert points[0].kind == p.DataPointKind.AGGREGATION
+    assert calls["slow"] == 1
+    warnings = [x.data.baseData.message for x in pub.data if is_trace(x)]
+    assert sum("gauge broken failed" in x for x in warnings) == 1
+    assert sum("gauge slow did not return" in x for x in warnings) == 1
+    assert "gauges: queue_depth, broken, slow, skipped" in ait.describe()
+
+
+def test_hung_gauges_do_not_block_others_or_shutdown(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    ait._options.gauge_timeout_secs = 0.1
+    release = threading.Event()
+    for i in range(4):
+        ait.gauge(f"hung{i}", lambda: release.wait(10))
+    ait.gauge("queue_depth", lambda: 3)
+    ait.flush()  # queue_depth is stuck behind the hung callbacks
+    ait.flush()
+    ait._options.gauge_timeout_secs = 10
+    report = ait.shutdown(timeout_secs=0.5)
+    release.set()
+
+    assert report.elapsed_secs < 2
+    points = [x.data.baseData.metrics[0] for x in pub.data if is_metric(x)]
+    assert [(x.name, x.value) for x in points] == [("queue_depth", 3), ("queue_depth", 3)]
+    warnings = [x.data.baseData.message for x in pub.data if is_trace(x)]
+    assert sum("gauge workers are saturated" in x for x in warnings) == 1
+
+
+def test_pipeline_stats(options: Options):
+    options.debug = True
+    ait = build("tests", options=options, publisher=MockPublisher(batch_maxsize=2))
+    for i in range(3):
+        ait.root.info(f"message {i}")
+    assert ait.stats().queue_depth == 3
+    ait.flush()
+    stats = ait.stats()
+    assert stats.counters["enqueued"] > 3
+    assert stats.counters["sent"] == stats.counters["enqueued"]
+    assert stats.counters["batches"] >= 2
+    assert "stats: enqueued" in ait.describe()
+    published = [x for x in ait._publisher.data if is_metric(x)]
+    enqueued = [x for x in published if x.data.baseData.metrics[0].name == "enqueued"]
+    assert enqueued[0].data.baseData.metrics[0].value == 3
+    assert all(x.data.baseData.metrics[0].ns == "easytelemetry" for x in published)
+
+
+def test_buffer_byte_budget(options: Options, tmp_path: Path):
+    options.queue_max_bytes = 10_000
+    options.memory_pressure_threshold = 0.8
+    ait = build("tests", options=options, publisher=MockPublisher())
+    (tmp_path / "memory.current").write_text("100")
+    (tmp_path / "memory.max").write_text("1000")
+    ait._cgroup_memory = CgroupMemory(str(tmp_path), str(tmp_path / "missing"))
+    for i in range(100):
+        ait.root.info(f"message {i}")  # over the budget, messages are dropped without raising
+    enqueued = ait.stats().counters["enqueued"]
+    assert 5 < enqueued < 20
+    assert ait.stats().counters["dropped"] == 100 - enqueued
+    ait.flush()
+    assert ait._buffer.used_bytes() == 0
+
+    (tmp_path / "memory.current").write_text("900")
+    ait._check_memory_pressure()
+    assert ait._buffer.max_bytes == 5_000
+    assert "of 5000 bytes" in ait.describe()
+    (tmp_path / "memory.current").write_text("100")
+    ait._check_memory_pressure()
+    assert ait._buffer.max_bytes == 10_000
+    ait.flush()
+    messages = [x.data.baseData.message for x in ait._publisher.data if is_trace(x)]
+    assert any("container memory is near its limit" in x for x in messages)
+
+
+def test_buffer_checks_memory_pressure_as_it_grows(options: Options, tmp_path: Path):
+    options.queue_max_bytes = 100_000
+    options.queue_maxsize = 50
+    options.memory_pressure_threshold = 0.8
+    ait = build("tests", options=options, publisher=MockPublisher())
+    (tmp_path / "memory.current").write_text("100")
+    (tmp_path / "memory.max").write_text("1000")
+    ait._cgroup_memory = CgroupMemory(str(tmp_path), str(tmp_path / "missing"))
+    ait._check_memory_pressure()
+    (tmp_path / "memory.current").write_text("900")
+    for i in range(100):
+        ait.root.info(f"message {i}" * 50)  # over either limit, messages are dropped without raising
+    assert ait._buffer.max_bytes == 50_000  # shrunk by puts, before any interval
+    counters = ait.stats().counters
+    assert counters["enqueued"] + counters["dropped"] == 100 + 1  # and the diagnostic warning
+    assert ait._buffer.queue.qsize() + ait._buffer.priority.qsize() <= 50
+
+
+def test_memory_pressure_without_byte_budget(options: Options, tmp_path: Path):
+    options.memory_pressure_threshold = 0.8
+    ait = build("tests", options=options, publisher=MockPublisher())
+    (tmp_path / "memory.current").write_text("900000")
+    (tmp_path / "memory.max").write_text("1000000")
+    ait._cgroup_memory = CgroupMemory(str(tmp_path), str(tmp_path / "missing"))
+    flushes = []
+    ait._publishing = SimpleNamespace(flush_soon=lambda: flushes.append(1))  # type: ignore[assignment]
+    try:
+        ait._check_memory_pressure()
+        assert flushes == [1]
+        assert ait._buffer.max_bytes == 5_000  # 1% of the limit, halved by the pressure
+        ait._check_memory_pressure()
+        assert flushes == [1]  # only when the pressure starts
+        (tmp_path / "memory.current").write_text("100000")
+        ait._check_memory_pressure()
+        assert ait._buffer.max_bytes == 0
+    finally:
+        ait._publishing = None
+
+
 def test_activity_on_success(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
     ait, pub = sut
     with ait:
@@ -100,6 +441,42 @@ def test_activity_on_error(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
     _assert(pub)
 
 
+def test_activity_compact(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    with pytest.raises(ZeroDivisionError):
+        with ait:
+            with ait.activity("outer", ActivityMode.COMPACT) as outer:
+                with ait.activity("inner", ActivityMode.COMPACT):
+                    func_raise_error()
+    assert pub.count() == 2
+    req, dep = sorted(pub.data, key=lambda x: x.data.baseType, reverse=True)
+    assert dep.data.baseType == "RemoteDependencyData"
+    assert dep.data.baseData.type == "InProc"
+    assert dep.data.baseData.resultCode == "ZeroDivisionError"
+    assert not dep.data.baseData.success
+    assert req.data.baseType == "RequestData"
+    assert req.data.baseData.id == dep.tags[p.TagKey.OPERATION_PARENT_ID]
+    assert outer.activity_id is None
+    _assert(pub)
+
+
+def test_activity_aggregate(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    with ait:
+        for i in range(10):
+            with ait.activity("agg", ActivityMode.AGGREGATE):
+                time.sleep(0.001 * (i % 2))
+        assert pub.count() == 0
+    assert pub.count() == 1
+    point = pub.data[0].data.baseData.metrics[0]
+    assert point.name == "agg_ok_ms"
+    assert point.kind == p.DataPointKind.AGGREGATION
+    assert point.count == 10
+    assert point.min < 1 <= point.max
+    assert point.stdDev > 0
+    _assert(pub)
+
+
 @pytest.mark.slow
 @pytest.mark.timeout(65)
 def test_publishing_by_timer(sut: Tuple[AppInsightsTelemetry, MockPublisher]) -> None:
@@ -140,3 +517,298 @@ def _use_telemetry(t: AppInsightsTelemetry, name: str, tag: int) -> int:
     n += 1
 
     return n
+
+
+def test_shutdown_report(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    ait.start_publishing()
+    ait.root.info("info before shutdown")
+    ait.root.error("error before shutdown")
+    report = ait.shutdown()
+    assert report.sent == 2
+    assert report.spilled == 0
+    assert report.dropped == 0
+    assert pub.count() == 2
+    assert ait.shutdown() is report
+
+
+def test_shutdown_spills_errors_first(options: Options, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    def refuse(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("refused")
+
+    monkeypatch.setattr(p.requests, "post", refuse)
+    options.use_local_storage = True
+    options.local_storage_path = str(tmp_path)
+    options.batch_maxsize = 2
+    ait = build("tests", options=options)
+    ait.root.info("info 1")
+    ait.metric("m1")(1)
+    ait.root.critical("critical 1")
+    ait.root.error("error 1")
+    report = ait.shutdown(timeout_secs=2)
+    assert report.sent == 0
+    assert report.spilled == 4
+    assert report.dropped == 0
+    spilled = json.loads(next(tmp_path.glob("*.json")).read_bytes())
+    assert {x["data"]["baseData"].get("severityLevel") for x in spilled[:2]} == {3, 4}
+
+
+def test_shutdown_with_closed_executor_sends_on_calling_thread(options: Options, monkeypatch: pytest.MonkeyPatch):
+    posted = []
+
+    def post(url, headers, data, timeout):
+        posted.append(threading.current_thread())
+        return SimpleNamespace(status_code=200, content=b"")
+
+    monkeypatch.setattr(p.requests, "post", post)
+    executor = cf.ThreadPoolExecutor(max_workers=1)
+    ait = build("tests", options=options, executor=executor)
+    ait.root.info("info 1")
+    ait.root.error("error 1")
+    executor.shutdown()
+    report = ait.shutdown(timeout_secs=1)
+    assert report.sent == 2
+    assert report.dropped == 0
+    assert posted == [threading.current_thread()]
+
+
+def test_shutdown_counts_envelopes_of_a_stuck_flush_as_dropped(options: Options):
+    started = threading.Event()
+    release = threading.Event()
+
+    class StuckPublisher(MockPublisher):
+        def publish(self, source):
+            if not started.is_set():
+                started.set()
+                release.wait(5)
+            return super().publish(source)
+
+    options.publish_interval_secs = 0.01
+    pub = StuckPublisher()
+    ait = build("tests", options=options, publisher=pub)
+    ait.root.info("info 1")
+    ait.root.info("info 2")
+    ait.start_publishing()
+    assert started.wait(2)
+    ait.root.info("info 3")
+    try:
+        report = ait.shutdown(timeout_secs=0.2)
+    finally:
+        release.set()
+    assert report.sent == 1
+    assert report.dropped == 2
+
+
+_ATEXIT_SCRIPT = """
+import sys
+from easytelemetry.appinsights import ConnectionString, Options, build
+
+cs = ConnectionString("00000000-0000-0000-0000-000000000000", sys.argv[1])
+options = Options(connection=cs, use_atexit=True, publish_interval_secs=60)
+telemetry = build("tests", options=options)
+telemetry.start_publishing()
+for i in range(5):
+    telemetry.root.info(f"message {i}")
+"""
+
+
+def test_atexit_shutdown_sends_pending(tmp_path: Path):
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):  # noqa: N802
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            received.extend(orjson.loads(body))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        script = tmp_path / "script.py"
+        script.write_text(_ATEXIT_SCRIPT)
+        url = f"http://127.0.0.1:{server.server_address[1]}/v2/track"
+        env = {**os.environ, "PYTHONPATH": str(Path(__file__).parents[2])}
+        proc = subprocess.run([sys.executable, str(script), url], env=env, timeout=30, check=False)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert proc.returncode == 0
+    messages = sorted(x["data"]["baseData"]["message"] for x in received if x["data"]["baseType"] == "MessageData")
+    assert messages == [f"message {i}" for i in range(5)]
+
+
+def test_sigterm_drains_in_background_and_passes_signal_on(options: Options):
+    received = []
+    prev = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+    try:
+        options.handle_sigterm = True
+        pub = MockPublisher()
+        ait = build("tests", options=options, publisher=pub)
+        ait.start_publishing()
+        ait.root.info("info before sigterm")
+        os.kill(os.getpid(), signal.SIGTERM)
+        deadline = time.monotonic() + 5
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert received == [signal.SIGTERM]
+        assert pub.count() == 1
+        assert ait.shutdown().sent == 1
+    finally:
+        signal.signal(signal.SIGTERM, prev)
+
+
+def test_shutdown_restores_sigterm_handler(options: Options):
+    options.handle_sigterm = True
+    ait = build("tests", options=options, publisher=MockPublisher())
+    before = signal.getsignal(signal.SIGTERM)
+    ait.start_publishing()
+    assert signal.getsignal(signal.SIGTERM) != before
+    ait.shutdown()
+    assert signal.getsignal(signal.SIGTERM) == before
+
+
+def test_priority_lane_is_expedited(options: Options):
+    options.publish_interval_secs = 60
+    options.priority_delay_secs = 0.05
+    pub = MockPublisher()
+    ait = build("tests", options=options, publisher=pub)
+    with ait:
+        ait.root.info("info waits for the regular flush")
+        ait.root.error("error is expedited")
+        deadline = time.monotonic() + 2
+        while pub.count() == 0 and time.monotonic() < deadline:
+            _evt.wait(0.02)
+        assert pub.count() == 1
+        assert pub.has_all(lambda x: x.data.baseData.message == "error is expedited")
+    assert pub.count() == 2
+
+
+def test_priority_lane_rate_cap(options: Options):
+    options.publish_interval_secs = 60
+    options.priority_delay_secs = 0
+    options.priority_batch_maxsize = 2
+    options.priority_max_sends_per_sec = 1
+    pub = MockPublisher()
+    ait = build("tests", options=options, publisher=pub)
+    for i in range(10):
+        ait.root.error(f"error {i}")
+    ait._flush_priority()
+    ait._flush_priority()
+    assert pub.count() == 2
+    ait.flush()
+    assert pub.count() == 10
+
+
+def test_publishing_is_periodic(options: Options):
+    options.publish_interval_secs = 0.05
+    pub = MockPublisher()
+    ait = build("tests", options=options, publisher=pub)
+    with ait:
+        ait.root.info("first")
+        _evt.wait(0.2)
+        ait.root.info("second")
+        _evt.wait(0.2)
+        assert pub.count() == 2
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_child_gets_fresh_state(options: Options):
+    pub = MockPublisher()
+    ait = build("tests", options=options, publisher=pub)
+    ait.start_publishing()
+    ait.root.info("logged in parent")
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child
+        try:
+            ait.root.info("logged in child")
+            ait.flush()
+            ok = (
+                pub.count() == 1
+                and pub.first(lambda x: x.data.baseData.message == "logged in child")
+                and pub.first(lambda x: x.tags[p.TagKey.CLOUD_ROLE_INSTANCE].endswith(f":{os.getpid()}"))
+                and ait._publishing is not None
+                and ait._publishing.is_alive()
+            )
+            os.write(wfd, b"1" if ok else b"0")
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    child_ok = os.read(rfd, 1)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    ait.shutdown()
+    assert child_ok == b"1"
+    assert pub.count() == 1
+    assert pub.first(lambda x: x.data.baseData.message == "logged in parent")
+    assert pub.first(lambda x: ":" not in x.tags[p.TagKey.CLOUD_ROLE_INSTANCE])
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_child_does_not_inherit_held_metric_lock(options: Options):
+    options.metric_max_cardinality = 1
+    ait = build("tests", options=options, publisher=MockPublisher())
+    m = ait.metric_extra("latency")
+    metric = ait._metrics.get("latency")
+    assert metric is not None
+    with metric._guard_lock:  # as if another thread of the parent held it while forking
+        pid = os.fork()
+        if pid == 0:  # child
+            try:
+                m(1, {"user": "a"})
+                m(1, {"user": "b"})
+            finally:
+                os._exit(0)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def test_request_and_dependency_scopes(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    with ait:
+        with ait.request("GET /items/{id}", url="http://localhost/items/1") as req:
+            ait.root.info("inside request")
+            with ait.dependency("SELECT items", type="SQL", target="db"):
+                ait.metric("rows")(3)
+            req.result_code = "201"
+        ait.root.info("outside")
+
+    def first(base_type: str) -> p.Envelope:
+        return next(x for x in pub.data if x.data.baseType == base_type)
+
+    request = first("RequestData")
+    dependency = first("RemoteDependencyData")
+    trace = next(x for x in pub.data if is_trace(x) and x.data.baseData.message == "inside request")
+    metric = first("MetricData")
+    outside = next(x for x in pub.data if is_trace(x) and x.data.baseData.message == "outside")
+    op_id = request.tags[p.TagKey.OPERATION_ID]
+    assert request.data.baseData.responseCode == "201"
+    assert request.data.baseData.success
+    assert p.TagKey.OPERATION_PARENT_ID not in request.tags
+    assert trace.tags[p.TagKey.OPERATION_ID] == op_id
+    assert trace.tags[p.TagKey.OPERATION_PARENT_ID] == request.data.baseData.id
+    assert trace.tags[p.TagKey.OPERATION_NAME] == "GET /items/{id}"
+    assert dependency.tags[p.TagKey.OPERATION_PARENT_ID] == request.data.baseData.id
+    assert dependency.data.baseData.type == "SQL"
+    assert metric.tags[p.TagKey.OPERATION_PARENT_ID] == dependency.data.baseData.id
+    assert p.TagKey.OPERATION_ID not in outside.tags
+
+
+def test_failed_request_scope(sut: Tuple[AppInsightsTelemetry, MockPublisher]):
+    ait, pub = sut
+    with ait:
+        with pytest.raises(ZeroDivisionError), ait.request("job", operation_id="a" * 32, parent_id="b" * 16):
+            func_raise_error()
+    assert pub.count() == 1
+    request = pub.data[0]
+    assert not request.data.baseData.success
+    assert request.data.baseData.responseCode == "500"
+    assert request.tags[p.TagKey.OPERATION_ID] == "a" * 32
+    assert request.tags[p.TagKey.OPERATION_PARENT_ID] == "b" * 16
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from easytelemetry import lazy
+from easytelemetry.appinsights.cardinality import OTHER, CardinalityGuard, HyperLogLog
+
+
+def test_hyperloglog_estimate():
+    hll = HyperLogLog()
+    for i in range(10_000):
+        hll.add(hash(f"user-{i}"))
+        hll.add(hash(f"user-{i}"))
+    assert 9_000 < hll.count() < 11_000
+
+
+def test_guard_folds_combinations_over_limit():
+    guard = CardinalityGuard(limit=3)
+    for i in range(3):
+        assert guard.admit({"user": str(i)}) == {"user": str(i)}
+    assert guard.admit({"user": "0"}) == {"user": "0"}
+    assert guard.admit({"user": "3"}) == {"user": OTHER}
+    assert guard.folded == 1
+    assert guard.estimate() >= 4
+
+
+def test_guard_ignores_activity_id():
+    guard = CardinalityGuard(limit=1)
+    for i in range(10):
+        props = {"status": "ok", "activity_id": str(i)}
+        assert guard.admit(props) == props
+    assert guard.admit({"status": "err", "activity_id": "x"}) == {"status": OTHER, "activity_id": "x"}
+
+
+def test_guard_counts_lazy_values_by_name():
+    guard = CardinalityGuard(limit=1)
+    for i in range(10):
+        props = {"summary": lazy(lambda i=i: i)}
+        assert guard.admit(props) is props
+    assert guard.folded == 0
@@ -0,0 +1,121 @@
+import asyncio
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import contextlib
+
+from easytelemetry.context import (
+    ContextExecutor,
+    Operation,
+    current_operation,
+    end_operation,
+    run_in_executor,
+    start_operation,
+    wrap,
+)
+from easytelemetry.inmemory import InMemoryTelemetry, build
+
+
+@contextlib.contextmanager
+def started_operation() -> Iterator[Operation]:
+    op, token = start_operation("request")
+    try:
+        yield op
+    finally:
+        end_operation(token)
+
+
+def test_nested_operations():
+    assert current_operation() is None
+    root, root_token = start_operation("root")
+    child, child_token = start_operation()
+    assert current_operation() is child
+    assert child.operation_id == root.operation_id
+    assert child.parent_id == root.id
+    assert child.name == "root"
+    assert len(root.operation_id) == 32
+    assert len(child.id) == 16
+    end_operation(child_token)
+    assert current_operation() is root
+    end_operation(root_token)
+    assert current_operation() is None
+
+
+def test_inmemory_logs_are_correlated():
+    imt: InMemoryTelemetry = build("tests", setup_std_logging=False)
+    with imt.request("handle") as req:
+        imt.root.info("inside")
+        with imt.dependency("call", type="HTTP") as dep:
+            imt.root.info("deeper")
+    imt.root.info("outside")
+
+    inside, deeper, outside = imt.logs
+    assert inside.operation is req.operation
+    assert deeper.operation is dep.operation
+    assert dep.operation.parent_id == req.operation.id
+    assert outside.operation is None
+    assert [x.kind for x in imt.operations] == [dep.kind, req.kind]
+    assert all(x.success for x in imt.operations)
+
+
+def _operation_ids(_: int) -> tuple[str, str] | None:
+    op = current_operation()
+    return None if op is None else (op.operation_id, op.id)
+
+
+def test_thread_pool_fan_out():
+    imt: InMemoryTelemetry = build("tests", setup_std_logging=False)
+
+    def task(i: int) -> None:
+        with imt.dependency(f"task{i}"):
+            imt.root.info("in task %d", i)
+
+    with imt.request("fan-out") as req, ContextExecutor(ThreadPoolExecutor(max_workers=16)) as executor:
+        list(executor.map(task, range(500)))
+        executor.submit(task, 500).result()
+
+    req_op = req.operation
+    assert imt.log_count() == 501
+    assert len({x.operation.id for x in imt.logs}) == 501
+    assert imt.all_logs(lambda x: x.operation.operation_id == req_op.operation_id)
+    assert imt.all_logs(lambda x: x.operation.parent_id == req_op.id)
+    assert current_operation() is None
+
+
+def test_process_pool_gets_operation():
+    with started_operation() as op, ContextExecutor(ProcessPoolExecutor(max_workers=2)) as executor:
+        results = list(executor.map(_operation_ids, range(20)))
+        results.append(executor.submit(_operation_ids, 0).result())
+    assert results == [(op.operation_id, op.id)] * 21
+
+
+def test_asyncio_fan_out():
+    imt: InMemoryTelemetry = build("tests", setup_std_logging=False)
+
+    async def task(i: int) -> None:
+        with imt.dependency(f"task{i}"):
+            await asyncio.sleep(0)
+            imt.root.info("in task %d", i)
+            await run_in_executor(None, imt.root.info, "in executor")
+
+    async def main() -> None:
+        with imt.request("fan-out"):
+            await asyncio.gather(*(task(i) for i in range(200)))
+
+    asyncio.run(main())
+    req = imt.operations[-1].operation
+    deps = {x.operation.id: x.operation for x in imt.operations[:-1]}
+    assert imt.log_count() == 400
+    assert len(deps) == 200
+    assert imt.all_logs(lambda x: x.operation.id in deps)
+    assert all(x.parent_id == req.id for x in deps.values())
+
+
+def test_activity_is_current_operation():
+    imt: InMemoryTelemetry = build("tests", setup_std_logging=False)
+    with imt.activity("purchase") as act:
+        op = current_operation()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            executor.submit(wrap(act.logger.info), "from pool").result()
+    assert op is not None
+    assert imt.logs[0].operation is op
+    assert current_operation() is None
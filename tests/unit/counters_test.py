@@ -0,0 +1,201 @@
+import os
+from pathlib import Path
+
+import pytest
+from utils import is_metric
+
+from easytelemetry import LazyProp
+from easytelemetry.appinsights import MockPublisher, Options, build
+import easytelemetry.appinsights.protocol as p
+
+
+counters = pytest.importorskip("easytelemetry.appinsights.counters")
+
+
+def _point(e: p.Envelope) -> p.DataPoint:
+    return e.data.baseData.metrics[0]
+
+
+def test_collect_aggregates_increments(tmp_path: Path):
+    sc = counters.SharedCounters(str(tmp_path / "counters"), slots=4, series=8)
+    incr = sc.counter("requests", {"route": "/a"})
+    add = sc.adder("bytes", {})
+    for _ in range(5):
+        incr()
+    add(10)
+    add(2.5)
+
+    envelopes = sc.collect()
+    assert sc.is_leader
+    assert len(envelopes) == 2
+    points = {_point(e).name: _point(e) for e in envelopes}
+    assert points["requests"].kind == p.DataPointKind.AGGREGATION
+    assert points["requests"].count == 5
+    assert points["requests"].value == 5
+    assert points["bytes"].count == 2
+    assert points["bytes"].value == 12.5
+    assert sc.collect() == []  # nothing new since the last collection
+    sc.close()
+
+
+def test_only_leader_collects(tmp_path: Path):
+    path = str(tmp_path / "counters")
+    leader = counters.SharedCounters(path, slots=4, series=8)
+    follower = counters.SharedCounters(path)
+    assert leader.collect() == []
+    leader.counter("x", {})()
+    follower.counter("x", {})()
+    assert follower.collect() == []
+    assert not follower.is_leader
+    envelopes = leader.collect()
+    assert len(envelopes) == 1
+    assert _point(envelopes[0]).count == 2
+    follower.close()
+    leader.close()
+
+
+def test_counter_unavailable_when_series_table_full(tmp_path: Path):
+    path = str(tmp_path / "counters")
+    first = counters.SharedCounters(path, slots=1, series=1)
+    assert first.counter("a", {}) is not None
+    assert first.counter("b", {}) is None  # series table is full
+    first.close()
+
+
+def _in_child(func) -> int:
+    """Run the function in a forked process and return its exit code."""
+    pid = os.fork()
+    if pid == 0:  # child
+        code = 1
+        try:
+            code = func()
+        finally:
+            os._exit(code)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_counter_unavailable_when_slots_taken(tmp_path: Path):
+    path = str(tmp_path / "counters")
+    first = counters.SharedCounters(path, slots=1, series=4)
+
+    def child() -> int:
+        sc = counters.SharedCounters(path)
+        return 0 if not sc.has_slot and sc.counter("a", {}) is None else 1
+
+    assert _in_child(child) == 0
+    first.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_closed_follower_slot_is_released(tmp_path: Path):
+    path = str(tmp_path / "counters")
+    leader = counters.SharedCounters(path, slots=2, series=4)
+    leader.collect()
+    closed, done = os.pipe(), os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child stays alive after closing its counters
+        try:
+            sc = counters.SharedCounters(path)
+            add = sc.adder("x", {})
+            for _ in range(5):
+                add(1)
+            sc.close()
+            os.write(closed[1], b"1")
+            os.read(done[0], 1)
+        finally:
+            os._exit(0)
+    try:
+        os.read(closed[0], 1)
+        envelopes = leader.collect()
+        assert _point(envelopes[0]).count == 5
+
+        def child() -> int:
+            return 0 if counters.SharedCounters(path).has_slot else 1
+
+        assert _in_child(child) == 0
+    finally:
+        os.write(done[1], b"1")
+        os.waitpid(pid, 0)
+    leader.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_collect_never_sees_partial_updates(tmp_path: Path):
+    sc = counters.SharedCounters(str(tmp_path / "counters"), slots=2, series=4)
+    add = sc.adder("x", {})
+    sc.collect()
+    n = 20_000
+    pid = os.fork()
+    if pid == 0:  # child
+        try:
+            sc.after_fork()
+            for _ in range(n):
+                add(1)
+        finally:
+            os._exit(0)
+    count = 0
+    while True:
+        exited = os.waitpid(pid, os.WNOHANG)[0] != 0
+        for e in sc.collect():
+            point = _point(e)
+            assert point.count > 0
+            assert point.value == point.count  # every increment adds 1
+            count += point.count
+        if exited:
+            break
+    for e in sc.collect():
+        count += _point(e).count
+    assert count == n
+    sc.close()
+
+
+def test_lazy_props_are_resolved(tmp_path: Path):
+    sc = counters.SharedCounters(str(tmp_path / "counters"), slots=2, series=4)
+    sc.counter("x", {"user": LazyProp(lambda: "alice")})()
+    envelopes = sc.collect()
+    assert envelopes[0].data.baseData.properties == {"user": "alice"}
+    sc.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_increments_of_exited_processes_are_collected(tmp_path: Path):
+    sc = counters.SharedCounters(str(tmp_path / "counters"), slots=4, series=8)
+    incr = sc.counter("jobs", {"app": "tests"})
+    sc.collect()  # become the leader
+    pids = []
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:  # child
+            try:
+                sc.after_fork()
+                for _ in range(100):
+                    incr()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    incr()
+
+    envelopes = sc.collect()
+    assert len(envelopes) == 1
+    assert _point(envelopes[0]).count == 201
+    assert envelopes[0].data.baseData.properties == {"app": "tests"}
+    sc.close()
+
+
+def test_telemetry_publishes_aggregated_counter(options: Options, tmp_path: Path):
+    options.shared_counters_path = str(tmp_path / "counters")
+    pub = MockPublisher()
+    with build("tests", options=options, publisher=pub) as ait:
+        incr = ait.metric_incr("hits", {"page": "home"})
+        for _ in range(10):
+            incr()
+        assert "shared counters" in ait.describe()
+    assert pub.count() == 1
+    assert pub.has_all(lambda x: is_metric(x))
+    point = _point(pub.data[0])
+    assert point.kind == p.DataPointKind.AGGREGATION
+    assert point.count == 10
+    assert pub.data[0].data.baseData.properties["page"] == "home"
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from easytelemetry.appinsights import MockPublisher, Options, build
+from easytelemetry.appinsights.governor import OverheadGovernor, Stage
+import easytelemetry.appinsights.protocol as p
+
+
+def test_degrades_and_restores_in_steps():
+    transitions = []
+    gov = OverheadGovernor(0.02, window_secs=30, on_transition=lambda a, b, _: transitions.append((a, b)))
+    gov._window[0] = (0.0, 0)
+    now = 0.0
+    for _ in range(4):
+        now += 10
+        gov.spent(int(0.05 * 10e9))  # 5% of the interval
+        gov.evaluate(now)
+    assert gov.stage == Stage.NO_INFO
+    assert not gov.capture_caller
+    for _ in range(3):
+        now += 10
+        gov.spent(int(0.015 * 10e9))  # under the budget, but not well under
+        gov.evaluate(now)
+    assert gov.stage == Stage.NO_INFO
+    for _ in range(4):
+        now += 10
+        gov.evaluate(now)
+    assert gov.stage == Stage.NORMAL
+    assert gov.capture_caller
+    assert transitions == [
+        (Stage.NORMAL, Stage.NO_CALLER),
+        (Stage.NO_CALLER, Stage.SAMPLED),
+        (Stage.SAMPLED, Stage.NO_INFO),
+        (Stage.NO_INFO, Stage.SAMPLED),
+        (Stage.SAMPLED, Stage.NO_CALLER),
+        (Stage.NO_CALLER, Stage.NORMAL),
+    ]
+
+
+def test_admit_by_stage():
+    gov = OverheadGovernor(0.02, sample_every=4)
+    gov.stage = Stage.SAMPLED
+    kept = [gov.admit(p.SeverityLevel.INFORMATION) for _ in range(8)]
+    assert kept.count(True) == 2
+    assert gov.admit(p.SeverityLevel.WARNING)
+    gov.stage = Stage.NO_INFO
+    assert not gov.admit(p.SeverityLevel.VERBOSE)
+    assert gov.admit(p.SeverityLevel.ERROR)
+
+
+def test_telemetry_degrades_logging(options: Options):
+    options.overhead_budget = 1e-9
+    ait = build("tests", options=options, publisher=MockPublisher())
+    ait.root.info("with caller")
+    ait._on_interval()
+    ait.root.info("without caller")
+    ait.flush()
+    traces = {x.data.baseData.message: x.data.baseData.properties for x in ait._publisher.data}
+    assert "line" in traces["with caller"]
+    assert "line" not in traces["without caller"]
+    diagnostic = next(v for k, v in traces.items() if k.startswith("telemetry overhead"))
+    assert diagnostic["logger"] == "easytelemetry"
+    assert diagnostic["overhead_stage"] == "NO_CALLER"
+    assert "overhead: " in ait.describe()
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+import requests
+
+from easytelemetry.appinsights import protocol as p
+from easytelemetry.context import parse_traceparent, suppress_instrumentation
+from easytelemetry.inmemory import InMemoryTelemetry, build
+from easytelemetry.instrumentation import instrument_http, uninstrument_http
+
+
+pytestmark = pytest.mark.timeout(15)
+
+
+class _Service(BaseHTTPRequestHandler):
+    traceparents: list[str | None] = []
+
+    def do_GET(self) -> None:  # noqa: N802
+        _Service.traceparents.append(self.headers.get("traceparent"))
+        self.send_response(404 if self.path.startswith("/missing") else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:  # noqa: N802
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.do_GET()
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def service():
+    _Service.traceparents = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Service)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    yield server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def imt():
+    telemetry: InMemoryTelemetry = build("tests", setup_std_logging=False)
+    yield telemetry
+    uninstrument_http()
+
+
+def test_requests_call_is_tracked(service: int, imt: InMemoryTelemetry):
+    instrument_http(imt)
+    with imt.request("incoming") as req:
+        requests.get(f"http://127.0.0.1:{service}/items/1?q=2", timeout=5)
+
+    dep = imt.operations[0]
+    assert dep.name == "GET /items/1"
+    assert dep.type == "HTTP"
+    assert dep.target == f"127.0.0.1:{service}"
+    assert dep.result_code == "200"
+    assert dep.success
+    assert dep.operation.parent_id == req.operation.id
+    assert parse_traceparent(_Service.traceparents[0]) == (req.operation.operation_id, dep.operation.id)
+
+
+def test_http_client_call_is_tracked(service: int, imt: InMemoryTelemetry):
+    instrument_http(imt)
+    conn = http.client.HTTPConnection("127.0.0.1", service, timeout=5)
+    conn.request("GET", "/missing")
+    conn.getresponse().read()
+    conn.close()
+
+    assert len(imt.operations) == 1
+    dep = imt.operations[0]
+    assert dep.result_code == "404"
+    assert not dep.success
+    assert parse_traceparent(_Service.traceparents[0]) == (dep.operation.operation_id, dep.operation.id)
+
+
+def test_sampled_out_call_keeps_correlation(service: int, imt: InMemoryTelemetry):
+    instrument_http(imt, sample_rate=0)
+    with imt.request("incoming") as req:
+        requests.get(f"http://127.0.0.1:{service}/", timeout=5)
+
+    assert [x.name for x in imt.operations] == ["incoming"]
+    assert _Service.traceparents[0].endswith("-00")
+    assert parse_traceparent(_Service.traceparents[0]) == (req.operation.operation_id, req.operation.id)
+
+
+def test_excluded_and_suppressed_calls(service: int, imt: InMemoryTelemetry):
+    instrument_http(imt, exclude_hosts=["localhost"])
+    requests.get(f"http://localhost:{service}/", timeout=5)
+    with suppress_instrumentation():
+        requests.get(f"http://127.0.0.1:{service}/", timeout=5)
+    p.http_send(f"http://127.0.0.1:{service}/v2/track", b"[]", {}, 1)
+
+    assert imt.operations == []
+    assert _Service.traceparents == [None, None, None]
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+import signal
+import time
+from typing import Callable
+
+import pytest
+
+from easytelemetry import Level, StdLoggingHandler
+from easytelemetry.appinsights import ConnectionString, MockPublisher, Options, build
+from easytelemetry.inmemory import InMemoryTelemetry
+from easytelemetry.inmemory import build as build_inmemory
+from easytelemetry.levels import LevelFileWatcher, LevelOverrides, parse_levels
+
+
+def test_most_specific_pattern_wins():
+    overrides = LevelOverrides({"*": Level.WARN, "db.*": Level.DEBUG, "db.pool": Level.ERROR})
+    assert overrides.level_for("web") == Level.WARN
+    assert overrides.level_for("db.query") == Level.DEBUG
+    assert overrides.level_for("db.pool") == Level.ERROR
+    assert overrides.min_level() == Level.DEBUG
+    assert LevelOverrides().level_for("web") is None
+
+
+def test_parse_levels():
+    text = "# comment\n db.* = debug\n\n_root=WARNING # inline\n"
+    assert parse_levels(text) == {"db.*": Level.DEBUG, "_root": Level.WARN}
+    with pytest.raises(ValueError, match="line 1"):
+        parse_levels("db.* = LOUD")
+
+
+def test_overrides_apply_to_existing_and_new_loggers():
+    imt: InMemoryTelemetry = build_inmemory("tests", setup_std_logging=False)
+    query = imt.logger("db.query")
+    web = imt.logger("web", Level.WARN)
+
+    imt.set_log_levels({"db.*": Level.DEBUG, "web": Level.ERROR})
+    pool = imt.logger("db.pool")
+    query.debug("q1")
+    pool.debug("p1")
+    web.warn("w1")
+    assert imt.log_levels == {"db.*": Level.DEBUG, "web": Level.ERROR}
+
+    imt.set_log_levels(None)
+    query.debug("q2")
+    web.warn("w2")
+    assert [x.msg for x in imt.logs] == ["q1", "p1", "w2"]
+    assert web.level == Level.WARN
+
+
+def test_file_watcher(tmp_path: Path):
+    path = tmp_path / "levels"
+    watcher = LevelFileWatcher(str(path))
+    assert watcher.poll() == {}
+    assert watcher.poll() is None
+    path.write_text("* = DEBUG\n")
+    assert watcher.poll() == {"*": Level.DEBUG}
+    assert watcher.poll() is None
+    path.unlink()
+    assert watcher.poll() == {}
+
+
+def _wait_for(condition: Callable[[], bool], timeout_secs: float = 5) -> None:
+    deadline = time.monotonic() + timeout_secs
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_levels_from_file_and_signal(tmp_path: Path):
+    path = tmp_path / "levels"
+    path.write_text("worker = ERROR\n")
+    cs = ConnectionString(instrumentation_key="00000000-0000-0000-0000-000000000000")
+    options = Options(connection=cs, log_levels_path=str(path), log_levels_signal=signal.SIGUSR1)
+    ait = build("tests", options=options, publisher=MockPublisher())
+    handler = StdLoggingHandler(ait)
+    ait.register_std_logging_handler(handler)
+    worker = ait.logger("worker")
+    assert worker.level == Level.ERROR
+
+    path.write_text("worker = WARN\n")
+    os.utime(path, ns=(0, 1))
+    ait._poll_levels()
+    assert worker.level == Level.WARN
+
+    with ait:
+        os.kill(os.getpid(), signal.SIGUSR1)
+        _wait_for(lambda: handler.level == logging.DEBUG)  # the handler is updated last
+        assert worker.level == Level.DEBUG
+        assert ait.root.level == Level.DEBUG
+        os.kill(os.getpid(), signal.SIGUSR1)
+        _wait_for(lambda: handler.level == logging.INFO)
+        assert worker.level == Level.WARN
+        assert ait.root.level == Level.INFO
+    assert signal.getsignal(signal.SIGUSR1) == signal.SIG_DFL
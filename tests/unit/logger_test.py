@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from typing import Any
+
+from easytelemetry import Level, Logger, MetricFuncT, MetricFuncWithPropsT, PropsT, Telemetry
+
+
+class _ListLogger(Logger):
+    """Logger implementing only what is abstract, keeping entries in a list."""
+
+    def __init__(self, name: str, level: Level):
+        self._name = name
+        self._level = level
+        self.entries: list[tuple[Level, str, dict[str, Any]]] = []
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @Logger.level.getter
+    def level(self) -> Level:  # keeps the default setter
+        return self._level
+
+    def _log(self, level: Level, msg: str, kwargs: dict[str, Any]) -> None:
+        if self.is_enabled_for(level):
+            self.entries.append((level, msg, kwargs))
+
+    def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self._log(Level.DEBUG, msg, kwargs)
+
+    def info(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self._log(Level.INFO, msg, kwargs)
+
+    def warn(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self._log(Level.WARN, msg, kwargs)
+
+    def error(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self._log(Level.ERROR, msg, kwargs)
+
+    def critical(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self._log(Level.CRITICAL, msg, kwargs)
+
+    def exception(self, ex: BaseException, level: Level = Level.ERROR, **kwargs: Any) -> None:
+        self._log(level, str(ex), kwargs)
+
+
+class _RootOnlyTelemetry(Telemetry):
+    """Telemetry implementing only what is abstract, with just the root logger."""
+
+    def __init__(self) -> None:
+        self._root = _ListLogger("_root", Level.INFO)
+
+    @property
+    def root(self) -> Logger:
+        return self._root
+
+    @property
+    def name(self) -> str:
+        return "tests"
+
+    @property
+    def min_level(self) -> Level:
+        return Level.INFO
+
+    def logger(self, name: str, level: Level = Level.INFO, props: PropsT | None = None) -> Logger:
+        return self._root
+
+    def metric(self, name: str, props: PropsT | None = None) -> MetricFuncT:
+        return lambda value: None
+
+    def metric_extra(self, name: str, props: PropsT | None = None) -> MetricFuncWithPropsT:
+        return lambda value, extra: None
+
+    def describe(self) -> str:
+        return "root only"
+
+
+def test_default_level_setter_rebinds_level_methods():
+    lgr = _ListLogger("worker", Level.INFO)
+    lgr.level = Level.ERROR
+    lgr.info("dropped")
+    lgr.error("kept")
+    lgr.level = Level.DEBUG
+    lgr.debug("kept too")
+    assert [x[1] for x in lgr.entries] == ["kept", "kept too"]
+
+
+def test_default_bind_merges_props_and_follows_parent():
+    lgr = _ListLogger("worker", Level.INFO)
+    bound = lgr.bind(tenant="acme", user_id=7)
+    nested = bound.bind(user_id=8)
+    bound.info("first", request="r1")
+    nested.info("second")
+    lgr.level = Level.WARN
+    bound.info("dropped")
+    nested.warn("third", tenant="other")
+    bound.level = Level.CRITICAL
+    bound.error("dropped too")
+    nested.error("fourth")
+    assert bound.name == "worker"
+    assert [(x[1], x[2]) for x in lgr.entries] == [
+        ("first", {"tenant": "acme", "user_id": 7, "request": "r1"}),
+        ("second", {"tenant": "acme", "user_id": 8}),
+        ("third", {"tenant": "other", "user_id": 8}),
+        ("fourth", {"tenant": "acme", "user_id": 8}),
+    ]
+
+
+def test_default_set_log_levels_applies_to_root():
+    telemetry = _RootOnlyTelemetry()
+    assert telemetry.log_levels == {}
+    telemetry.set_log_levels({"_ro*": Level.ERROR, "db.*": Level.DEBUG})
+    assert telemetry.log_levels == {"_ro*": Level.ERROR, "db.*": Level.DEBUG}
+    assert telemetry.root.level == Level.ERROR
+    telemetry.set_log_levels({"db.*": Level.DEBUG})
+    assert telemetry.root.level == Level.INFO
+    telemetry.set_log_levels(None)
+    assert telemetry.log_levels == {}
+
+
+def test_default_gauge_is_ignored():
+    calls = []
+    _RootOnlyTelemetry().gauge("depth", lambda: calls.append(1) or 1)
+    assert calls == []
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from easytelemetry.appinsights.memory import CgroupMemory
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_cgroup_v2_nested(tmp_path: Path):
+    _write(tmp_path / "proc", "0::/app.slice/service\n")
+    _write(tmp_path / "cg/app.slice/service/memory.current", "750\n")
+    _write(tmp_path / "cg/app.slice/service/memory.max", "1000\n")
+    memory = CgroupMemory(str(tmp_path / "cg"), str(tmp_path / "proc"))
+    assert memory.usage_ratio() == 0.75
+
+    _write(tmp_path / "cg/app.slice/service/memory.max", "max\n")
+    assert memory.usage_ratio() is None
+
+
+def test_cgroup_v1(tmp_path: Path):
+    _write(tmp_path / "cg/memory/memory.usage_in_bytes", "300")
+    _write(tmp_path / "cg/memory/memory.limit_in_bytes", "1200")
+    memory = CgroupMemory(str(tmp_path / "cg"), str(tmp_path / "missing"))
+    assert memory.usage_ratio() == 0.25
+
+    _write(tmp_path / "cg/memory/memory.limit_in_bytes", str(1 << 63))
+    assert memory.usage_ratio() is None
+
+
+def test_no_cgroup(tmp_path: Path):
+    memory = CgroupMemory(str(tmp_path), str(tmp_path / "missing"))
+    assert not memory.available
+    assert memory.usage_ratio() is None
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from easytelemetry.context import current_operation
+from easytelemetry.inmemory import InMemoryTelemetry, build
+from easytelemetry.middleware import AsgiMiddleware, WsgiMiddleware, set_route_name
+
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+@pytest.fixture
+def imt() -> InMemoryTelemetry:
+    return build("tests", setup_std_logging=False)
+
+
+def _wsgi_call(app, path: str, **environ) -> tuple[str, bytes]:
+    env = {"PATH_INFO": path, **environ}
+    setup_testing_defaults(env)
+    status: list[str] = []
+    result = app(env, lambda s, h, e=None: status.append(s))
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return status[0], body
+
+
+def test_wsgi_request(imt: InMemoryTelemetry):
+    def app(environ, start_response):
+        set_route_name("/items/{id}")
+        imt.root.info("handling")
+        start_response("201 Created", [])
+        return [b"ok"]
+
+    mw = WsgiMiddleware(app, imt)
+    status, body = _wsgi_call(mw, "/items/7", HTTP_TRACEPARENT=TRACEPARENT, QUERY_STRING="a=1")
+
+    assert (status, body) == ("201 Created", b"ok")
+    assert len(imt.operations) == 1
+    req = imt.operations[0]
+    assert req.name == "GET /items/{id}"
+    assert req.result_code == "201"
+    assert req.success
+    assert req.url.endswith("/items/7?a=1")
+    assert req.operation.operation_id == "0af7651916cd43dd8448eb211c80319c"
+    assert req.operation.parent_id == "b7ad6b7169203331"
+    assert imt.logs[0].operation is req.operation
+    assert current_operation() is None
+
+
+def test_wsgi_request_is_current_while_streaming(imt: InMemoryTelemetry):
+    def app(environ, start_response):
+        start_response("200 OK", [])
+        for chunk in (b"a", b"b"):
+            imt.root.info("streaming")
+            yield chunk
+
+    _, body = _wsgi_call(WsgiMiddleware(app, imt), "/stream")
+
+    assert body == b"ab"
+    req = imt.operations[0]
+    assert [x.operation for x in imt.logs] == [req.operation, req.operation]
+    assert current_operation() is None
+
+
+def test_wsgi_failing_app(imt: InMemoryTelemetry):
+    def app(environ, start_response):
+        raise ZeroDivisionError
+
+    with pytest.raises(ZeroDivisionError):
+        _wsgi_call(WsgiMiddleware(app, imt), "/fail")
+    assert imt.operations[0].result_code == "500"
+    assert not imt.operations[0].success
+
+
+def test_wsgi_sampled_out_and_excluded(imt: InMemoryTelemetry):
+    def app(environ, start_response):
+        start_response("200 OK", [])
+        return [b""]
+
+    _wsgi_call(WsgiMiddleware(app, imt, sample_rate=0), "/a")
+    _wsgi_call(WsgiMiddleware(app, imt, exclude_paths=["/health"]), "/health")
+    _wsgi_call(WsgiMiddleware(app, imt), "/b", HTTP_TRACEPARENT=TRACEPARENT[:-2] + "00")
+    assert imt.operations == []
+    _wsgi_call(WsgiMiddleware(app, imt, sample_rate=0), "/c", HTTP_TRACEPARENT=TRACEPARENT)
+    assert [x.name for x in imt.operations] == ["GET /c"]
+
+
+def test_asgi_request(imt: InMemoryTelemetry):
+    class Route:
+        path = "/users/{name}"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route()
+        imt.root.info("handling")
+        await send({"type": "http.response.start", "status": 404, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/users/jan",
+        "scheme": "https",
+        "query_string": b"",
+        "headers": [(b"host", b"example.com"), (b"traceparent", TRACEPARENT.encode())],
+        "client": ("10.0.0.1", 5000),
+    }
+    asyncio.run(AsgiMiddleware(app, imt)(scope, receive, send))
+
+    assert len(sent) == 2
+    req = imt.operations[0]
+    assert req.name == "POST /users/{name}"
+    assert req.url == "https://example.com/users/jan"
+    assert req.source == "10.0.0.1"
+    assert req.result_code == "404"
+    assert not req.success
+    assert req.operation.parent_id == "b7ad6b7169203331"
+    assert imt.logs[0].operation is req.operation
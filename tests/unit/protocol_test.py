@@ -1,4 +1,5 @@
 from datetime import timedelta
+import gzip
 import json
 import time
 import uuid
@@ -41,6 +42,153 @@ def test_serialize_trace():
     assert p.Envelope.TRACE_NAME in js
 
 
+def test_send_batch_reports_sizes(monkeypatch: pytest.MonkeyPatch):
+    class Response:
+        status_code = 200
+        content = b""
+
+    bodies = []
+
+    def post(url, headers, data, timeout):
+        bodies.append(data)
+        return Response()
+
+    monkeypatch.setattr(p.requests, "post", post)
+    batch = []
+    for i in range(50):
+        envelope = p.MessageData(message=f"message {i}", severityLevel=p.SeverityLevel.INFORMATION).to_envelope()
+        enrich_envelope(envelope)
+        batch.append(envelope)
+    result = p.send_batch(batch, "http://localhost")
+    assert result.success
+    assert result.count == 50
+    assert result.wire_bytes == len(bodies[0]) < result.body_bytes
+    assert result.serialize_ms > 0
+
+
+def test_encode_batch():
+    batch = []
+    for i in range(50):
+        envelope = p.MessageData(message=f"message {i}", severityLevel=p.SeverityLevel.INFORMATION).to_envelope()
+        enrich_envelope(envelope)
+        batch.append(envelope)
+    expected = p.serialize(batch)
+
+    body, size, gzipped = p.encode_batch(batch)
+    assert gzipped
+    assert size == len(expected)
+    assert gzip.decompress(body) == expected
+
+    for threshold in (-1, len(expected)):
+        assert p.encode_batch(batch, threshold) == (expected, len(expected), False)
+    # only the closing bracket crosses the threshold
+    body, _, gzipped = p.encode_batch(batch, len(expected) - 1)
+    assert gzipped
+    assert gzip.decompress(body) == expected
+    assert p.encode_batch([]) == (b"[]", 2, False)
+
+
+def test_encode_batch_ndjson():
+    batch = []
+    for i in range(3):
+        envelope = p.MessageData(message=f"message {i}", severityLevel=p.SeverityLevel.INFORMATION).to_envelope()
+        enrich_envelope(envelope)
+        batch.append(envelope)
+    body, size, gzipped = p.encode_batch(batch, -1, ndjson=True)
+    assert not gzipped
+    assert size == len(body)
+    assert [json.loads(x) for x in body.split(b"\n")] == [json.loads(x.to_json()) for x in batch]
+
+    # bytes are kept by the envelopes and reused, also for JSON arrays
+    encoded = batch[0].encoded
+    assert encoded is not None
+    assert p.encode_batch(batch, -1, ndjson=True)[0] == body
+    assert batch[0].encoded is encoded
+    assert p.encode_batch(batch, -1)[0] == p.serialize(batch)
+    assert b"_encoded" not in p.serialize(batch)
+
+
+def test_send_batch_ndjson_resends_rejected_items(monkeypatch: pytest.MonkeyPatch):
+    class Response:
+        def __init__(self, status_code: int, content: bytes):
+            self.status_code = status_code
+            self.content = content
+
+    partial = {
+        "itemsReceived": 5,
+        "itemsAccepted": 3,
+        "errors": [
+            {"index": 1, "statusCode": 429, "message": "Throttled"},
+            {"index": 3, "statusCode": 503, "message": "Unavailable"},
+        ],
+    }
+    responses = [Response(206, json.dumps(partial).encode()), Response(200, b"")]
+    requests = []
+
+    def post(url, headers, data, timeout):
+        requests.append((headers, data))
+        return responses.pop(0)
+
+    monkeypatch.setattr(p.requests, "post", post)
+    batch = [p.MetricData.create(name=f"m{i}", value=i).to_envelope() for i in range(5)]
+    result = p.send_batch(batch, "http://localhost", delay_between_attempts_secs=0.001, ndjson=True)
+    assert result.success
+    assert result.attempt == 2
+    assert result.count == 5
+    assert requests[0][0]["Content-Type"] == p.NDJSON_CONTENT_TYPE
+    assert requests[1][1] == batch[1].encoded + b"\n" + batch[3].encoded
+
+
+def test_send_batch_reports_unsent_items_of_partial_success(monkeypatch: pytest.MonkeyPatch):
+    class Response:
+        def __init__(self, status_code: int, content: bytes):
+            self.status_code = status_code
+            self.content = content
+
+    retryable = {"index": 1, "statusCode": 429, "message": "Throttled"}
+    invalid = {"index": 2, "statusCode": 400, "message": "Invalid"}
+    responses = []
+    monkeypatch.setattr(p.requests, "post", lambda url, headers, data, timeout: responses.pop(0))
+    batch = [p.MetricData.create(name=f"m{i}", value=i).to_envelope() for i in range(4)]
+
+    # rejected items which are not retryable are not sent again
+    responses.append(
+        Response(206, json.dumps({"itemsReceived": 4, "itemsAccepted": 2, "errors": [retryable, invalid]}).encode())
+    )
+    result = p.send_batch(batch, "http://localhost", delay_between_attempts_secs=0.001, ndjson=True)
+    assert not result.success
+    assert result.attempt == 1
+    assert (result.count, result.accepted) == (4, 2)
+    assert result.unsent == [batch[1], batch[2]]
+
+    # a failed resend leaves the items accepted by the first attempt delivered
+    responses.extend(
+        [
+            Response(206, json.dumps({"itemsReceived": 4, "itemsAccepted": 3, "errors": [retryable]}).encode()),
+            Response(400, b""),
+        ]
+    )
+    result = p.send_batch(batch, "http://localhost", delay_between_attempts_secs=0.001, ndjson=True)
+    assert not result.success
+    assert result.attempt == 2
+    assert (result.count, result.accepted) == (4, 3)
+    assert result.unsent == [batch[1]]
+
+
+def test_estimate_size():
+    metric = p.MetricData.create(name="m", value=1, properties={"a": "1"}).to_envelope()
+    try:
+        func_raise_error()
+    except Exception as e:
+        exception = p.ExceptionData.create(e, properties={"a": "1"}).to_envelope()
+    for envelope in (metric, exception):
+        enrich_envelope(envelope)
+        estimate = p.estimate_size(envelope)
+        actual = len(p.serialize(envelope))
+        assert actual / 2 < estimate < actual * 2
+    assert p.estimate_size(exception) > p.estimate_size(metric)
+
+
 def test_serialize_metric():
     envelope = p.MetricData.create(
         name="update_user_ms",
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+
+import pytest
+
+from easytelemetry.agent import Agent, AgentPublisher
+from easytelemetry.agent import ring as r
+from easytelemetry.agent.ring import RingDrainer, RingPublisher, SharedRings
+from easytelemetry.appinsights import ConnectionString, Options, build
+
+
+pytestmark = pytest.mark.timeout(15)
+
+
+@pytest.fixture
+def rings():
+    r = SharedRings.create(producers=2, capacity=64)
+    yield r
+    r.close()
+
+
+def test_write_and_read_with_wrap_around(rings: SharedRings):
+    ring = rings.ring(0)
+    expected = []
+    actual = []
+    for i in range(50):
+        payload = f"record-{i:02}".encode() * (1 + i % 3)
+        assert ring.write(payload)
+        expected.append(payload)
+        actual.extend(ring.read())
+    assert actual == expected
+    assert rings.stats()[0].written == 50
+    assert rings.stats()[0].pending_bytes == 0
+
+
+def test_full_ring_drops_and_counts(rings: SharedRings):
+    ring = rings.ring(1)
+    results = [ring.write(b"x" * 20) for _ in range(4)]
+    assert results == [True, True, False, False]
+    assert not ring.write(b"x" * 100)
+    stats = rings.stats()[1]
+    assert stats.written == 2
+    assert stats.dropped == 2
+    assert stats.oversized == 1
+    assert ring.read() == [b"x" * 20, b"x" * 20]
+    assert ring.write(b"x" * 20)
+
+
+def test_record_wrapping_around_fits_into_empty_ring(rings: SharedRings):
+    ring = rings.ring(0)
+    assert ring.write(b"a" * 38)
+    assert ring.read() == [b"a" * 38]
+    for size in (60, 16, 30, 59):  # wrapping within the payload and within the size prefix
+        payload = bytes(range(size))
+        assert ring.write(payload)
+        assert ring.read() == [payload]
+    assert rings.stats()[0].dropped == 0
+
+
+@pytest.mark.parametrize("capacity", [0, 60, 100])
+def test_capacity_must_keep_rings_aligned(capacity: int):
+    with pytest.raises(ValueError, match="multiple of 8"):
+        SharedRings.create(producers=2, capacity=capacity)
+
+
+def test_rings_fall_back_to_socket_off_x86_64(rings: SharedRings, monkeypatch: pytest.MonkeyPatch):
+    publisher = r.create_publisher(_options(), rings.name, 0)
+    assert isinstance(publisher, RingPublisher)
+    publisher.close()
+    monkeypatch.setattr(r.platform, "machine", lambda: "aarch64")
+    assert not r.is_supported()
+    with pytest.raises(OSError, match="x86-64"):
+        SharedRings.create(producers=1, capacity=64)
+    with pytest.raises(OSError, match="x86-64"):
+        SharedRings.attach(rings.name)
+    publisher = r.create_publisher(_options(), rings.name, 0, socket_path="/nonexistent.sock")
+    assert isinstance(publisher, AgentPublisher)
+
+
+def _options() -> Options:
+    cs = ConnectionString("00000000-0000-0000-0000-000000000000", "http://127.0.0.1:9/v2/track")
+    return Options(connection=cs, publish_interval_secs=60)
+
+
+def _produce(rings_name: str, index: int, count: int) -> None:
+    options = _options()
+    telemetry = build("tests", options=options, publisher=RingPublisher(options, rings_name, index))
+    for i in range(count):
+        telemetry.root.info(f"message {i} from producer {index}")
+        if i % 10 == 0:
+            telemetry.flush()
+    telemetry.flush()
+    telemetry._publisher.close()
+
+
+@pytest.mark.skipif("fork" not in mp.get_all_start_methods(), reason="requires fork")
+def test_producers_in_other_processes():
+    rings = SharedRings.create(producers=2, capacity=64 * 1024)
+    try:
+        ctx = mp.get_context("fork")
+        procs = [ctx.Process(target=_produce, args=(rings.name, i, 30)) for i in range(2)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        agent = Agent(_options(), socket_path=None)
+        drainer = RingDrainer(rings, agent)
+        drainer.stop()
+        assert agent.received == 60
+        assert sum(s.dropped for s in rings.stats()) == 0
+    finally:
+        rings.close()
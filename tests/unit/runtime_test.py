@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import time
+
+from utils import contains_prop_keys, is_metric
+
+from easytelemetry.appinsights import MockPublisher, Options, build
+import easytelemetry.appinsights.protocol as p
+from easytelemetry.appinsights.runtime import RuntimeMetrics
+
+
+def _points(envelopes: list[p.Envelope]) -> dict[str, p.DataPoint]:
+    return {e.data.baseData.metrics[0].name: e.data.baseData.metrics[0] for e in envelopes}
+
+
+def test_collect_process_and_gc_metrics():
+    collector = RuntimeMetrics({"app": "tests"})
+    try:
+        collector.collect()
+        sum(range(100_000))
+        gc.collect()
+        gc.collect()
+        points = _points(collector.collect())
+    finally:
+        collector.close()
+    assert {"process_cpu_ms", "process_threads", "gc_collections"} <= points.keys()
+    assert points["gc_collections"].value >= 2
+    assert points["gc_pause_ms"].count == points["gc_collections"].value
+    assert points["process_threads"].value >= 1
+    assert collector._on_gc not in gc.callbacks
+
+
+def test_event_loop_lag():
+    collector = RuntimeMetrics({})
+
+    async def main() -> dict[str, p.DataPoint]:
+        collector.watch_event_loop()
+        assert "event_loop_lag_ms" not in _points(collector.collect())
+        time.sleep(0.05)  # blocks the loop with the probe scheduled
+        await asyncio.sleep(0)
+        return _points(collector.collect())
+
+    try:
+        points = asyncio.run(main())
+    finally:
+        collector.close()
+    assert points["event_loop_lag_ms"].value >= 50
+
+
+def test_published_with_global_props(options: Options):
+    options.runtime_metrics = True
+    ait = build("tests", options=options, publisher=MockPublisher())
+    ait.flush()
+    envelopes = ait._publisher.data
+    assert _points(envelopes).keys() >= {"process_cpu_ms", "gc_collections"}
+    assert all(is_metric(x) and contains_prop_keys(x, "app", "env") for x in envelopes)
+    assert "runtime metrics: " in ait.describe()
+    ait.shutdown()
+    assert ait.runtime_metrics is not None
+    assert ait.runtime_metrics._on_gc not in gc.callbacks
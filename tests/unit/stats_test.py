@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import threading
+
+from easytelemetry.appinsights.stats import Counter, Histogram, PipelineStats
+
+
+def test_shards_are_merged_on_read():
+    stats = PipelineStats()
+
+    def work() -> None:
+        for _ in range(1000):
+            stats.incr(Counter.ENQUEUED)
+        stats.observe(Histogram.HTTP_MS, 3)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats.incr(Counter.DROPPED)  # folds shards of the finished threads
+    snapshot = stats.snapshot(queue_depth=5)
+    assert snapshot.counters["enqueued"] == 8000
+    assert snapshot.counters["dropped"] == 1
+    assert snapshot.histograms["http_ms"].count == 8
+    assert snapshot.queue_depth == 5
+    assert len(stats._shards) == 1
+
+
+def test_histogram_percentiles():
+    stats = PipelineStats()
+    for value in (0.05, 0.3, 0.3, 7, 400):
+        stats.observe(Histogram.SERIALIZE_MS, value)
+    h = stats.snapshot().histograms["serialize_ms"]
+    assert h.count == 5
+    assert h.max == 400
+    assert h.percentile(50) == 0.5
+    assert h.percentile(100) == 400
+    assert stats.snapshot().histograms["http_ms"].percentile(99) == 0.0